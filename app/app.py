@@ -1,22 +1,43 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, render_template, request, jsonify, send_from_directory, send_file
 from datetime import datetime
 import sqlite3
 import os
 import re
 import json
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageOps
+from werkzeug.exceptions import NotFound
 import io
+import sys
 import base64
 import pytz
 
-# 设置模板文件夹路径（相对于app.py的位置）
-template_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'templates'))
-app = Flask(__name__, template_folder=template_dir)
+# 将项目根目录加入模块搜索路径，复用 modules 中的静态资源组件
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from modules.assets import init_assets
+from modules.utils import serialize_vehicles, serialize_violations, serialize_photo_metadata, delete_image_files
+from modules.image_processor import get_upload_size, SpooledUploadRequest
+from modules.image_orientation import rotate_photo, normalize_rotation
+from modules.image_metadata import photo_metadata, record_metadata
+from modules.image_store import store_compressed_upload, stage_compressed_upload, resolve_upload, upload_exists, rename_upload
+from modules.upload_cache import send_upload, forget_upload, add_photo_urls
+from modules.db import get_db_connection, ensure_photo_orientation_table, ensure_photo_metadata_table, fetch_photo_metadata
+from modules.db import ensure_image_store_tables, ensure_image_hash_table, ensure_staged_upload_table, ensure_image_pipeline_stats_table
+
+# 设置模板和静态文件夹路径（相对于app.py的位置）
+template_dir = os.path.join(project_root, 'templates')
+static_dir = os.path.join(project_root, 'static')
+app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 app.secret_key = 'your-secret-key-change-in-production'
+# 大文件上传落盘到临时文件，不整份缓存在内存中
+app.request_class = SpooledUploadRequest
+# 模板通过 asset_url() 引用指纹化的CSS/JS文件
+init_assets(app)
 
 # 添加模板过滤器
 @app.template_filter('format_date')
@@ -159,9 +180,6 @@ def inject_time_functions():
 # 图片上传配置
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
-COMPRESSED_MAX_WIDTH = 1200  # 压缩后最大宽度
-COMPRESSED_MAX_HEIGHT = 900   # 压缩后最大高度
-COMPRESSED_QUALITY = 85       # JPEG压缩质量 (1-100)
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 最大文件大小50MB
 
 # 确保上传目录存在（强制创建完整路径）
@@ -215,104 +233,12 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def compress_image(image_file, max_width=COMPRESSED_MAX_WIDTH, max_height=COMPRESSED_MAX_HEIGHT, quality=COMPRESSED_QUALITY):
-    """优化的图片压缩函数，专门处理大文件"""
-    try:
-        # 读取文件内容并检查大小
-        file_content = image_file.read()
-        original_size = len(file_content)
-        image_file.seek(0)
-        
-        print(f"开始处理图片，原始大小: {original_size / 1024 / 1024:.2f}MB")
-        
-        # 根据文件大小调整压缩策略
-        if original_size > 20 * 1024 * 1024:  # 大于20MB
-            print("检测到大文件，使用激进压缩策略")
-            max_width = min(800, max_width)
-            max_height = min(600, max_height)
-            quality = min(60, quality)
-        elif original_size > 10 * 1024 * 1024:  # 大于10MB
-            print("检测到中等大文件，使用标准压缩策略")
-            max_width = min(1000, max_width)
-            max_height = min(750, max_height)
-            quality = min(70, quality)
-        elif original_size > 5 * 1024 * 1024:  # 大于5MB
-            print("检测到较大文件，使用温和压缩策略")
-            quality = min(80, quality)
-        
-        # 使用内存文件打开图片，避免磁盘IO
-        img_io_temp = io.BytesIO(file_content)
-        img = Image.open(img_io_temp)
-        
-        original_width, original_height = img.size
-        print(f"原始图片尺寸: {original_width}x{original_height}")
-        
-        # 计算压缩比例
-        ratio = min(max_width / original_width, max_height / original_height, 1)
-        
-        if ratio < 1:
-            new_width = int(original_width * ratio)
-            new_height = int(original_height * ratio)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            print(f"压缩后图片尺寸: {new_width}x{new_height}")
-        
-        # 转换为RGB模式
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
-        
-        # 创建输出内存文件
-        img_io = io.BytesIO()
-        
-        # 强制使用JPEG格式以获得最佳压缩
-        save_format = 'JPEG'
-        save_kwargs = {'quality': quality, 'optimize': True, 'progressive': True}
-        
-        img.save(img_io, format=save_format, **save_kwargs)
-        img_io.seek(0)
-        
-        # 计算压缩结果
-        compressed_size = len(img_io.getvalue())
-        compression_ratio = (1 - compressed_size / original_size) * 100
-        
-        print(f"压缩后大小: {compressed_size / 1024:.1f}KB")
-        print(f"压缩率: {compression_ratio:.1f}%")
-        
-        # 如果压缩后仍然太大，进行二次压缩
-        if compressed_size > 3 * 1024 * 1024:  # 仍然大于3MB
-            print("进行二次压缩...")
-            img_io.seek(0)
-            img = Image.open(img_io)
-            
-            # 更激进的二次压缩
-            new_width = min(600, int(original_width * 0.4))
-            new_height = min(450, int(original_height * 0.4))
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            img_io_final = io.BytesIO()
-            img.save(img_io_final, format='JPEG', quality=40, optimize=True, progressive=True)
-            img_io_final.seek(0)
-            
-            final_size = len(img_io_final.getvalue())
-            final_compression = (1 - final_size / original_size) * 100
-            print(f"二次压缩后大小: {final_size / 1024:.1f}KB")
-            print(f"总压缩率: {final_compression:.1f}%")
-            
-            return img_io_final, 'jpeg'
-        
-        return img_io, 'jpeg'
-        
-    except Exception as e:
-        print(f"图片压缩失败: {str(e)}")
-        return None, None
-
 def save_uploaded_file(file, license_plate=None, location=None):
     """保存上传的文件并返回文件路径（带压缩和错误处理）"""
     if file and file.filename and allowed_file(file.filename):
         try:
             # 检查文件大小
-            file_content = file.read()
-            file_size = len(file_content)
-            file.seek(0)
+            file_size = get_upload_size(file)
             
             if file_size > MAX_FILE_SIZE:
                 print(f"文件过大: {file_size / 1024 / 1024:.2f}MB，超过限制")
@@ -336,48 +262,18 @@ def save_uploaded_file(file, license_plate=None, location=None):
                 if chinese_chars:
                     location_suffix = f"_{''.join(chinese_chars[:4])}"
             
-            # 生成基础文件名（包含车牌、时间戳和地点信息）
-            base_name = f"{plate_prefix}{location_suffix}_{timestamp.split('_')[0]}_{timestamp.split('_')[1]}"
-            max_seq = 0
-            
-            # 扫描uploads目录查找相同前缀的文件
-            for existing_file in os.listdir(app.config['UPLOAD_FOLDER']):
-                if existing_file.startswith(base_name):
-                    # 提取序号部分
-                    parts = existing_file.replace(base_name, '').split('_')
-                    if len(parts) >= 2 and parts[1].split('.')[0].isdigit():
-                        seq = int(parts[1].split('.')[0])
-                        max_seq = max(max_seq, seq)
-            
-            # 生成新的序号
-            seq = max_seq + 1
-            
-            # 使用秒级时间戳作为文件名基础
-            file_timestamp = f"{timestamp.split('_')[0]}_{timestamp.split('_')[1]}"
+            # 别名前缀（车牌、地点和秒级时间戳），序号在存入内容存储时由数据库分配
+            name_stem = f"{plate_prefix}{location_suffix}_{timestamp.split('_')[0]}_{timestamp.split('_')[1]}"
             
-            # 尝试压缩图片
-            img_io, save_format = compress_image(file)
+            # 压缩后存入内容存储，尺寸、EXIF和感知哈希同时写入数据库
+            conn = get_db_connection()
+            try:
+                saved_filename, _ = store_compressed_upload(conn, file, ext.lower(), name_stem)
+            finally:
+                conn.close()
             
-            if img_io:
-                # 压缩成功，使用压缩后的图片
-                compressed_filename = f"{plate_prefix}{location_suffix}_{file_timestamp}_{seq:02d}.{save_format}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], compressed_filename)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(img_io.getvalue())
-                
-                print(f"图片压缩并保存成功: {compressed_filename}")
-                return os.path.join('uploads', compressed_filename).replace('\\', '/')
-            else:
-                # 压缩失败，保存原始文件
-                original_filename = f"{plate_prefix}{location_suffix}_{file_timestamp}_{seq:02d}{ext}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], original_filename)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(file_content)
-                
-                print(f"图片保存成功（未压缩）: {original_filename}")
-                return os.path.join('uploads', original_filename).replace('\\', '/')
+            print(f"图片保存成功: {saved_filename}")
+            return os.path.join('uploads', saved_filename).replace('\\', '/')
                 
         except Exception as e:
             print(f"保存图片失败: {str(e)}")
@@ -497,6 +393,12 @@ def init_db():
             )
         ''')
         
+        ensure_image_store_tables(cursor)
+        ensure_image_hash_table(cursor)
+        ensure_photo_orientation_table(cursor)
+        ensure_photo_metadata_table(cursor)
+        ensure_staged_upload_table(cursor)
+        ensure_image_pipeline_stats_table(cursor)
         conn.commit()
         conn.close()
         print("数据库初始化完成")
@@ -512,6 +414,13 @@ def init_db():
             print("正在迁移数据库结构...")
             migrate_database(conn)
         
+        ensure_image_store_tables(cursor)
+        ensure_image_hash_table(cursor)
+        ensure_photo_orientation_table(cursor)
+        ensure_photo_metadata_table(cursor)
+        ensure_staged_upload_table(cursor)
+        ensure_image_pipeline_stats_table(cursor)
+        conn.commit()
         conn.close()
 
 @app.after_request
@@ -541,10 +450,12 @@ def index():
         vehicles = cursor.fetchall()
         conn.close()
         
-        return render_template('vehicles.html', vehicles=vehicles)
+        # 列表数据随页面一次性下发，页面脚本直接使用，无需再请求 /api/vehicles
+        return render_template('vehicles.html', vehicles=vehicles,
+                               page_state={'vehicles': serialize_vehicles(vehicles)})
     except Exception as e:
         print(f"查看车辆列表失败: {str(e)}")
-        return render_template('vehicles.html', vehicles=[])
+        return render_template('vehicles.html', vehicles=[], page_state={'vehicles': []})
 
 @app.route('/record')
 def record_violation():
@@ -585,12 +496,12 @@ def submit_violation():
             # 检查是否有压缩后的文件路径（多张图片）
             compressed_photos = request.form.getlist('compressed_photos')
             if compressed_photos and compressed_photos[0]:  # 检查列表不为空且第一个元素不为空
-                # 验证所有压缩文件是否存在
-                for compressed_photo_path in compressed_photos:
+                # 验证所有压缩文件是否存在，暂存的预览图片按车牌号移入内容存储
+                for index, compressed_photo_path in enumerate(compressed_photos):
                     if compressed_photo_path:
-                        compressed_file = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(compressed_photo_path))
-                        if os.path.exists(compressed_file):
-                            photo_paths.append(compressed_photo_path)
+                        compressed_file = os.path.basename(compressed_photo_path)
+                        if upload_exists(compressed_file):
+                            photo_paths.append(rename_upload(compressed_file, license_plate, index) or compressed_photo_path)
                         else:
                             print(f"压缩文件不存在: {compressed_photo_path}")
                             return jsonify({'success': False, 'message': f'压缩文件不存在: {compressed_photo_path}'}), 400
@@ -598,9 +509,9 @@ def submit_violation():
                 # 检查单个压缩文件路径（向后兼容）
                 compressed_photo_path = request.form.get('compressed_photo_path')
                 if compressed_photo_path:
-                    compressed_file = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(compressed_photo_path))
-                    if os.path.exists(compressed_file):
-                        photo_paths.append(compressed_photo_path)
+                    compressed_file = os.path.basename(compressed_photo_path)
+                    if upload_exists(compressed_file):
+                        photo_paths.append(rename_upload(compressed_file, license_plate, 0) or compressed_photo_path)
                     else:
                         print(f"压缩文件不存在: {compressed_photo_path}")
                         return jsonify({'success': False, 'message': '压缩文件不存在'}), 400
@@ -712,10 +623,12 @@ def view_violations():
         vehicles = cursor.fetchall()
         conn.close()
         
-        return render_template('vehicles.html', vehicles=vehicles)
+        # 列表数据随页面一次性下发，页面脚本直接使用，无需再请求 /api/vehicles
+        return render_template('vehicles.html', vehicles=vehicles,
+                               page_state={'vehicles': serialize_vehicles(vehicles)})
     except Exception as e:
         print(f"查看车辆列表失败: {str(e)}")
-        return render_template('vehicles.html', vehicles=[])
+        return render_template('vehicles.html', vehicles=[], page_state={'vehicles': []})
 
 @app.route('/api/vehicles')
 def api_vehicles():
@@ -790,7 +703,8 @@ def api_violations():
                 'violation_time': v[7] if len(v) > 7 else v[6]  # 如果没有违规时间，使用记录时间
             })
         
-        return jsonify(violations_list)
+        # 图片地址带内容版本，可长期缓存
+        return jsonify(add_photo_urls(violations_list))
         
     except Exception as e:
         print(f"API获取违停记录失败: {str(e)}")
@@ -844,12 +758,20 @@ def license_plate_detail(license_plate):
                 conn.commit()
                 conn.close()
         
+        # 记录数据随页面一次性下发，页面脚本直接使用，无需再请求 /api/violations
+        page_state = {
+            'license_plate': license_plate,
+            'total_count': total_count,
+            'violations': serialize_violations(violations)
+        }
+        
         return render_template('license_plate_detail.html', 
                              license_plate=license_plate, 
                              violations=violations, 
                              total_count=total_count,
                              first_violation=first_violation,
-                             last_violation=last_violation)
+                             last_violation=last_violation,
+                             page_state=page_state)
                              
     except Exception as e:
         print(f"获取车牌详情失败: {str(e)}")
@@ -858,7 +780,8 @@ def license_plate_detail(license_plate):
                              violations=[], 
                              total_count=0,
                              first_violation=None,
-                             last_violation=None)
+                             last_violation=None,
+                             page_state={'license_plate': license_plate, 'total_count': 0, 'violations': []})
 
 @app.route('/api/compress-preview', methods=['POST'])
 def api_compress_preview():
@@ -875,26 +798,24 @@ def api_compress_preview():
             return jsonify({'success': False, 'message': '不支持的文件格式'})
         
         # 检查文件大小
-        original_size = len(file.read())
-        file.seek(0)
+        original_size = get_upload_size(file)
         
         if original_size > MAX_FILE_SIZE:
             return jsonify({'success': False, 'message': f'文件过大，超过{MAX_FILE_SIZE/(1024*1024):.0f}MB限制'})
         
-        # 获取车牌号（如果提供）
-        license_plate = request.form.get('license_plate', '').strip()
-        
-        # 压缩并保存文件
-        compressed_path = save_uploaded_file(file, license_plate, request.form.get('location', ''))
+        # 压缩后放入暂存目录，提交记录时才按车牌号移入内容存储
+        _, ext = os.path.splitext(secure_filename(file.filename))
+        conn = get_db_connection()
+        try:
+            filename, compressed_size = stage_compressed_upload(conn, file, ext.lower())
+        except Exception as e:
+            print(f"压缩预览失败: {str(e)}")
+            filename = None
+        finally:
+            conn.close()
         
-        if compressed_path:
-            # 获取压缩后文件大小
-            compressed_file_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(compressed_path))
-            if os.path.exists(compressed_file_path):
-                compressed_size = os.path.getsize(compressed_file_path)
-            else:
-                compressed_size = 0
-            
+        if filename:
+            compressed_path = f"uploads/{filename}"
             compression_ratio = (1 - compressed_size / original_size) * 100
             
             return jsonify({
@@ -903,8 +824,8 @@ def api_compress_preview():
                 'compressed_size': f"{compressed_size / 1024:.1f}KB",
                 'compression_ratio': f"{compression_ratio:.1f}%",
                 'compressed_path': compressed_path,
-                'compressed_url': f"http://127.0.0.1:5000/{compressed_path}",
-                'filename': os.path.basename(compressed_path)
+                'compressed_url': f"/{compressed_path}",
+                'filename': filename
             })
         else:
             return jsonify({'success': False, 'message': '压缩失败'})
@@ -914,16 +835,23 @@ def api_compress_preview():
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """提供上传文件的访问"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """提供上传文件的访问：与正式入口相同，按Accept返回AVIF/WebP，旋转过的图片返回按方向缓存的派生文件"""
+    try:
+        return send_upload(filename)
+    except NotFound:
+        return "文件未找到", 404
 
 @app.route('/api/image/rotate/<int:record_id>', methods=['POST'])
 def rotate_image(record_id):
-    """旋转图片"""
+    """旋转图片：只记录方向，原图不重新编码"""
     try:
         # 获取旋转角度
         data = request.get_json()
         angle = data.get('angle', 90)  # 默认顺时针旋转90度
+        try:
+            angle = normalize_rotation(angle)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': '旋转角度必须是90的整数倍'})
         
         # 获取记录信息
         db_path = os.path.join(os.getcwd(), 'data', 'violations.db')
@@ -949,84 +877,90 @@ def rotate_image(record_id):
         except (json.JSONDecodeError, TypeError):
             photo_path = photo_path_json
         
-        full_path = os.path.join(os.getcwd(), photo_path.replace('/', os.sep))
-        
-        if not os.path.exists(full_path):
+        if not upload_exists(os.path.basename(photo_path)):
             conn.close()
             return jsonify({'success': False, 'message': '图片文件不存在'})
         
-        # 旋转图片
+        conn.close()
+        
+        # 记录方向，访问时返回旋转后的派生图片
         try:
-            with Image.open(full_path) as img:
-                # 旋转图片
-                rotated_img = img.rotate(-angle, expand=True)  # PIL使用逆时针，所以用负数
-                
-                # 保存旋转后的图片
-                rotated_img.save(full_path)
-                
+            rotation = rotate_photo(os.path.basename(photo_path), angle)
+            forget_upload(photo_path)
         except Exception as e:
-            conn.close()
             return jsonify({'success': False, 'message': f'图片旋转失败: {str(e)}'})
         
-        conn.close()
-        return jsonify({'success': True, 'message': '图片旋转成功'})
+        return jsonify({'success': True, 'message': '图片旋转成功', 'rotation': rotation})
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
 @app.route('/api/image/info/<int:record_id>')
 def get_image_info(record_id):
-    """获取图片信息"""
+    """获取图片信息（第一张图片），数据来自上传时记录的元数据"""
     try:
         # 获取记录信息
         db_path = os.path.join(os.getcwd(), 'data', 'violations.db')
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
-        cursor.execute('SELECT photo_path FROM violation_records WHERE id = ?', (record_id,))
-        record = cursor.fetchone()
+        photos = fetch_photo_metadata(cursor, record_id=record_id)
         
         conn.close()
         
-        if not record or not record[0]:
+        if not photos:
             return jsonify({'success': False, 'message': '记录不存在或无图片'})
         
-        photo_path_json = record[0]
+        photo = serialize_photo_metadata(photos[:1])[0]
+        photo_path = photo['photo_path']
         
-        # 处理JSON格式的图片路径
-        try:
-            photo_paths = json.loads(photo_path_json)
-            if isinstance(photo_paths, list) and len(photo_paths) > 0:
-                photo_path = photo_paths[0]  # 取第一张图片
-            else:
-                photo_path = photo_path_json
-        except (json.JSONDecodeError, TypeError):
-            photo_path = photo_path_json
+        if photo['width'] is None:
+            # 元数据功能上线前的图片：读取一次文件并补记，之后不再读取
+            full_path = resolve_upload(os.path.basename(photo_path))
+            if not full_path:
+                return jsonify({'success': False, 'message': '图片文件不存在'})
+            try:
+                metadata = photo_metadata(full_path)
+                record_metadata(os.path.basename(photo_path), metadata)
+            except Exception as e:
+                return jsonify({'success': False, 'message': f'读取图片信息失败: {str(e)}'})
+            photo.update(metadata)
+        
+        # 旋转90/270度时显示尺寸宽高互换
+        width, height = photo['width'], photo['height']
+        if photo['rotation'] in (90, 270):
+            width, height = height, width
+        
+        return jsonify({
+            'success': True,
+            'filename': os.path.basename(photo_path),
+            'size': f"{photo['size'] / 1024:.1f} KB",
+            'dimensions': f"{width} × {height}",
+            'format': photo['format'],
+            'taken_at': photo['taken_at'],
+            'gps': {'lat': photo['gps_lat'], 'lon': photo['gps_lon']} if photo['gps_lat'] is not None else None,
+            'rotation': photo['rotation'],
+            'path': photo_path
+        })
         
-        full_path = os.path.join(os.getcwd(), photo_path.replace('/', os.sep))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/photos/metadata')
+def photo_metadata_batch():
+    """批量获取一条记录（?record_id=）或一个车牌（?license_plate=）全部图片的元数据"""
+    try:
+        record_id = request.args.get('record_id', type=int)
+        license_plate = request.args.get('license_plate', '').strip()
+        if record_id is None and not license_plate:
+            return jsonify({'success': False, 'message': '请指定 record_id 或 license_plate'}), 400
         
-        if not os.path.exists(full_path):
-            return jsonify({'success': False, 'message': '图片文件不存在'})
+        db_path = os.path.join(os.getcwd(), 'data', 'violations.db')
+        conn = sqlite3.connect(db_path)
+        photos = fetch_photo_metadata(conn.cursor(), record_id=record_id, license_plate=license_plate)
+        conn.close()
         
-        # 获取图片信息
-        try:
-            with Image.open(full_path) as img:
-                file_size = os.path.getsize(full_path)
-                
-                info = {
-                    'success': True,
-                    'filename': os.path.basename(photo_path),
-                    'size': f"{file_size / 1024:.1f} KB",
-                    'dimensions': f"{img.width} × {img.height}",
-                    'format': img.format,
-                    'mode': img.mode,
-                    'path': photo_path
-                }
-                
-                return jsonify(info)
-                
-        except Exception as e:
-            return jsonify({'success': False, 'message': f'读取图片信息失败: {str(e)}'})
+        return jsonify({'success': True, 'photos': serialize_photo_metadata(photos)})
         
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
@@ -1061,15 +995,13 @@ def download_image(record_id):
         except (json.JSONDecodeError, TypeError):
             photo_path = photo_path_json
         
-        full_path = os.path.join(os.getcwd(), photo_path.replace('/', os.sep))
+        full_path = resolve_upload(os.path.basename(photo_path))
         
-        if not os.path.exists(full_path):
+        if not full_path:
             return jsonify({'success': False, 'message': '图片文件不存在'})
         
-        # 返回文件供下载
-        from flask import send_file
-        directory = os.path.dirname(full_path)
-        filename = os.path.basename(full_path)
+        # 返回文件供下载（内容文件以哈希命名，下载名使用别名）
+        filename = os.path.basename(photo_path)
         
         # 添加下载头
         response = send_file(full_path, as_attachment=True, download_name=f"{license_plate}_{filename}")
@@ -1121,26 +1053,8 @@ def delete_violation(record_id):
         conn.commit()
         conn.close()
         
-        # 删除相关的图片文件
-        deleted_files = 0
-        if photo_path:
-            try:
-                if photo_path.startswith('['):
-                    # JSON格式的多张图片
-                    photo_paths = json.loads(photo_path)
-                    for path in photo_paths:
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(path))
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            deleted_files += 1
-                else:
-                    # 单张图片
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(photo_path))
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        deleted_files += 1
-            except Exception as e:
-                print(f"删除图片文件失败: {e}")
+        # 删除相关的图片文件（内容文件在没有其他别名引用时才删除）
+        deleted_files = delete_image_files(photo_path)
         
         print(f"删除违停记录: ID={record_id}, 车牌={license_plate}, 删除图片文件={deleted_files}个")
         return jsonify({'success': True, 'message': '记录删除成功'})
@@ -1174,28 +1088,8 @@ def delete_vehicle(license_plate):
         conn.commit()
         conn.close()
         
-        # 删除相关的图片文件
-        deleted_files = 0
-        for record in records:
-            if record[0]:
-                try:
-                    if record[0].startswith('['):
-                        # JSON格式的多张图片
-                        import json
-                        photo_paths = json.loads(record[0])
-                        for path in photo_paths:
-                            file_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(path))
-                            if os.path.exists(file_path):
-                                os.remove(file_path)
-                                deleted_files += 1
-                    else:
-                        # 单张图片
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(record[0]))
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            deleted_files += 1
-                except Exception as e:
-                    print(f"删除图片文件失败: {e}")
+        # 删除相关的图片文件（内容文件在没有其他别名引用时才删除）
+        deleted_files = sum(delete_image_files(record[0]) for record in records)
         
         print(f"删除车牌所有记录: 车牌={license_plate}, 删除图片文件={deleted_files}个")
         return jsonify({'success': True, 'message': f'成功删除车牌 {license_plate} 的所有记录'})
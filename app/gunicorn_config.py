@@ -4,7 +4,11 @@
 # Gunicorn配置文件
 bind = "127.0.0.1:5000"
 workers = 2
-worker_class = "sync"
+# 使用线程worker：请求在线程中处理，主线程持续向master报告心跳，
+# 证据包导出（/api/export/evidence）等长时间流式响应不会因超过 timeout 被终止；
+# sync worker 在发送响应期间不报告心跳，超过 timeout 的下载会被截断
+worker_class = "gthread"
+threads = 4
 worker_connections = 1000
 timeout = 30
 keepalive = 2
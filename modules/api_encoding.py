@@ -0,0 +1,68 @@
+"""
+JSON API 响应编码：按 Accept 协商 JSON / 紧凑数组 / MessagePack
+"""
+
+import json
+
+from flask import jsonify, request, current_app
+
+try:
+    import msgpack
+except ImportError:  # msgpack为可选依赖，未安装时不提供二进制编码
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+# 紧凑数组格式：{"fields": [...], "rows": [[...], ...]}，字段名只出现一次
+COMPACT_MIMETYPE = 'application/vnd.violation.compact+json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPE_ALIASES = ('application/msgpack', 'application/x-msgpack')
+
+
+def negotiate_api_format(accept_mimetypes):
+    """根据Accept请求头选择响应格式，浏览器的 */* 仍返回普通JSON"""
+    candidates = [JSON_MIMETYPE, COMPACT_MIMETYPE]
+    if msgpack is not None:
+        candidates.extend(MSGPACK_MIMETYPE_ALIASES)
+
+    best = accept_mimetypes.best_match(candidates, default=JSON_MIMETYPE)
+    if best in MSGPACK_MIMETYPE_ALIASES:
+        return MSGPACK_MIMETYPE
+    return best
+
+
+def encode_compact(fields, rows):
+    """按紧凑数组格式编码（JSON）"""
+    payload = {'fields': list(fields), 'rows': [list(row) for row in rows]}
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_msgpack(fields, rows):
+    """按紧凑数组格式编码（MessagePack）"""
+    payload = {'fields': list(fields), 'rows': [list(row) for row in rows]}
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def api_response(fields, rows, serialize):
+    """根据内容协商生成列表类API响应
+
+    fields    查询的字段名
+    rows      数据库查询结果
+    serialize 生成普通JSON字典列表的函数，签名为 serialize(rows, fields)
+    """
+    mimetype = negotiate_api_format(request.accept_mimetypes)
+    items = serialize(rows, fields)
+
+    if mimetype in (COMPACT_MIMETYPE, MSGPACK_MIMETYPE):
+        # 紧凑格式与普通JSON使用同一份规整后的数据（如空描述为''），只是去掉重复的字段名
+        rows = [[item[field] for field in fields] for item in items]
+
+    if mimetype == COMPACT_MIMETYPE:
+        response = current_app.response_class(encode_compact(fields, rows), mimetype=COMPACT_MIMETYPE)
+    elif mimetype == MSGPACK_MIMETYPE:
+        response = current_app.response_class(encode_msgpack(fields, rows), mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(items)
+
+    # 同一URL有多种表示，缓存需要区分Accept
+    response.vary.add('Accept')
+    return response
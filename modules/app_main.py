@@ -1,23 +1,53 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify
 from datetime import datetime
 import sqlite3
 import os
 import re
 import json
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import NotFound, RequestedRangeNotSatisfiable
 import pytz
 
 # 导入我们创建的模块
-from modules.db import init_db, get_db_connection
-from modules.image_processor import save_uploaded_file, rename_compressed_file, allowed_file, UPLOAD_FOLDER, MAX_FILE_SIZE
-from modules.validators import validate_license_plate, sanitize_input, validate_violation_type
-from modules.utils import calculate_time_span, calculate_average_frequency, count_recent_violations, delete_image_files
+from modules.db import init_db, get_db_connection, fetch_vehicle_list, fetch_violation_records, VEHICLE_FIELDS, VIOLATION_FIELDS
+from modules.db import fetch_photo_metadata, fetch_evidence_photos, PHOTO_METADATA_FIELDS, EVIDENCE_FIELDS
+from modules.image_stats import pipeline_summary
+from modules.decode_budget import configure_decode_limits
+from modules.image_processor import allowed_file, get_upload_size, SpooledUploadRequest, MAX_FILE_SIZE
+from modules.image_processor import rename_image_variants, storage_profile
+from modules.image_store import upload_exists, rename_upload, rename_alias, delete_uploads, store_raw_upload, find_near_duplicates
+from modules.image_hash import DUPLICATE_PHOTO_POLICY
+from modules.image_orientation import rename_rotation
+from modules.image_metadata import rename_metadata
+from modules.validators import validate_license_plate, sanitize_input, validate_violation_type, parse_fields
+from modules.utils import calculate_time_span, calculate_average_frequency, count_recent_violations, delete_image_files, serialize_vehicles, serialize_violations
+from modules.utils import serialize_photo_metadata
+from modules.compression import CompressionMiddleware
+from modules.assets import init_assets, ASSET_DIST_DIR
+from modules.api_encoding import api_response
+from modules.batch import build_violation_update, validate_batch_operations, apply_violation_batch
+from modules.image_jobs import submit_compress_job, submit_compress_path, get_job, JobQueueFull, JOB_RETRY_AFTER
+from modules.image_jobs import prepare_compress_job, start_compress_job, cancel_compress_job
+from modules.evidence_export import stream_evidence_zip
+from modules.upload_cache import send_upload, forget_upload
+from modules.resumable_upload import (create_upload, get_upload, append_chunk, complete_upload, restore_upload,
+                                      cancel_upload, UploadError, RESUMABLE_CHUNK_SIZE)
 
 template_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
 static_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static')
 
 app = Flask(__name__, template_folder=template_dir, static_folder=static_dir)
 app.secret_key = 'your-secret-key-change-in-production'
+# 大文件上传落盘到临时文件，不整份缓存在内存中
+app.request_class = SpooledUploadRequest
+# HTML/JSON响应按Accept-Encoding压缩，静态资源使用构建时生成的预压缩文件
+app.wsgi_app = CompressionMiddleware(app.wsgi_app, static_folder=static_dir, static_url_path=app.static_url_path,
+                                     immutable_prefixes=(f'{ASSET_DIST_DIR}/',))
+# 模板通过 asset_url() 引用指纹化的CSS/JS文件
+init_assets(app)
+# 服务进程内的图片解码按内存预算设置像素上限
+configure_decode_limits()
 
 # 添加模板过滤器
 @app.template_filter('format_date')
@@ -85,6 +115,10 @@ def inject_time_functions():
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
 # 设置文件大小限制为50MB
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+# nginx 中对应 uploads/ 目录的 internal location
+UPLOAD_ACCEL_PREFIX = '/_protected_uploads/'
+# 为空时由应用直接发送上传文件（开发环境），create_app() 按部署方式设置
+app.config['UPLOAD_ACCEL_REDIRECT'] = None
 
 @app.after_request
 def after_request(response):
@@ -101,30 +135,35 @@ def index():
         conn = get_db_connection()
         cursor = conn.cursor()
         # 获取每个车辆的最新记录时间（按created_at排序）
-        cursor.execute('''
-            SELECT v.license_plate, v.violation_count, 
-                   (SELECT MAX(created_at) FROM violation_records WHERE license_plate = v.license_plate) as last_record_time
-            FROM vehicles v
-            WHERE v.violation_count > 0
-            ORDER BY last_record_time DESC
-        ''')
-        vehicles = cursor.fetchall()
+        vehicles = fetch_vehicle_list(cursor)
         conn.close()
         
-        return render_template('vehicles.html', vehicles=vehicles)
+        # 列表数据随页面一次性下发，页面脚本直接使用，无需再请求 /api/vehicles
+        return render_template('vehicles.html', vehicles=vehicles,
+                               page_state={'vehicles': serialize_vehicles(vehicles)})
     except Exception as e:
         print(f"查看车辆列表失败: {str(e)}")
-        return render_template('vehicles.html', vehicles=[])
+        return render_template('vehicles.html', vehicles=[], page_state={'vehicles': []})
 
 @app.route('/record')
 def record_violation():
     """违停录入页面"""
     return render_template('index.html')
 
+def discard_promoted_photos(photo_paths):
+    """记录未能保存时删除本次已按车牌号移入内容存储的图片
+
+    这些图片已离开暂存目录且不带 UNKNOWN_ 前缀，暂存清理不会处理，留下会在下次提交时被误判为重复图片
+    """
+    if photo_paths:
+        delete_uploads(photo_paths)
+        forget_upload(*photo_paths)
+
 @app.route('/submit_violation', methods=['POST'])
 def submit_violation():
     """提交违停记录"""
     conn = None
+    promoted_photos = []
     try:
         # 获取并验证表单数据
         license_plate = sanitize_input(request.form.get('license_plate', ''))
@@ -147,52 +186,67 @@ def submit_violation():
         
         # 处理图片上传（支持多张图片）
         photo_paths = []
+        photo_file = None
+        duplicate_photos = []
         
         try:
+            # 重命名之前与该车牌已有记录的图片比对感知哈希，近似重复时标记或拒绝
+            submitted_photos = request.form.getlist('compressed_photos') or [request.form.get('compressed_photo_path', '')]
+            duplicate_photos = find_near_duplicates([os.path.basename(path) for path in submitted_photos if path], license_plate)
+            if duplicate_photos:
+                print(f"检测到近似重复图片: {license_plate} - {duplicate_photos}")
+                if DUPLICATE_PHOTO_POLICY == 'reject':
+                    return jsonify({'success': False, 'message': '图片与该车牌已有记录的图片重复',
+                                    'duplicate_photos': duplicate_photos}), 409
+            
             # 检查是否有压缩后的文件路径（多张图片）
             compressed_photos = request.form.getlist('compressed_photos')
             if compressed_photos and compressed_photos[0]:  # 检查列表不为空且第一个元素不为空
                 # 验证所有压缩文件是否存在，并根据车牌号重命名
                 for index, compressed_photo_path in enumerate(compressed_photos):
                     if compressed_photo_path:
-                        compressed_file = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(compressed_photo_path))
-                        if os.path.exists(compressed_file):
+                        compressed_file = os.path.basename(compressed_photo_path)
+                        if upload_exists(compressed_file):
                             # 根据车牌号重命名文件
-                            new_path = rename_compressed_file(compressed_file, license_plate, index)
+                            new_path = rename_upload(compressed_file, license_plate, index)
                             if new_path:
                                 photo_paths.append(new_path)
+                                promoted_photos.append(new_path)
                             else:
                                 photo_paths.append(compressed_photo_path)
                         else:
                             print(f"压缩文件不存在: {compressed_photo_path}")
+                            discard_promoted_photos(promoted_photos)
                             return jsonify({'success': False, 'message': f'压缩文件不存在: {compressed_photo_path}'}), 400
             else:
                 # 检查单个压缩文件路径（向后兼容）
                 compressed_photo_path = request.form.get('compressed_photo_path')
                 if compressed_photo_path:
-                    compressed_file = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(compressed_photo_path))
-                    if os.path.exists(compressed_file):
+                    compressed_file = os.path.basename(compressed_photo_path)
+                    if upload_exists(compressed_file):
                         # 根据车牌号重命名文件
-                        new_path = rename_compressed_file(compressed_file, license_plate, 0)
+                        new_path = rename_upload(compressed_file, license_plate, 0)
                         if new_path:
                             photo_paths.append(new_path)
+                            promoted_photos.append(new_path)
                         else:
                             photo_paths.append(compressed_photo_path)
                     else:
                         print(f"压缩文件不存在: {compressed_photo_path}")
                         return jsonify({'success': False, 'message': '压缩文件不存在'}), 400
                 else:
-                    # 原有的文件上传逻辑
+                    # 原有的文件上传逻辑：图片在记录保存后交给进程池压缩
                     if 'photo' in request.files:
                         file = request.files['photo']
                         if file.filename != '':
-                            photo_path = save_uploaded_file(file, license_plate)
-                            if photo_path:
-                                photo_paths.append(photo_path)
-                            else:
+                            if not allowed_file(file.filename):
                                 return jsonify({'success': False, 'message': '图片格式不支持或处理失败'}), 400
+                            if get_upload_size(file) > MAX_FILE_SIZE:
+                                return jsonify({'success': False, 'message': f'文件过大，超过{MAX_FILE_SIZE/(1024*1024):.0f}MB限制'}), 400
+                            photo_file = file
         except Exception as e:
             print(f"处理图片上传时出错: {str(e)}")
+            discard_promoted_photos(promoted_photos)
             return jsonify({'success': False, 'message': f'图片处理错误: {str(e)}'}), 400
         
         # 将多张图片路径合并为JSON字符串存储
@@ -212,6 +266,7 @@ def submit_violation():
             INSERT INTO violation_records (license_plate, location, violation_type, violation_time, description, photo_path, ip_address, created_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (license_plate, location, violation_type, violation_time, description, photo_path_json, request.remote_addr, current_time))
+        record_id = cursor.lastrowid
         
         # 更新或插入车辆信息
         cursor.execute('SELECT violation_count FROM vehicles WHERE license_plate = ?', (license_plate,))
@@ -232,15 +287,43 @@ def submit_violation():
                 VALUES (?, 1, ?, ?)
             ''', (license_plate, current_time, current_time))
         
-        conn.commit()
+        job = None
+        if photo_file:
+            # 任务记录与违停记录在同一事务中提交：队列已满时整体回滚，不留下缺图的记录；
+            # 事务提交后才交给进程池，回滚释放的记录ID不会被任务写回
+            try:
+                job = prepare_compress_job(photo_file, license_plate, kind='violation_photo',
+                                           record_id=record_id, conn=conn)
+            except JobQueueFull as e:
+                conn.rollback()
+                response = jsonify({'success': False, 'message': str(e)})
+                response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+                return response, 503
+        
+        try:
+            conn.commit()
+        except Exception:
+            if job:
+                cancel_compress_job(job)
+            raise
+        # 记录已保存，图片归记录所有
+        promoted_photos.clear()
+        job_id = start_compress_job(job) if job else None
         
         print(f"新增违停记录: {license_plate} - {location} - 图片: {photo_path_json}")
-        return jsonify({'success': True, 'message': '违停记录已提交', 'photo_path': photo_path_json})
+        result = {'success': True, 'message': '违停记录已提交', 'photo_path': photo_path_json}
+        if duplicate_photos:
+            result['duplicate_photos'] = duplicate_photos
+        if job_id:
+            result['job_id'] = job_id
+            result['status_url'] = f"/api/jobs/{job_id}"
+        return jsonify(result)
         
     except Exception as e:
-        # 回滚数据库事务
+        # 回滚数据库事务，已移入内容存储的图片一并删除
         if conn:
             conn.rollback()
+        discard_promoted_photos(promoted_photos)
         print(f"提交违停记录失败: {str(e)}")
         return jsonify({'success': False, 'message': f'系统错误，请稍后再试: {str(e)}'}), 500
     finally:
@@ -255,47 +338,35 @@ def view_violations():
         conn = get_db_connection()
         cursor = conn.cursor()
         # 获取每个车辆的最新记录时间（按created_at排序）
-        cursor.execute('''
-            SELECT v.license_plate, v.violation_count, 
-                   (SELECT MAX(created_at) FROM violation_records WHERE license_plate = v.license_plate) as last_record_time
-            FROM vehicles v
-            WHERE v.violation_count > 0
-            ORDER BY last_record_time DESC
-        ''')
-        vehicles = cursor.fetchall()
+        vehicles = fetch_vehicle_list(cursor)
         conn.close()
         
-        return render_template('vehicles.html', vehicles=vehicles)
+        # 列表数据随页面一次性下发，页面脚本直接使用，无需再请求 /api/vehicles
+        return render_template('vehicles.html', vehicles=vehicles,
+                               page_state={'vehicles': serialize_vehicles(vehicles)})
     except Exception as e:
         print(f"查看车辆列表失败: {str(e)}")
-        return render_template('vehicles.html', vehicles=[])
+        return render_template('vehicles.html', vehicles=[], page_state={'vehicles': []})
 
 @app.route('/api/vehicles')
 def api_vehicles():
-    """API获取车辆列表"""
+    """API获取车辆列表
+
+    支持 ?fields= 只返回指定字段；Accept 可协商紧凑数组或 MessagePack 格式
+    """
+    fields, invalid_fields = parse_fields(request.args.get('fields'), VEHICLE_FIELDS)
+    if invalid_fields:
+        return jsonify({'error': f'无效的字段: {", ".join(invalid_fields)}'}), 400
+    fields = fields or tuple(VEHICLE_FIELDS)
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         # 获取每个车辆的最新记录时间（按created_at排序）
-        cursor.execute('''
-            SELECT v.license_plate, v.violation_count, 
-                   (SELECT MAX(created_at) FROM violation_records WHERE license_plate = v.license_plate) as last_record_time
-            FROM vehicles v
-            WHERE v.violation_count > 0
-            ORDER BY last_record_time DESC
-        ''')
-        vehicles = cursor.fetchall()
+        vehicles = fetch_vehicle_list(cursor, fields)
         conn.close()
         
-        vehicles_list = []
-        for v in vehicles:
-            vehicles_list.append({
-                'license_plate': v[0],
-                'violation_count': v[1],
-                'last_violation': v[2]
-            })
-        
-        return jsonify(vehicles_list)
+        return api_response(fields, vehicles, serialize_vehicles)
         
     except Exception as e:
         print(f"API获取车辆列表失败: {str(e)}")
@@ -303,43 +374,25 @@ def api_vehicles():
 
 @app.route('/api/violations')
 def api_violations():
-    """API获取违停记录"""
+    """API获取违停记录
+
+    支持 ?fields= 只返回指定字段；Accept 可协商紧凑数组或 MessagePack 格式
+    """
+    fields, invalid_fields = parse_fields(request.args.get('fields'), VIOLATION_FIELDS)
+    if invalid_fields:
+        return jsonify({'error': f'无效的字段: {", ".join(invalid_fields)}'}), 400
+    fields = fields or tuple(VIOLATION_FIELDS)
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
         # 检查是否按车牌号筛选
         license_plate = request.args.get('license_plate')
-        if license_plate:
-            cursor.execute('''
-                SELECT id, license_plate, location, violation_type, description, photo_path, created_at 
-                FROM violation_records 
-                WHERE license_plate = ?
-                ORDER BY created_at DESC
-            ''', (license_plate,))
-        else:
-            cursor.execute('''
-                SELECT id, license_plate, location, violation_type, description, photo_path, created_at 
-                FROM violation_records 
-                ORDER BY created_at DESC LIMIT 100
-            ''')
-        
-        violations = cursor.fetchall()
+        violations = fetch_violation_records(cursor, license_plate, fields)
         conn.close()
         
-        violations_list = []
-        for v in violations:
-            violations_list.append({
-                'id': v[0],
-                'license_plate': v[1],
-                'location': v[2],
-                'violation_type': v[3],
-                'description': v[4] or '',
-                'photo_path': v[5],
-                'created_at': v[6]
-            })
-        
-        return jsonify(violations_list)
+        return api_response(fields, violations, serialize_violations)
         
     except Exception as e:
         print(f"API获取违停记录失败: {str(e)}")
@@ -361,13 +414,7 @@ def license_plate_detail(license_plate):
         vehicle_info = cursor.fetchone()
         
         # 获取所有违规记录
-        cursor.execute('''
-            SELECT id, license_plate, location, violation_type, description, photo_path, created_at 
-            FROM violation_records 
-            WHERE license_plate = ? 
-            ORDER BY created_at DESC
-        ''', (license_plate,))
-        violations = cursor.fetchall()
+        violations = fetch_violation_records(cursor, license_plate)
         
         conn.close()
         
@@ -380,12 +427,20 @@ def license_plate_detail(license_plate):
             first_violation = violations[-1][6] if violations else None
             last_violation = violations[0][6] if violations else None
         
+        # 记录数据随页面一次性下发，页面脚本直接使用，无需再请求 /api/violations
+        page_state = {
+            'license_plate': license_plate,
+            'total_count': total_count,
+            'violations': serialize_violations(violations)
+        }
+        
         return render_template('license_plate_detail.html', 
                              license_plate=license_plate, 
                              violations=violations, 
                              total_count=total_count,
                              first_violation=first_violation,
-                             last_violation=last_violation)
+                             last_violation=last_violation,
+                             page_state=page_state)
                              
     except Exception as e:
         print(f"获取车牌详情失败: {str(e)}")
@@ -394,7 +449,68 @@ def license_plate_detail(license_plate):
                              violations=[], 
                              total_count=0,
                              first_violation=None,
-                             last_violation=None)
+                             last_violation=None,
+                             page_state={'license_plate': license_plate, 'total_count': 0, 'violations': []})
+
+@app.route('/api/photos/metadata')
+def api_photo_metadata():
+    """批量获取图片元数据
+
+    ?record_id= 返回一条记录的全部图片，?license_plate= 返回该车牌全部记录的图片；
+    数据在上传时写入数据库，查询时不读取图片文件。Accept 可协商紧凑数组或 MessagePack 格式
+    """
+    record_id = request.args.get('record_id', type=int)
+    license_plate = request.args.get('license_plate', '').strip()
+    if record_id is None and not license_plate:
+        return jsonify({'error': '请指定 record_id 或 license_plate'}), 400
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        photos = fetch_photo_metadata(cursor, record_id=record_id, license_plate=license_plate)
+        conn.close()
+        
+        return api_response(tuple(PHOTO_METADATA_FIELDS), photos, serialize_photo_metadata)
+        
+    except Exception as e:
+        print(f"API获取图片元数据失败: {str(e)}")
+        return jsonify({'error': '数据获取失败'}), 500
+
+@app.route('/api/export/evidence')
+def export_evidence():
+    """导出证据包：车牌（?license_plate=）和/或日期范围（?start=&end=，YYYY-MM-DD）内的全部图片及CSV清单
+
+    ZIP边读边发送，图片原样存储不重新压缩，内存占用与归档大小无关
+    """
+    license_plate = request.args.get('license_plate', '').strip()
+    start_date = request.args.get('start', '').strip()
+    end_date = request.args.get('end', '').strip()
+    if not (license_plate or start_date or end_date):
+        return jsonify({'success': False, 'message': '请指定车牌号或日期范围'}), 400
+    for value in (start_date, end_date):
+        if value and not re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+            return jsonify({'success': False, 'message': '日期格式应为 YYYY-MM-DD'}), 400
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        photos = [dict(zip(EVIDENCE_FIELDS, row)) for row in
+                  fetch_evidence_photos(cursor, license_plate, start_date, end_date)]
+        conn.close()
+    except Exception as e:
+        print(f"导出证据包失败: {str(e)}")
+        return jsonify({'success': False, 'message': '数据获取失败'}), 500
+    
+    if not photos:
+        return jsonify({'success': False, 'message': '没有符合条件的图片'}), 404
+    
+    download_name = '_'.join(part for part in ('evidence', license_plate, start_date, end_date) if part) + '.zip'
+    print(f"导出证据包: {download_name}，共 {len(photos)} 张图片")
+    response = Response(stream_evidence_zip(photos), mimetype='application/zip')
+    # nginx 不缓冲，按客户端的下载速度边生成边发送（缓冲到 proxy_max_temp_file_size 后同样会等待客户端）
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Content-Disposition'] = f"attachment; filename=evidence.zip; filename*=UTF-8''{quote(download_name)}"
+    return response
 
 @app.route('/api/compress-preview', methods=['POST'])
 def api_compress_preview():
@@ -411,8 +527,7 @@ def api_compress_preview():
             return jsonify({'success': False, 'message': '不支持的文件格式'})
         
         # 检查文件大小
-        original_size = len(file.read())
-        file.seek(0)
+        original_size = get_upload_size(file)
         
         if original_size > MAX_FILE_SIZE:
             return jsonify({'success': False, 'message': f'文件过大，超过{MAX_FILE_SIZE/(1024*1024):.0f}MB限制'})
@@ -420,52 +535,162 @@ def api_compress_preview():
         # 获取车牌号（如果提供），但不立即用于文件名
         license_plate = request.form.get('license_plate', '').strip()
         
-        # 压缩并保存文件（使用临时前缀）
-        compressed_path = save_uploaded_file(file, None)  # 不传递车牌号，使用临时前缀
+        # 交给进程池压缩（使用临时前缀），客户端通过任务ID查询结果
+        try:
+            job_id = submit_compress_job(file, None, kind='preview')  # 不传递车牌号，使用临时前缀
+        except JobQueueFull as e:
+            response = jsonify({'success': False, 'message': str(e)})
+            response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+            return response, 503
         
-        if compressed_path:
-            # 获取压缩后文件大小
-            compressed_file_path = os.path.join(UPLOAD_FOLDER, os.path.basename(compressed_path))
-            if os.path.exists(compressed_file_path):
-                compressed_size = os.path.getsize(compressed_file_path)
-            else:
-                compressed_size = 0
-            
-            compression_ratio = (1 - compressed_size / original_size) * 100
-            
-            return jsonify({
-                'success': True,
-                'original_size': f"{original_size / 1024 / 1024:.2f}MB",
-                'compressed_size': f"{compressed_size / 1024:.1f}KB",
-                'compression_ratio': f"{compression_ratio:.1f}%",
-                'compressed_path': compressed_path,
-                'compressed_url': f"http://127.0.0.1:5000/{compressed_path}",
-                'filename': os.path.basename(compressed_path)
-            })
-        else:
-            return jsonify({'success': False, 'message': '压缩失败'})
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f"/api/jobs/{job_id}"
+        }), 202
             
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+# 存储要求只随部署变化，浏览器可短时间缓存
+STORAGE_PROFILE_MAX_AGE = 3600
+
+@app.route('/api/storage-profile')
+def api_storage_profile():
+    """图片存储要求（最大尺寸、字节预算、质量），录入页据此在浏览器中缩小编码后再上传"""
+    response = jsonify({'success': True, **storage_profile()})
+    response.headers['Cache-Control'] = f'public, max-age={STORAGE_PROFILE_MAX_AGE}'
+    return response
+
+def upload_error_response(error):
+    """断点续传出错时的响应，附带服务端已接收的字节数"""
+    data = {'success': False, 'message': str(error)}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    response = jsonify(data)
+    if error.offset is not None:
+        response.headers['Upload-Offset'] = str(error.offset)
+    return response, error.status
+
+def upload_status_response(upload, status=200, **extra):
+    """断点续传的状态响应，Upload-Offset/Upload-Length 头与 tus 协议一致"""
+    response = jsonify({'success': True, 'upload_id': upload['upload_id'], 'offset': upload['offset'],
+                        'length': upload['length'], **extra})
+    response.headers['Upload-Offset'] = str(upload['offset'])
+    response.headers['Upload-Length'] = str(upload['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response, status
+
+@app.route('/api/uploads', methods=['POST'])
+def api_create_upload():
+    """创建断点续传上传，参数为文件名和总字节数"""
+    try:
+        data = request.get_json(silent=True) or request.form
+        filename = os.path.basename(str(data.get('filename') or ''))
+        length = int(data.get('length') or request.headers.get('Upload-Length') or 0)
+        upload_id = create_upload(filename, length)
+
+        upload_url = f"/api/uploads/{upload_id}"
+        response, status = upload_status_response(get_upload(upload_id), 201, upload_url=upload_url,
+                                                   chunk_size=RESUMABLE_CHUNK_SIZE)
+        response.headers['Location'] = upload_url
+        return response, status
+    except UploadError as e:
+        return upload_error_response(e)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '文件大小无效'}), 400
+    except Exception as e:
+        print(f"创建上传失败: {str(e)}")
+        return jsonify({'success': False, 'message': '创建上传失败'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def api_upload_status(upload_id):
+    """查询已接收的字节数（也可用HEAD只取响应头），网络中断后客户端从这里继续"""
+    upload = get_upload(upload_id)
+    if not upload:
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    return upload_status_response(upload)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def api_upload_chunk(upload_id):
+    """追加一段数据，Upload-Offset 头为这段数据的起始位置（必须等于已接收的字节数）"""
+    try:
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None:
+            return jsonify({'success': False, 'message': '缺少 Upload-Offset'}), 400
+
+        append_chunk(upload_id, offset, request.stream)
+        return upload_status_response(get_upload(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"接收上传数据失败: {str(e)}")
+        return jsonify({'success': False, 'message': '接收上传数据失败'}), 500
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def api_complete_upload(upload_id):
+    """数据接收完整后交给压缩任务，返回值与 /api/compress-preview 相同"""
+    try:
+        upload = complete_upload(upload_id)
+        try:
+            job_id = submit_compress_path(upload['path'], upload['filename'], kind='preview')
+        except Exception as e:
+            # 任务未提交时恢复会话，客户端稍后重新调用 complete 即可，不必重新上传
+            restore_upload(upload_id, upload)
+            if not isinstance(e, JobQueueFull):
+                raise
+            response = jsonify({'success': False, 'message': str(e)})
+            response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+            return response, 503
+
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f"/api/jobs/{job_id}"
+        }), 202
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"完成上传失败: {str(e)}")
+        return jsonify({'success': False, 'message': '完成上传失败'}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def api_cancel_upload(upload_id):
+    """取消上传"""
+    if not cancel_upload(upload_id):
+        return jsonify({'success': False, 'message': '上传不存在或已过期'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    """查询图片处理任务状态"""
+    try:
+        job = get_job(job_id)
+        if not job:
+            return jsonify({'success': False, 'message': '任务不存在'}), 404
+        
+        if job['status'] == 'failed':
+            return jsonify({'success': False, 'job_id': job_id, 'status': 'failed', 'message': job['error'] or '压缩失败'})
+        
+        data = {'success': True, 'job_id': job_id, 'status': job['status']}
+        if job['result']:
+            data.update(job['result'])
+        return jsonify(data)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
     """提供上传文件的访问"""
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-    except Exception as e:
-        print(f"访问上传文件时出错: {str(e)}")
+        return send_upload(filename)
+    except NotFound:
         return "文件未找到", 404
-
-@app.route('/<path:filename>')
-def serve_upload_file(filename):
-    """提供上传文件的访问（支持路径形式）"""
-    try:
-        if filename.startswith('uploads/'):
-            actual_filename = filename.split('/')[-1]
-            return send_from_directory(app.config['UPLOAD_FOLDER'], actual_filename)
-        # 如果不是上传文件路径，继续处理其他路由
-        abort(404)
+    except RequestedRangeNotSatisfiable:
+        raise
     except Exception as e:
         print(f"访问上传文件时出错: {str(e)}")
         return "文件未找到", 404
@@ -595,20 +820,9 @@ def update_violation(record_id):
             return jsonify({'success': False, 'message': '记录不存在'}), 404
         
         # 构建更新语句
-        update_fields = []
-        update_values = []
-        
-        if 'violation_type' in data:
-            update_fields.append('violation_type = ?')
-            update_values.append(data['violation_type'])
-        
-        if 'location' in data:
-            update_fields.append('location = ?')
-            update_values.append(data['location'])
-        
-        if 'description' in data:
-            update_fields.append('description = ?')
-            update_values.append(data['description'])
+        updates = build_violation_update(data)
+        update_fields = [f'{field} = ?' for field, _ in updates]
+        update_values = [value for _, value in updates]
         
         if not update_fields:
             conn.close()
@@ -635,6 +849,47 @@ def update_violation(record_id):
         print(f"更新违停记录失败: {str(e)}")
         return jsonify({'success': False, 'message': '更新失败'}), 500
 
+@app.route('/api/violations/batch', methods=['POST'])
+def batch_violations():
+    """批量删除/更新违停记录
+
+    请求体: {"operations": [{"op": "delete", "id": 1},
+                            {"op": "update", "id": 2, "fields": {"location": "..."}}]}
+    所有操作在一个事务内完成，每个受影响车牌只重新统计一次，图片文件在响应发送后删除
+    """
+    data = request.get_json(silent=True) or {}
+    delete_ids, updates, error = validate_batch_operations(data.get('operations'))
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    conn = None
+    try:
+        conn = get_db_connection()
+        result = apply_violation_batch(conn, delete_ids, updates)
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"批量修改违停记录失败: {str(e)}")
+        return jsonify({'success': False, 'message': '批量操作失败'}), 500
+    finally:
+        if conn:
+            conn.close()
+    
+    photo_paths = result.pop('photo_paths')
+    print(f"批量修改违停记录: 删除={len(result['deleted'])}条, 更新={len(result['updated'])}条, 涉及车牌={len(result['affected_plates'])}个")
+    
+    response = jsonify({'success': True, 'message': '批量操作成功', **result})
+    
+    # 事务提交后再删除图片文件，且不阻塞响应
+    def delete_photos():
+        deleted_files = sum(delete_image_files(photo_path) for photo_path in photo_paths)
+        print(f"批量删除图片文件: {deleted_files}个")
+    
+    if photo_paths:
+        response.call_on_close(delete_photos)
+    return response
+
 @app.route('/api/upload_image', methods=['POST'])
 def upload_image():
     """上传单张图片并更新违停记录"""
@@ -662,19 +917,6 @@ def upload_image():
         original_filename = secure_filename(file.filename)
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         name, ext = os.path.splitext(original_filename)
-        filename = f"{timestamp}_{name}{ext}"
-        
-        # 确保上传目录存在
-        upload_folder = app.config.get('UPLOAD_FOLDER', 'uploads')
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-        
-        # 保存文件
-        file_path = os.path.join(upload_folder, filename)
-        file.save(file_path)
-        
-        # 获取相对路径用于存储
-        relative_path = os.path.join('uploads', filename).replace('\\', '/')
         
         # 更新数据库中的图片路径
         conn = get_db_connection()
@@ -685,6 +927,10 @@ def upload_image():
         result = cursor.fetchone()
         
         if result:
+            # 存入内容存储，文件名作为别名
+            filename = store_raw_upload(conn, file.stream, ext.lower(), f"{timestamp}_{name}")
+            relative_path = f"uploads/{filename}"
+            
             existing_paths = result[0]
             if existing_paths:
                 try:
@@ -788,9 +1034,9 @@ def delete_image():
                     else:
                         full_path = os.path.join(os.getcwd(), image_path)
                     
-                    if os.path.exists(full_path):
-                        os.remove(full_path)
+                    if delete_uploads([image_path]):
                         print(f"已删除文件: {full_path}")
+                    forget_upload(image_path)
                 except Exception as file_error:
                     print(f"删除物理文件失败: {file_error}")
                     # 即使文件删除失败，也继续执行（数据库已更新）
@@ -883,6 +1129,9 @@ def rename_image():
                     # 多个图片，保存为数组
                     cursor.execute('UPDATE violation_records SET photo_path = ? WHERE id = ?', 
                                  (json.dumps(photo_paths), record_id))
+                # 图片方向和元数据按文件名记录，随之改名
+                rename_rotation(cursor, os.path.basename(old_path), os.path.basename(new_path))
+                rename_metadata(cursor, os.path.basename(old_path), os.path.basename(new_path))
                 
                 conn.commit()
                 
@@ -898,12 +1147,16 @@ def rename_image():
                         if not os.path.exists(full_new_dir):
                             os.makedirs(full_new_dir)
                     
-                    if os.path.exists(old_full_path):
+                    if rename_alias(os.path.basename(old_full_path), os.path.basename(new_full_path)):
+                        print(f"图片别名重命名成功: {old_path} -> {new_path}")
+                    elif os.path.exists(old_full_path):
                         os.rename(old_full_path, new_full_path)
+                        rename_image_variants(old_full_path, new_full_path)
                         print(f"文件重命名成功: {old_full_path} -> {new_full_path}")
                     else:
                         print(f"原文件不存在: {old_full_path}")
                         # 即使原文件不存在，我们也更新了数据库记录
+                    forget_upload(old_path)
                 except Exception as file_error:
                     print(f"重命名物理文件失败: {file_error}")
                     # 即使文件重命名失败，也继续执行（数据库已更新）
@@ -938,6 +1191,20 @@ def health_check():
     """健康检查端点"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+@app.route('/api/stats/image-pipeline')
+def api_image_pipeline_stats():
+    """图片处理统计：原样保存的比例和估算节省的CPU时间"""
+    try:
+        conn = get_db_connection()
+        try:
+            summary = pipeline_summary(conn.cursor())
+        finally:
+            conn.close()
+        return jsonify({'success': True, **summary})
+    except Exception as e:
+        print(f"获取图片处理统计失败: {str(e)}")
+        return jsonify({'success': False, 'message': '获取统计失败'}), 500
+
 @app.errorhandler(413)
 def too_large(e):
     """处理文件过大错误"""
@@ -1007,7 +1274,16 @@ def add_test_data():
     print("测试数据添加完成")
 
 def create_app():
-    """创建Flask应用实例"""
+    """创建Flask应用实例（gunicorn部署入口）
+
+    上传图片默认交给 nginx 发送（X-Accel-Redirect，见 static/vehicle-violation.conf）；
+    环境变量 UPLOAD_SERVE_MODE=sendfile 时使用 X-Sendfile（Apache/lighttpd），=app 时由应用直接发送
+    """
+    serve_mode = os.environ.get('UPLOAD_SERVE_MODE', 'accel')
+    if serve_mode == 'accel':
+        app.config['UPLOAD_ACCEL_REDIRECT'] = UPLOAD_ACCEL_PREFIX
+    elif serve_mode == 'sendfile':
+        app.config['USE_X_SENDFILE'] = True
     return app
 
 if __name__ == '__main__':
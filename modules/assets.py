@@ -0,0 +1,164 @@
+"""
+静态资源指纹化构建与模板URL解析
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from flask import url_for, request
+
+from modules.compression import precompress_file, STATIC_IMMUTABLE_CACHE_CONTROL
+
+# 资源目录配置（相对于static目录）
+ASSET_SOURCE_DIR = 'src'    # 源文件目录，开发时直接引用
+ASSET_DIST_DIR = 'dist'     # 构建输出目录，文件名包含内容哈希
+ASSET_MANIFEST = 'manifest.json'
+ASSET_BUILDS = 'builds.json'  # 最近几次构建引用的文件，用于清理旧的指纹文件
+ASSET_KEEP_BUILDS = 3         # 保留最近几次构建的文件，仍在使用旧页面的浏览器可以继续加载
+ASSET_HASH_LENGTH = 10
+ASSET_CACHE_CONTROL = STATIC_IMMUTABLE_CACHE_CONTROL
+
+# 清单缓存：{static目录: (mtime, 清单内容)}
+_manifest_cache = {}
+
+
+def file_hash(path):
+    """计算文件内容的sha256哈希"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:ASSET_HASH_LENGTH]
+
+
+def _load_builds(dist_root):
+    """读取最近几次构建的记录 [{'built_at': 时间戳, 'files': [...]}, ...]"""
+    try:
+        with open(os.path.join(dist_root, ASSET_BUILDS), encoding='utf-8') as f:
+            builds = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return builds if isinstance(builds, list) else []
+
+
+def _write_json(path, data):
+    """原子写入JSON文件，构建期间正在运行的服务不会读到半个文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def prune_assets(dist_root, builds):
+    """删除不被保留的构建引用的指纹文件（连同预压缩文件），返回删除的文件数"""
+    keep = {ASSET_MANIFEST, ASSET_BUILDS}
+    for build in builds:
+        for name in build.get('files', []):
+            keep.update((name, name + '.gz', name + '.br'))
+
+    removed = 0
+    for root, _, files in os.walk(dist_root):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if os.path.relpath(path, dist_root).replace('\\', '/') not in keep:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def build_assets(static_folder, keep_builds=ASSET_KEEP_BUILDS):
+    """将static/src下的CSS/JS复制为带内容哈希的文件并生成清单，返回清单
+
+    旧的指纹文件不立即删除：已打开的页面和缓存的HTML仍引用它们，
+    保留最近 keep_builds 次构建引用的文件，更早的在本次构建后清理
+    """
+    source_root = os.path.join(static_folder, ASSET_SOURCE_DIR)
+    dist_root = os.path.join(static_folder, ASSET_DIST_DIR)
+    os.makedirs(dist_root, exist_ok=True)
+
+    builds = _load_builds(dist_root)
+    if not builds:
+        # 没有构建记录时把现有清单作为上一次构建，升级后第一次构建不删除正在使用的文件
+        previous = load_manifest(static_folder)
+        if previous:
+            builds.append({'built_at': int(os.path.getmtime(os.path.join(dist_root, ASSET_MANIFEST))),
+                           'files': sorted(path[len(ASSET_DIST_DIR) + 1:] for path in previous.values())})
+
+    manifest = {}
+    for root, _, files in os.walk(source_root):
+        for filename in sorted(files):
+            source_path = os.path.join(root, filename)
+            logical_name = os.path.relpath(source_path, source_root).replace('\\', '/')
+            name, ext = os.path.splitext(logical_name)
+            hashed_name = f"{name}.{file_hash(source_path)}{ext}"
+
+            # 文件名由内容决定，已存在的指纹文件无需重新生成
+            target_path = os.path.join(dist_root, hashed_name)
+            if not os.path.exists(target_path):
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                tmp_path = target_path + '.tmp'
+                shutil.copyfile(source_path, tmp_path)
+                os.replace(tmp_path, target_path)
+                precompress_file(target_path)
+
+            manifest[logical_name] = f"{ASSET_DIST_DIR}/{hashed_name}"
+
+    _write_json(os.path.join(dist_root, ASSET_MANIFEST), manifest)
+
+    # 内容没有变化的构建不计为新的一次，避免挤掉仍在使用的旧文件
+    files = sorted(path[len(ASSET_DIST_DIR) + 1:] for path in manifest.values())
+    if not builds or builds[-1].get('files') != files:
+        builds.append({'built_at': int(time.time()), 'files': files})
+    builds = builds[-keep_builds:]
+    _write_json(os.path.join(dist_root, ASSET_BUILDS), builds)
+
+    removed = prune_assets(dist_root, builds)
+    if removed:
+        print(f"清理旧构建的资源文件: {removed} 个")
+
+    return manifest
+
+
+def load_manifest(static_folder):
+    """读取资源清单，文件未变化时使用缓存"""
+    manifest_path = os.path.join(static_folder, ASSET_DIST_DIR, ASSET_MANIFEST)
+    try:
+        mtime = os.path.getmtime(manifest_path)
+    except OSError:
+        return {}
+
+    cached = _manifest_cache.get(static_folder)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"读取资源清单失败: {e}")
+        manifest = {}
+
+    _manifest_cache[static_folder] = (mtime, manifest)
+    return manifest
+
+
+def init_assets(app):
+    """注册模板函数 asset_url，并为指纹文件设置长期缓存头"""
+    dist_prefix = f"{app.static_url_path}/{ASSET_DIST_DIR}/"
+
+    @app.template_global('asset_url')
+    def asset_url(path):
+        """返回资源的指纹化URL，未构建时回退到源文件"""
+        manifest = load_manifest(app.static_folder)
+        filename = manifest.get(path, f"{ASSET_SOURCE_DIR}/{path}")
+        return url_for('static', filename=filename)
+
+    @app.after_request
+    def set_asset_cache_headers(response):
+        """指纹文件内容不变，允许浏览器永久缓存"""
+        if request.path.startswith(dist_prefix) and response.status_code in (200, 304):
+            response.headers['Cache-Control'] = ASSET_CACHE_CONTROL
+        return response
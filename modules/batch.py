@@ -0,0 +1,119 @@
+"""
+违停记录批量修改：多条删除/更新在一个事务内完成
+"""
+
+# 单次批量请求允许的最大操作数
+MAX_BATCH_OPERATIONS = 1000
+# SQLite单条语句的参数上限较低，IN查询按此大小分块
+SQL_CHUNK_SIZE = 500
+# 允许更新的字段
+UPDATABLE_FIELDS = ('violation_type', 'location', 'description')
+
+
+def build_violation_update(data):
+    """从请求数据中提取可更新字段，返回 [(字段, 值), ...]"""
+    return [(field, data[field]) for field in UPDATABLE_FIELDS if field in data]
+
+
+def validate_batch_operations(operations):
+    """校验批量操作列表，返回 (删除ID列表, {ID: 更新字段}, 错误信息)"""
+    if not isinstance(operations, list) or not operations:
+        return None, None, '请提供操作列表'
+
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return None, None, f'单次最多支持{MAX_BATCH_OPERATIONS}个操作'
+
+    delete_ids = []
+    updates = {}
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            return None, None, f'第{index + 1}个操作格式错误'
+
+        op = operation.get('op')
+        record_id = operation.get('id')
+        if not isinstance(record_id, int) or isinstance(record_id, bool):
+            return None, None, f'第{index + 1}个操作缺少有效的记录ID'
+
+        if op == 'delete':
+            delete_ids.append(record_id)
+        elif op == 'update':
+            fields = build_violation_update(operation.get('fields') or {})
+            if not fields:
+                return None, None, f'第{index + 1}个操作没有要更新的字段'
+            # 同一记录的多次更新按顺序合并
+            updates.setdefault(record_id, {}).update(fields)
+        else:
+            return None, None, f'第{index + 1}个操作类型无效: {op}'
+
+    # 将被删除的记录不需要再更新
+    deleted = set(delete_ids)
+    updates = {record_id: fields for record_id, fields in updates.items() if record_id not in deleted}
+    return list(dict.fromkeys(delete_ids)), updates, None
+
+
+def _chunks(items, size=SQL_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def apply_violation_batch(conn, delete_ids, updates):
+    """在一个事务内执行批量删除和更新
+
+    返回结果字典，其中 photo_paths 为被删除记录的图片路径，
+    由调用方在事务提交后再删除物理文件。
+    """
+    cursor = conn.cursor()
+    # 立即获取写锁，保证查询和修改在同一事务内
+    cursor.execute('BEGIN IMMEDIATE')
+
+    # 一次性查出所有待删除记录的车牌和图片
+    deleted_records = []
+    for chunk in _chunks(delete_ids):
+        placeholders = ', '.join('?' * len(chunk))
+        cursor.execute(f'SELECT id, license_plate, photo_path FROM violation_records WHERE id IN ({placeholders})', chunk)
+        deleted_records.extend(cursor.fetchall())
+
+    found_delete_ids = [record[0] for record in deleted_records]
+    cursor.executemany('DELETE FROM violation_records WHERE id = ?', [(record_id,) for record_id in found_delete_ids])
+
+    # 执行更新
+    updated_ids = []
+    for record_id, fields in updates.items():
+        columns = ', '.join(f'{field} = ?' for field in fields)
+        cursor.execute(f'UPDATE violation_records SET {columns} WHERE id = ?', list(fields.values()) + [record_id])
+        if cursor.rowcount:
+            updated_ids.append(record_id)
+
+    # 每个受影响车牌只重新统计一次
+    affected_plates = sorted({record[1] for record in deleted_records})
+    aggregates = {}
+    for chunk in _chunks(affected_plates):
+        placeholders = ', '.join('?' * len(chunk))
+        cursor.execute(f'''
+            SELECT license_plate, COUNT(*), MAX(created_at)
+            FROM violation_records
+            WHERE license_plate IN ({placeholders})
+            GROUP BY license_plate
+        ''', chunk)
+        for license_plate, count, last_violation in cursor.fetchall():
+            aggregates[license_plate] = (count, last_violation)
+
+    # 没有剩余记录的车牌删除车辆信息，其余更新违规次数和最近违规时间
+    empty_plates = [plate for plate in affected_plates if plate not in aggregates]
+    cursor.executemany('DELETE FROM vehicles WHERE license_plate = ?', [(plate,) for plate in empty_plates])
+    cursor.executemany('''
+        UPDATE vehicles
+        SET violation_count = ?, last_violation = ?
+        WHERE license_plate = ?
+    ''', [(count, last_violation, plate) for plate, (count, last_violation) in aggregates.items()])
+
+    requested_ids = set(delete_ids) | set(updates)
+    missing_ids = sorted(requested_ids - set(found_delete_ids) - set(updated_ids))
+
+    return {
+        'deleted': found_delete_ids,
+        'updated': updated_ids,
+        'not_found': missing_ids,
+        'affected_plates': affected_plates,
+        'photo_paths': [record[2] for record in deleted_records if record[2]]
+    }
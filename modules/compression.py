@@ -0,0 +1,316 @@
+"""
+响应压缩中间件与静态资源预压缩
+"""
+
+import gzip
+import mimetypes
+import os
+import zlib
+from datetime import datetime, timezone
+
+from werkzeug.http import http_date, is_resource_modified
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖，未安装时只提供gzip
+    brotli = None
+
+# 压缩配置
+COMPRESS_MIN_SIZE = 1024  # 小于该字节数的响应不压缩
+COMPRESS_GZIP_LEVEL = 6   # gzip压缩级别 (1-9)
+COMPRESS_BROTLI_QUALITY = 5  # 动态响应的brotli质量 (0-11)，兼顾CPU开销
+COMPRESS_MIMETYPES = {
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/msgpack',
+    'image/svg+xml',
+}
+# 静态资源预压缩的文件类型
+PRECOMPRESS_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg', '.txt', '.map'}
+# 静态资源缓存策略：文件名带内容哈希的永久缓存，其余每次向服务器验证
+STATIC_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STATIC_REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+
+
+def parse_accept_encoding(header):
+    """解析Accept-Encoding请求头，返回 {编码: q值}"""
+    encodings = {}
+    if not header:
+        return encodings
+
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            param = param.strip()
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        encodings[name] = q
+    return encodings
+
+
+def choose_encoding(header):
+    """根据Accept-Encoding选择最合适的压缩编码，优先brotli，其次gzip"""
+    encodings = parse_accept_encoding(header)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    best = None
+    best_q = 0.0
+    for name in candidates:
+        q = encodings.get(name, encodings.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress_body(body, encoding):
+    """按指定编码压缩响应体"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+def static_cache_control(relative, immutable_prefixes=()):
+    """返回静态文件的Cache-Control，预压缩和原文件两条路径共用"""
+    if immutable_prefixes and relative.startswith(tuple(immutable_prefixes)):
+        return STATIC_IMMUTABLE_CACHE_CONTROL
+    return STATIC_REVALIDATE_CACHE_CONTROL
+
+
+def _file_etag(path, stat, encoding):
+    """根据文件的修改时间、大小和路径生成ETag，与Flask静态文件的格式一致"""
+    checksum = zlib.adler32(os.fsencode(path)) & 0xffffffff
+    return f"{stat.st_mtime}-{stat.st_size}-{checksum}-{encoding}"
+
+
+def _set_header(headers, name, value):
+    """替换响应头中的同名字段"""
+    headers[:] = [(key, val) for key, val in headers if key.lower() != name.lower()]
+    headers.append((name, value))
+
+
+def _add_vary(headers):
+    """向响应头追加 Vary: Accept-Encoding"""
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == 'vary':
+            if 'accept-encoding' not in value.lower():
+                headers[i] = (name, f'{value}, Accept-Encoding')
+            return
+    headers.append(('Vary', 'Accept-Encoding'))
+
+
+class CompressionMiddleware:
+    """WSGI压缩中间件
+
+    - 对HTML/JSON等文本响应按Accept-Encoding进行gzip/brotli压缩
+    - 只压缩带Content-Length且超过阈值的响应，流式响应直接透传
+    - 静态资源不做实时压缩，存在预压缩文件(.br/.gz)时直接返回
+    """
+
+    def __init__(self, app, static_folder=None, static_url_path='/static', min_size=COMPRESS_MIN_SIZE,
+                 immutable_prefixes=()):
+        self.app = app
+        self.static_folder = static_folder
+        self.static_url_path = static_url_path.rstrip('/') + '/'
+        self.min_size = min_size
+        # 这些前缀下的静态文件名带内容哈希，可以永久缓存
+        self.immutable_prefixes = tuple(immutable_prefixes)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+
+        # 静态资源：只使用预压缩文件，不消耗请求时CPU
+        if path.startswith(self.static_url_path):
+            if encoding and environ.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+                precompressed = self._serve_precompressed(environ, start_response, path)
+                if precompressed is not None:
+                    return precompressed
+            return self.app(environ, self._static_start_response(start_response, path))
+
+        if not encoding or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        captured = {}
+        body_chunks = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            captured['exc_info'] = exc_info
+            if not self._should_compress(status, headers):
+                captured['passthrough'] = True
+                return start_response(status, headers, exc_info)
+            return body_chunks.append
+
+        app_iter = self.app(environ, capture_start_response)
+
+        if captured.get('passthrough') or 'status' not in captured:
+            return app_iter
+
+        try:
+            for chunk in app_iter:
+                body_chunks.append(chunk)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+        body = b''.join(body_chunks)
+        headers = list(captured['headers'])
+
+        if len(body) < self.min_size:
+            start_response(captured['status'], headers, captured['exc_info'])
+            return [body]
+
+        compressed = compress_body(body, encoding)
+        headers = [(name, value) for name, value in headers if name.lower() not in ('content-length', 'etag')]
+        headers.append(('Content-Encoding', encoding))
+        headers.append(('Content-Length', str(len(compressed))))
+        _add_vary(headers)
+
+        start_response(captured['status'], headers, captured['exc_info'])
+        return [compressed]
+
+    def _should_compress(self, status, headers):
+        """判断响应是否需要压缩"""
+        if not status.startswith('200'):
+            return False
+
+        content_type = ''
+        content_length = None
+        for name, value in headers:
+            lower = name.lower()
+            if lower == 'content-encoding':
+                return False
+            if lower == 'content-type':
+                content_type = value.split(';')[0].strip().lower()
+            elif lower == 'content-length':
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    return False
+
+        # 没有Content-Length的一般是流式响应，不缓冲
+        if content_length is None or content_length < self.min_size:
+            return False
+        return content_type in COMPRESS_MIMETYPES or content_type.endswith('+json')
+
+    def _static_start_response(self, start_response, path):
+        """原文件由Flask返回时，按与预压缩文件相同的策略覆盖Cache-Control"""
+        cache_control = static_cache_control(path[len(self.static_url_path):], self.immutable_prefixes)
+
+        def static_start_response(status, headers, exc_info=None):
+            if status.startswith(('200', '206', '304')):
+                headers = list(headers)
+                _set_header(headers, 'Cache-Control', cache_control)
+            return start_response(status, headers, exc_info)
+
+        return static_start_response
+
+    def _serve_precompressed(self, environ, start_response, path):
+        """返回构建时生成的预压缩静态文件"""
+        if not self.static_folder:
+            return None
+
+        relative = path[len(self.static_url_path):]
+        full_path = os.path.realpath(os.path.join(self.static_folder, relative))
+        static_root = os.path.realpath(self.static_folder)
+        if not full_path.startswith(static_root + os.sep) or not os.path.isfile(full_path):
+            return None
+
+        encodings = parse_accept_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encodings.get(encoding, encodings.get('*', 0.0)) <= 0:
+                continue
+            compressed_path = full_path + suffix
+            # 预压缩文件必须比原文件新，避免返回过期内容
+            if os.path.isfile(compressed_path) and os.path.getmtime(compressed_path) >= os.path.getmtime(full_path):
+                content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+                if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+                    content_type += '; charset=utf-8'
+                stat = os.stat(compressed_path)
+                etag = _file_etag(compressed_path, stat, encoding)
+                last_modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+                headers = [
+                    ('Vary', 'Accept-Encoding'),
+                    ('Cache-Control', static_cache_control(relative, self.immutable_prefixes)),
+                    ('ETag', f'"{etag}"'),
+                    ('Last-Modified', http_date(last_modified)),
+                ]
+                # 客户端缓存仍然有效时只返回304
+                if not is_resource_modified(environ, etag=etag, last_modified=last_modified):
+                    start_response('304 Not Modified', headers)
+                    return [b'']
+                headers[:0] = [
+                    ('Content-Type', content_type),
+                    ('Content-Encoding', encoding),
+                    ('Content-Length', str(stat.st_size)),
+                ]
+                start_response('200 OK', headers)
+                if environ.get('REQUEST_METHOD') == 'HEAD':
+                    return [b'']
+                f = open(compressed_path, 'rb')
+                file_wrapper = environ.get('wsgi.file_wrapper')
+                if file_wrapper:
+                    return file_wrapper(f)
+                return _iter_file(f)
+        return None
+
+
+def _iter_file(f, chunk_size=64 * 1024):
+    """按块读取文件"""
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def precompress_file(path):
+    """为单个静态文件生成.gz和.br预压缩文件，返回生成的文件数"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < COMPRESS_MIN_SIZE:
+        return 0
+
+    written = 0
+    variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+
+    for suffix, compressor in variants:
+        compressed = compressor(data)
+        # 压缩后没有变小的文件不保留
+        if len(compressed) >= len(data):
+            continue
+        target = path + suffix
+        tmp_path = target + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, target)
+        written += 1
+    return written
+
+
+def precompress_static(static_folder):
+    """遍历静态目录，为文本类资源生成预压缩文件"""
+    total = 0
+    for root, _, files in os.walk(static_folder):
+        for filename in files:
+            _, ext = os.path.splitext(filename)
+            if ext.lower() not in PRECOMPRESS_EXTENSIONS:
+                continue
+            total += precompress_file(os.path.join(root, filename))
+    return total
@@ -1,3 +1,4 @@
+import json
 import sqlite3
 import os
 from datetime import datetime
@@ -40,6 +41,14 @@ def init_db():
             )
         ''')
         
+        ensure_job_table(cursor)
+        ensure_image_store_tables(cursor)
+        ensure_image_hash_table(cursor)
+        ensure_photo_orientation_table(cursor)
+        ensure_photo_metadata_table(cursor)
+        ensure_staged_upload_table(cursor)
+        ensure_upload_session_table(cursor)
+        ensure_image_pipeline_stats_table(cursor)
         conn.commit()
         conn.close()
         print("数据库初始化完成")
@@ -55,8 +64,153 @@ def init_db():
             print("正在迁移数据库结构...")
             migrate_database(conn)
         
+        # 补充后续版本新增的表
+        ensure_job_table(cursor)
+        ensure_image_store_tables(cursor)
+        ensure_image_hash_table(cursor)
+        ensure_photo_orientation_table(cursor)
+        ensure_photo_metadata_table(cursor)
+        ensure_staged_upload_table(cursor)
+        ensure_upload_session_table(cursor)
+        ensure_image_pipeline_stats_table(cursor)
+        conn.commit()
         conn.close()
 
+def ensure_job_table(cursor):
+    """创建图片处理任务表（多个gunicorn进程通过该表共享任务状态）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+
+def ensure_image_store_tables(cursor):
+    """创建内容寻址图片存储的表
+
+    image_blobs   按SHA-256记录实际存储的文件及引用计数
+    image_aliases 对外使用的文件名（车牌_时间_序号）到内容的映射
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_blobs (
+            hash TEXT PRIMARY KEY,
+            ext TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_aliases (
+            alias TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (hash) REFERENCES image_blobs (hash)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_aliases_hash ON image_aliases (hash)')
+
+def ensure_image_hash_table(cursor):
+    """创建图片感知哈希表：dhash 为16位十六进制，band0~band3 为按16位拆分的分段，分别建立索引"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_phash (
+            hash TEXT PRIMARY KEY,
+            dhash TEXT NOT NULL,
+            band0 INTEGER NOT NULL,
+            band1 INTEGER NOT NULL,
+            band2 INTEGER NOT NULL,
+            band3 INTEGER NOT NULL,
+            FOREIGN KEY (hash) REFERENCES image_blobs (hash)
+        )
+    ''')
+    for i in range(4):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_image_phash_band{i} ON image_phash (band{i})')
+
+def ensure_photo_orientation_table(cursor):
+    """创建图片方向表：按 uploads/ 下的文件名记录顺时针旋转角度"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS photo_orientations (
+            photo TEXT PRIMARY KEY,
+            rotation INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+# 照片质量分数列（modules/image_quality.py），旧数据库升级时补充
+PHOTO_QUALITY_COLUMNS = {
+    'focus': 'REAL',
+    'brightness': 'REAL',
+    'dark_ratio': 'REAL',
+    'bright_ratio': 'REAL',
+    'plate_contrast': 'REAL',
+    'quality_flags': 'TEXT',
+}
+
+def ensure_photo_metadata_table(cursor):
+    """创建图片元数据表：上传时提取，按 uploads/ 下的文件名记录（含照片质量分数）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS photo_metadata (
+            photo TEXT PRIMARY KEY,
+            width INTEGER,
+            height INTEGER,
+            size INTEGER,
+            format TEXT,
+            taken_at TEXT,
+            gps_lat REAL,
+            gps_lon REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('PRAGMA table_info(photo_metadata)')
+    columns = {row[1] for row in cursor.fetchall()}
+    for column, column_type in PHOTO_QUALITY_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE photo_metadata ADD COLUMN {column} {column_type}')
+
+def ensure_staged_upload_table(cursor):
+    """创建预览暂存表：压缩预览的图片先放在 uploads/staging/，提交记录时才移入内容存储
+
+    dhash 为16位十六进制感知哈希，metadata 为压缩时提取的图片元数据（JSON）
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS staged_uploads (
+            name TEXT PRIMARY KEY,
+            dhash TEXT,
+            metadata TEXT,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+def ensure_upload_session_table(cursor):
+    """创建断点续传会话表：已接收的字节数以暂存文件的大小为准，这里只记录文件名和声明的总大小"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            length INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+def ensure_image_pipeline_stats_table(cursor):
+    """创建图片处理统计表：按处理方式（passthrough 原样保存 / compress 解码后重新编码）累计次数、CPU时间、像素数和字节数"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_pipeline_stats (
+            path TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0,
+            cpu_seconds REAL NOT NULL DEFAULT 0,
+            pixels INTEGER NOT NULL DEFAULT 0,
+            input_bytes INTEGER NOT NULL DEFAULT 0,
+            output_bytes INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
 def migrate_database(conn):
     """迁移旧数据库到新结构"""
     cursor = conn.cursor()
@@ -136,6 +290,173 @@ def get_db_connection():
     db_path = os.path.join(os.getcwd(), 'data', 'violations.db')
     return sqlite3.connect(db_path)
 
+# API可查询的字段及对应的SQL表达式（白名单，字段名不会直接拼接进SQL）
+VEHICLE_FIELDS = {
+    'license_plate': 'v.license_plate',
+    'violation_count': 'v.violation_count',
+    'last_violation': '(SELECT MAX(created_at) FROM violation_records WHERE license_plate = v.license_plate)',
+}
+VIOLATION_FIELDS = {
+    'id': 'id',
+    'license_plate': 'license_plate',
+    'location': 'location',
+    'violation_type': 'violation_type',
+    'description': 'description',
+    'photo_path': 'photo_path',
+    'created_at': 'created_at',
+}
+
+# 图片元数据API返回的字段
+PHOTO_METADATA_FIELDS = {
+    'record_id': 'photos.record_id',
+    'photo_path': 'photos.photo_path',
+    'width': 'm.width',
+    'height': 'm.height',
+    'size': 'm.size',
+    'format': 'm.format',
+    'taken_at': 'm.taken_at',
+    'gps_lat': 'm.gps_lat',
+    'gps_lon': 'm.gps_lon',
+    'rotation': 'COALESCE(o.rotation, 0)',
+    'focus': 'm.focus',
+    'brightness': 'm.brightness',
+    'plate_contrast': 'm.plate_contrast',
+    'quality_flags': 'm.quality_flags',
+}
+
+# 证据包清单的字段
+EVIDENCE_FIELDS = {
+    'record_id': 'photos.record_id',
+    'license_plate': 'photos.license_plate',
+    'location': 'photos.location',
+    'violation_type': 'photos.violation_type',
+    'created_at': 'photos.created_at',
+    'photo_path': 'photos.photo_path',
+    'photo': 'photos.photo',
+    'taken_at': 'm.taken_at',
+    'gps_lat': 'm.gps_lat',
+    'gps_lon': 'm.gps_lon',
+    'rotation': 'COALESCE(o.rotation, 0)',
+}
+
+def fetch_vehicle_list(cursor, fields=None):
+    """查询有违规记录的车辆列表，按最新记录时间倒序
+
+    fields 为字段名列表时只查询这些列，默认查询全部字段
+    """
+    fields = fields or tuple(VEHICLE_FIELDS)
+    columns = ', '.join(fields)
+    inner_columns = ', '.join(f'{expr} AS {name}' for name, expr in VEHICLE_FIELDS.items())
+    cursor.execute(f'''
+        SELECT {columns} FROM (
+            SELECT {inner_columns}
+            FROM vehicles v
+            WHERE v.violation_count > 0
+        )
+        ORDER BY last_violation DESC
+    ''')
+    return cursor.fetchall()
+
+def fetch_violation_records(cursor, license_plate=None, fields=None):
+    """查询违停记录，指定车牌时返回该车牌全部记录，否则返回最近100条
+
+    fields 为字段名列表时只查询这些列，默认查询全部字段
+    """
+    fields = fields or tuple(VIOLATION_FIELDS)
+    columns = ', '.join(VIOLATION_FIELDS[name] for name in fields)
+    if license_plate:
+        cursor.execute(f'''
+            SELECT {columns} 
+            FROM violation_records 
+            WHERE license_plate = ?
+            ORDER BY created_at DESC
+        ''', (license_plate,))
+    else:
+        cursor.execute(f'''
+            SELECT {columns} 
+            FROM violation_records 
+            ORDER BY created_at DESC LIMIT 100
+        ''')
+    return cursor.fetchall()
+
+def _query_record_photos(cursor, fields, conditions, params):
+    """按记录展开图片并关联元数据和方向，一次查询完成
+
+    photo_path 为JSON数组或单个路径，用 json_each 展开后按文件名关联；
+    fields 为 {字段名: SQL表达式}，可使用 photos.* / m.* / o.*
+    """
+    cursor.execute(f'''
+        WITH photos AS (
+            SELECT r.id AS record_id, r.license_plate, r.location, r.violation_type, r.created_at,
+                   p.key AS position, p.value AS photo_path,
+                   CASE WHEN instr(p.value, 'uploads/') > 0
+                        THEN substr(p.value, instr(p.value, 'uploads/') + 8) ELSE p.value END AS photo
+            FROM violation_records r,
+                 json_each(CASE WHEN json_valid(r.photo_path) AND json_type(r.photo_path) = 'array'
+                                THEN r.photo_path ELSE json_array(r.photo_path) END) p
+            WHERE {' AND '.join(conditions)} AND r.photo_path IS NOT NULL AND r.photo_path != ''
+        )
+        SELECT {', '.join(fields.values())}
+        FROM photos
+        LEFT JOIN photo_metadata m ON m.photo = photos.photo
+        LEFT JOIN photo_orientations o ON o.photo = photos.photo
+        ORDER BY photos.record_id, photos.position
+    ''', params)
+    return cursor.fetchall()
+
+def fetch_photo_metadata(cursor, record_id=None, license_plate=None):
+    """一次查询返回某条记录或某个车牌全部图片的元数据，按记录和图片顺序排列"""
+    if record_id is not None:
+        return _query_record_photos(cursor, PHOTO_METADATA_FIELDS, ['r.id = ?'], (record_id,))
+    return _query_record_photos(cursor, PHOTO_METADATA_FIELDS, ['r.license_plate = ?'], (license_plate,))
+
+def fetch_referenced_photos(cursor, photos):
+    """返回 photos（文件名集合）中仍被违停记录引用的部分：一次展开全部记录的图片后按集合比对"""
+    photos = set(photos)
+    if not photos:
+        return set()
+    rows = _query_record_photos(cursor, {'photo': 'photos.photo'}, ['1 = 1'], ())
+    return {row[0] for row in rows} & photos
+
+def fetch_record_photo_names(cursor):
+    """全部违停记录引用的图片文件名（去重，按记录顺序）"""
+    rows = _query_record_photos(cursor, {'photo': 'photos.photo'}, ['1 = 1'], ())
+    return list(dict.fromkeys(row[0] for row in rows))
+
+def rename_record_photos(cursor, renames):
+    """按 {旧文件名: 新文件名} 修改违停记录中的图片路径（在调用方事务中执行），返回修改的记录数
+
+    photo_path 保持原来的格式（JSON数组或单个路径）
+    """
+    if not renames:
+        return 0
+    rows = _query_record_photos(cursor, {'record_id': 'photos.record_id', 'photo': 'photos.photo'}, ['1 = 1'], ())
+    record_ids = sorted({record_id for record_id, photo in rows if photo in renames})
+    for record_id in record_ids:
+        cursor.execute('SELECT photo_path FROM violation_records WHERE id = ?', (record_id,))
+        photo_path = cursor.fetchone()[0]
+        is_list = photo_path.startswith('[')
+        paths = json.loads(photo_path) if is_list else [photo_path]
+        paths = [path[:len(path) - len(os.path.basename(path))] + renames.get(os.path.basename(path), os.path.basename(path))
+                 for path in paths]
+        cursor.execute('UPDATE violation_records SET photo_path = ? WHERE id = ?',
+                       (json.dumps(paths) if is_list else paths[0], record_id))
+    return len(record_ids)
+
+def fetch_evidence_photos(cursor, license_plate=None, start_date=None, end_date=None):
+    """导出证据包用：按车牌和/或记录时间范围（created_at，含两端日期）查询全部图片"""
+    conditions, params = [], []
+    if license_plate:
+        conditions.append('r.license_plate = ?')
+        params.append(license_plate)
+    if start_date:
+        conditions.append('r.created_at >= ?')
+        params.append(start_date)
+    if end_date:
+        conditions.append("r.created_at < date(?, '+1 day')")
+        params.append(end_date)
+    return _query_record_photos(cursor, EVIDENCE_FIELDS, conditions or ['1'], params)
+
 def add_test_data():
     """添加测试数据"""
     db_path = os.path.join(os.getcwd(), 'data', 'violations.db')
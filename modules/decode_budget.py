@@ -0,0 +1,117 @@
+"""
+图片解码的内存预算和大图准入控制
+
+解码前按文件头（尺寸和颜色模式）估算解码后占用的内存：JPEG 按DCT域缩放（1/2、1/4、1/8）后的尺寸计算，
+超出预算时逐级加大缩放比例；其他格式无法缩小解码，超出预算直接拒绝。
+估算超过 LARGE_DECODE_BYTES 的大图解码前需取得全机共享的名额（按文件锁实现，所有worker和压缩进程共用），
+同时进行的大图解码不超过 LARGE_DECODE_SLOTS 个，一批大图同时上传时内存占用有上限。
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from PIL import Image
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境不支持，不限制大图并发
+    fcntl = None
+
+# 单张图片解码（含颜色转换的副本）允许占用的内存
+DECODE_MEMORY_BUDGET = 512 * 1024 * 1024
+# 估算超过该值的解码需要取得大图名额
+LARGE_DECODE_BYTES = 64 * 1024 * 1024
+# 全机同时进行的大图解码数
+LARGE_DECODE_SLOTS = 2
+# 等待大图名额的最长时间（秒），超时后任务失败，客户端稍后重试
+LARGE_DECODE_TIMEOUT = 60
+LARGE_DECODE_POLL_INTERVAL = 0.2
+DECODE_SLOT_FOLDER = os.path.join(os.getcwd(), 'data', 'decode_slots')
+# JPEG DCT域缩放支持的比例
+JPEG_DRAFT_SCALES = (1, 2, 4, 8)
+# Pillow 自带的解压炸弹检查的像素上限（超过该像素数的两倍时拒绝打开），由服务进程启动时设置，见 configure_decode_limits
+DECODE_MAX_IMAGE_PIXELS = DECODE_MEMORY_BUDGET // 3
+
+os.makedirs(DECODE_SLOT_FOLDER, exist_ok=True)
+
+
+class ImageTooLarge(ValueError):
+    """图片解码后超出内存预算"""
+
+
+class DecodeBusy(RuntimeError):
+    """等待大图解码名额超时"""
+
+
+def configure_decode_limits():
+    """按内存预算设置Pillow的解压炸弹上限（进程级设置，只在服务和压缩进程启动时调用，不影响其他脚本）
+
+    超过Pillow默认上限的大尺寸JPEG可以按DCT域缩放解码，由 plan_decode 按预算决定是否处理
+    """
+    Image.MAX_IMAGE_PIXELS = DECODE_MAX_IMAGE_PIXELS
+
+
+def estimate_decode_bytes(mode, width, height):
+    """按颜色模式估算解码占用的内存，非RGB/灰度图片另计转换为RGB的副本"""
+    bands = Image.getmodebands(mode)
+    if mode not in ('RGB', 'L'):
+        bands += 3
+    return width * height * bands
+
+
+def _draft_scale(size, request):
+    """与 JpegImageFile.draft 相同的缩放比例选择：不小于请求尺寸的最大比例"""
+    scale = min(size[0] // request[0], size[1] // request[1])
+    return next(s for s in reversed(JPEG_DRAFT_SCALES) if scale >= s)
+
+
+def plan_decode(img, draft_size=None):
+    """按内存预算确定解码方式，返回 (草稿尺寸, 估算字节数)
+
+    img 为只读取了文件头的 Image；draft_size 为期望的草稿尺寸（None 表示完整解码）。
+    JPEG 超出预算时逐级请求更小的草稿尺寸，返回的草稿尺寸可能小于期望值；无法满足预算时抛出 ImageTooLarge
+    """
+    width, height = img.size
+    scale = _draft_scale(img.size, draft_size) if draft_size and img.format == 'JPEG' else 1
+    while True:
+        decode_bytes = estimate_decode_bytes(img.mode, -(-width // scale), -(-height // scale))
+        if decode_bytes <= DECODE_MEMORY_BUDGET:
+            break
+        if img.format != 'JPEG' or scale == JPEG_DRAFT_SCALES[-1]:
+            raise ImageTooLarge(f'图片尺寸过大（{width}x{height}），解码需要约{decode_bytes / 1024 / 1024:.0f}MB内存，'
+                                f'超过{DECODE_MEMORY_BUDGET / 1024 / 1024:.0f}MB限制')
+        scale *= 2
+
+    if scale > 1:
+        draft_size = (width // scale, height // scale)
+    return draft_size, decode_bytes
+
+
+@contextmanager
+def decode_slot(decode_bytes):
+    """大图解码期间持有全机共享的名额，小图直接执行
+
+    名额为 DECODE_SLOT_FOLDER 下的文件锁，进程退出时由系统释放，不会因进程崩溃而泄漏
+    """
+    if decode_bytes < LARGE_DECODE_BYTES or fcntl is None:
+        yield
+        return
+
+    deadline = time.monotonic() + LARGE_DECODE_TIMEOUT
+    while True:
+        for slot in range(LARGE_DECODE_SLOTS):
+            f = open(os.path.join(DECODE_SLOT_FOLDER, f"slot{slot}.lock"), 'a+b')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            try:
+                yield
+            finally:
+                f.close()
+            return
+        if time.monotonic() > deadline:
+            raise DecodeBusy('服务器正在处理其他大尺寸图片，请稍后重试')
+        time.sleep(LARGE_DECODE_POLL_INTERVAL)
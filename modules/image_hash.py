@@ -0,0 +1,106 @@
+"""
+图片感知哈希（dHash）与近似重复查找
+
+dHash 为64位：缩小到9x8灰度后比较相邻像素的明暗，缩放、重新编码后的同一画面哈希基本不变。
+哈希按16位分为4段分别建立索引（多索引哈希）：汉明距离不超过 d 的两个哈希，
+至少有一段的距离不超过 d // 4，查询时只需按各段的近邻值做索引查找，再逐个核对完整距离。
+"""
+
+from itertools import combinations
+
+from PIL import Image
+
+DHASH_SIZE = 8                 # 哈希边长，64位
+DHASH_BANDS = 4                # 分段数，每段16位
+DHASH_BAND_BITS = DHASH_SIZE * DHASH_SIZE // DHASH_BANDS
+# 汉明距离不超过该值视为近似重复（同一画面的缩放/重新编码一般在此范围内）；
+# 取7时每段只需查找距离不超过1的17个值
+DUPLICATE_MAX_DISTANCE = 7
+# 近似重复的处理方式：'flag' 提交成功并在结果中标记，'reject' 拒绝提交
+DUPLICATE_PHOTO_POLICY = 'flag'
+
+
+def dhash(img):
+    """计算图片的64位dHash"""
+    small = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.LANCZOS, reducing_gap=3.0)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(DHASH_SIZE):
+        offset = row * (DHASH_SIZE + 1)
+        for col in range(DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def file_dhash(path):
+    """计算图片文件的dHash，无法识别为图片时返回None"""
+    try:
+        with Image.open(path) as img:
+            # 只需要很小的尺寸，JPEG直接以1/8比例解码
+            img.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))
+            return dhash(img)
+    except Exception as e:
+        print(f"计算感知哈希失败: {str(e)}")
+        return None
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def dhash_bands(value):
+    """按高位到低位拆分为 DHASH_BANDS 段"""
+    mask = (1 << DHASH_BAND_BITS) - 1
+    return [(value >> (DHASH_BAND_BITS * (DHASH_BANDS - 1 - i))) & mask for i in range(DHASH_BANDS)]
+
+
+def _band_neighbors(band, radius):
+    """与 band 的汉明距离不超过 radius 的所有段值"""
+    neighbors = [band]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(DHASH_BAND_BITS), distance):
+            flipped = band
+            for bit in bits:
+                flipped ^= 1 << bit
+            neighbors.append(flipped)
+    return neighbors
+
+
+def save_dhash(cursor, digest, value):
+    """记录内容文件的感知哈希（在调用方事务中执行）"""
+    cursor.execute(
+        f'INSERT OR IGNORE INTO image_phash (hash, dhash, {", ".join(f"band{i}" for i in range(DHASH_BANDS))}) '
+        f'VALUES (?, ?, {", ".join("?" * DHASH_BANDS)})',
+        (digest, f"{value:016x}", *dhash_bands(value))
+    )
+
+
+def find_similar(cursor, value, max_distance=DUPLICATE_MAX_DISTANCE, alias_prefix=None):
+    """查找感知哈希与 value 的距离不超过 max_distance 的图片
+
+    alias_prefix 限定别名前缀（例如某个车牌），返回按距离排序的 [(别名, 距离)]
+    """
+    radius = max_distance // DHASH_BANDS
+    queries = []
+    params = []
+    for i, band in enumerate(dhash_bands(value)):
+        neighbors = _band_neighbors(band, radius)
+        queries.append(f'SELECT hash, dhash FROM image_phash WHERE band{i} IN ({", ".join("?" * len(neighbors))})')
+        params.extend(neighbors)
+
+    sql = f'''
+        SELECT a.alias, p.dhash FROM ({" UNION ".join(queries)}) p
+        JOIN image_aliases a ON a.hash = p.hash
+    '''
+    if alias_prefix:
+        sql += ' WHERE substr(a.alias, 1, ?) = ?'
+        params.extend([len(alias_prefix), alias_prefix])
+    cursor.execute(sql, params)
+
+    matches = []
+    for alias, stored in cursor.fetchall():
+        distance = hamming(value, int(stored, 16))
+        if distance <= max_distance:
+            matches.append((alias, distance))
+    matches.sort(key=lambda match: (match[1], match[0]))
+    return matches
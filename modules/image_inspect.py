@@ -0,0 +1,201 @@
+"""
+只读取文件头的图片检查：按魔数识别格式，读取尺寸，JPEG另外读取量化表估算质量，不解码像素
+
+JPEG 逐个读取标记段直到扫描数据开始（SOS），通常只需读取文件开头的几十KB。
+copy_jpeg 按标记段复制JPEG并去掉EXIF等附加段，图像数据原样复制（无损）。
+"""
+
+import os
+import struct
+
+# 格式魔数（文件开头的字节）
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+]
+
+# 基线JPEG标准亮度量化表（质量50，按Z字形顺序排列，与文件中DQT的顺序一致）
+STANDARD_LUMINANCE_TABLE = [
+    16, 11, 12, 14, 12, 10, 16, 14, 13, 14, 18, 17, 16, 19, 24, 40,
+    26, 24, 22, 22, 24, 49, 35, 37, 29, 40, 58, 51, 61, 60, 57, 51,
+    56, 55, 64, 72, 92, 78, 64, 68, 87, 69, 55, 56, 80, 109, 81, 87,
+    95, 98, 103, 104, 103, 62, 77, 113, 121, 112, 100, 120, 92, 101, 103, 99,
+]
+
+# 帧起始标记（SOF0~SOF15，除去DHT/JPG/DAC），SOF2 及以上为渐进式/无损等
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# 不带长度字段的标记
+STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7}
+SOS_MARKER = 0xDA
+DQT_MARKER = 0xDB
+# 文件头最多读取的字节数，超过时放弃检查
+MAX_HEADER_BYTES = 1024 * 1024
+# 去除附加段时保留的段：ICC色彩配置（APP2）和 Adobe 色彩变换（APP14），影响颜色显示
+KEEP_APP_SEGMENTS = {0xE2: b'ICC_PROFILE\x00', 0xEE: b'Adobe'}
+COPY_CHUNK_SIZE = 256 * 1024
+
+
+def sniff_format(head):
+    """按文件开头的字节识别格式，无法识别时返回None"""
+    for signature, fmt in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return fmt
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def estimate_jpeg_quality(table):
+    """按亮度量化表相对标准表的缩放比例反推IJG质量（1~100）"""
+    scale = sum(value * 100 / standard for value, standard in zip(table, STANDARD_LUMINANCE_TABLE)) / len(table)
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, round(quality)))
+
+
+def _read_jpeg_header(stream, info):
+    """读取JPEG标记段到SOS为止，填入尺寸、分量数、是否渐进式、质量估算和其他附加段的字节数"""
+    stream.read(2)
+    info.update(progressive=False, components=None, quality=None, metadata_bytes=0)
+    luminance_table = None
+    while stream.tell() < MAX_HEADER_BYTES:
+        byte = stream.read(1)
+        if not byte:
+            return False
+        if byte != b'\xff':
+            continue
+        marker = stream.read(1)
+        while marker == b'\xff':
+            marker = stream.read(1)
+        if not marker:
+            return False
+        marker = marker[0]
+        if marker in STANDALONE_MARKERS:
+            continue
+
+        length_bytes = stream.read(2)
+        if len(length_bytes) < 2:
+            return False
+        length = struct.unpack('>H', length_bytes)[0] - 2
+        if marker == SOS_MARKER:
+            break
+
+        segment = stream.read(length)
+        if len(segment) < length:
+            return False
+        if marker in SOF_MARKERS:
+            info['height'], info['width'] = struct.unpack('>HH', segment[1:5])
+            info['components'] = segment[5]
+            info['progressive'] = marker not in (0xC0, 0xC1)
+        elif marker == DQT_MARKER and luminance_table is None:
+            # 第一个表（Tq=0）通常为亮度表，Pq=1 时为16位精度
+            precision, table_id = segment[0] >> 4, segment[0] & 0x0F
+            if table_id == 0:
+                if precision:
+                    luminance_table = list(struct.unpack('>64H', segment[1:129]))
+                else:
+                    luminance_table = list(segment[1:65])
+        elif 0xE1 <= marker <= 0xEF or marker == 0xFE:
+            info['metadata_bytes'] += length + 4
+
+    if luminance_table:
+        info['quality'] = estimate_jpeg_quality(luminance_table)
+    return 'width' in info
+
+
+def _read_other_header(fmt, head, info):
+    """PNG/GIF/BMP/WEBP 的尺寸位于文件开头的固定位置"""
+    if fmt == 'PNG' and head[12:16] == b'IHDR':
+        info['width'], info['height'] = struct.unpack('>II', head[16:24])
+    elif fmt == 'GIF':
+        info['width'], info['height'] = struct.unpack('<HH', head[6:10])
+    elif fmt == 'BMP':
+        width, height = struct.unpack('<ii', head[18:26])
+        info['width'], info['height'] = width, abs(height)
+    elif fmt == 'WEBP':
+        chunk = head[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', head[26:30])
+            info['width'], info['height'] = width & 0x3FFF, height & 0x3FFF
+        elif chunk == b'VP8L':
+            bits = int.from_bytes(head[21:25], 'little')
+            info['width'], info['height'] = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        elif chunk == b'VP8X':
+            info['width'] = int.from_bytes(head[24:27], 'little') + 1
+            info['height'] = int.from_bytes(head[27:30], 'little') + 1
+    return 'width' in info
+
+
+def inspect_image(stream):
+    """检查图片文件头，返回 {'format', 'width', 'height', 'size', ...}，无法识别时返回None
+
+    JPEG 另有 'quality'（估算值）、'progressive'、'components'、'metadata_bytes'（EXIF等附加段的字节数）。
+    只读取文件头，读写位置恢复为调用前的位置。
+    """
+    stream = getattr(stream, 'stream', stream)
+    position = stream.tell()
+    try:
+        stream.seek(0, os.SEEK_END)
+        info = {'size': stream.tell()}
+        stream.seek(0)
+        head = stream.read(32)
+        info['format'] = sniff_format(head)
+        if info['format'] == 'JPEG':
+            stream.seek(0)
+            found = _read_jpeg_header(stream, info)
+        elif info['format']:
+            found = _read_other_header(info['format'], head, info)
+        else:
+            found = False
+        return info if found else None
+    except (OSError, struct.error, IndexError) as e:
+        print(f"读取图片文件头失败: {str(e)}")
+        return None
+    finally:
+        stream.seek(position)
+
+
+def copy_jpeg(source, output, strip_metadata=True):
+    """复制JPEG到 output，返回写入的字节数
+
+    strip_metadata 时去掉 APP1~APP15（EXIF/XMP/IPTC等，保留ICC和Adobe段）和注释段，
+    从扫描数据（SOS）开始原样复制，不解码也不重新编码
+    """
+    source = getattr(source, 'stream', source)
+    source.seek(0)
+    if not strip_metadata:
+        written = 0
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+            output.write(chunk)
+            written += len(chunk)
+        return written
+
+    if source.read(2) != b'\xff\xd8':
+        raise ValueError('不是JPEG文件')
+    output.write(b'\xff\xd8')
+    written = 2
+    while True:
+        marker = source.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            raise ValueError('JPEG标记段损坏')
+        if marker[1] in STANDALONE_MARKERS:
+            output.write(marker)
+            written += 2
+            continue
+        length_bytes = source.read(2)
+        segment = source.read(struct.unpack('>H', length_bytes)[0] - 2)
+        code = marker[1]
+        keep_prefix = KEEP_APP_SEGMENTS.get(code)
+        keep = not (0xE1 <= code <= 0xEF or code == 0xFE) or (keep_prefix is not None and segment.startswith(keep_prefix))
+        if keep:
+            output.write(marker + length_bytes + segment)
+            written += 4 + len(segment)
+        if code == SOS_MARKER:
+            break
+
+    for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b''):
+        output.write(chunk)
+        written += len(chunk)
+    return written
@@ -0,0 +1,282 @@
+"""
+图片压缩任务：在独立的进程池中执行Pillow压缩，请求处理进程只负责提交任务和查询结果
+
+预览任务的结果放在暂存目录，每个进程另有一个后台线程定期清理超时未提交的暂存图片和未完成的断点续传上传
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from modules.db import get_db_connection
+from modules.decode_budget import configure_decode_limits
+from modules.image_processor import get_upload_size
+from modules.image_store import alias_stem, stage_compressed_upload, store_compressed_upload, sweep_staging, temp_path
+from modules.resumable_upload import sweep_uploads
+from modules.utils import delete_image_files
+
+# 每个gunicorn worker各自拥有一个进程池，总进程数约为 workers × 该值
+COMPRESS_POOL_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# 每个worker允许排队+执行中的任务数，超出后直接拒绝（背压）
+MAX_PENDING_JOBS = COMPRESS_POOL_WORKERS * 4
+# 队列已满时建议客户端的重试间隔（秒）
+JOB_RETRY_AFTER = 3
+# 超过该时间仍未完成的任务视为失败（例如所在worker已重启）
+JOB_STALE_SECONDS = 600
+# 已完成任务记录的保留时间
+JOB_RETENTION_SECONDS = 3600
+# 暂存图片清理间隔（秒）
+STAGING_SWEEP_INTERVAL = 600
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING_JOBS)
+_sweeper_pid = None
+
+
+class JobQueueFull(Exception):
+    """任务队列已满"""
+
+
+def _get_executor():
+    """按进程延迟创建进程池（gunicorn preload_app 下master进程不创建）"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=COMPRESS_POOL_WORKERS, initializer=configure_decode_limits)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _reset_executor():
+    """进程池异常退出后丢弃，下次提交时重新创建"""
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _sweep_staging_loop():
+    while True:
+        time.sleep(STAGING_SWEEP_INTERVAL)
+        try:
+            sweep_staging()
+            sweep_uploads()
+        except Exception as e:
+            print(f"清理暂存图片失败: {str(e)}")
+
+
+def _ensure_staging_sweeper():
+    """按进程启动暂存图片清理线程（与进程池一样不在master进程中创建）"""
+    global _sweeper_pid
+    with _executor_lock:
+        if _sweeper_pid != os.getpid():
+            threading.Thread(target=_sweep_staging_loop, name='staging-sweeper', daemon=True).start()
+            _sweeper_pid = os.getpid()
+
+
+def _compress_upload(source_path, name_stem, ext, staged=False):
+    """在进程池中执行：压缩暂存的上传文件，预览图片放入暂存目录，其他存入内容存储，返回 (文件名, 压缩后大小)"""
+    conn = get_db_connection()
+    try:
+        with open(source_path, 'rb') as source:
+            if staged:
+                return stage_compressed_upload(conn, source, ext)
+            return store_compressed_upload(conn, source, ext, name_stem)
+    finally:
+        conn.close()
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
+
+def _finish_job(job_id, status, result=None, error=None):
+    """写入任务结果"""
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            UPDATE image_jobs SET status = ?, result = ?, error = ?, finished_at = ?
+            WHERE id = ?
+        ''', (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _on_job_done(job_id, kind, original_size, record_id, future):
+    """任务完成回调：整理结果，违停记录的图片在此时写回数据库"""
+    _pending.release()
+    try:
+        filename, compressed_size = future.result()
+        photo_path = os.path.join('uploads', filename).replace('\\', '/')
+
+        if kind == 'violation_photo':
+            photo_path_json = json.dumps([photo_path])
+            conn = get_db_connection()
+            try:
+                cursor = conn.execute('UPDATE violation_records SET photo_path = ? WHERE id = ?',
+                                      (photo_path_json, record_id))
+                updated = cursor.rowcount
+                conn.commit()
+            finally:
+                conn.close()
+            if not updated:
+                # 压缩期间记录已被删除，释放刚存入的图片，避免留下无人引用的别名和内容文件
+                delete_image_files(photo_path_json)
+                _finish_job(job_id, 'failed', error=f"违规记录 {record_id} 已不存在，图片已丢弃")
+                print(f"图片处理任务完成但记录已删除: {job_id} -> {filename}")
+                return
+            result = {'record_id': record_id, 'photo_path': photo_path_json}
+        else:
+            compression_ratio = (1 - compressed_size / original_size) * 100 if original_size else 0
+            result = {
+                'original_size': f"{original_size / 1024 / 1024:.2f}MB",
+                'compressed_size': f"{compressed_size / 1024:.1f}KB",
+                'compression_ratio': f"{compression_ratio:.1f}%",
+                'compressed_path': photo_path,
+                'compressed_url': f"/{photo_path}",
+                'filename': filename
+            }
+        _finish_job(job_id, 'done', result=result)
+        print(f"图片处理任务完成: {job_id} -> {filename}")
+    except Exception as e:
+        if isinstance(e, BrokenProcessPool):
+            _reset_executor()
+        print(f"图片处理任务失败: {job_id} - {str(e)}")
+        _finish_job(job_id, 'failed', error=str(e))
+
+
+def _purge_old_jobs(cursor):
+    """清理过期的任务记录"""
+    cursor.execute('DELETE FROM image_jobs WHERE created_at < ?', (time.time() - JOB_RETENTION_SECONDS,))
+
+
+def _register(source_path, filename, original_size, license_plate, kind, record_id, conn):
+    """登记任务记录（调用方已占用队列名额），返回待启动的任务；传入 conn 时写入调用方的事务，否则立即提交"""
+    job_id = uuid.uuid4().hex
+    job_conn = conn or get_db_connection()
+    try:
+        cursor = job_conn.cursor()
+        _purge_old_jobs(cursor)
+        cursor.execute('INSERT INTO image_jobs (id, kind, status, created_at) VALUES (?, ?, ?, ?)',
+                       (job_id, kind, 'queued', time.time()))
+        if conn is None:
+            job_conn.commit()
+    finally:
+        if conn is None:
+            job_conn.close()
+
+    _, ext = os.path.splitext(filename or '')
+    return {'job_id': job_id, 'source_path': source_path, 'name_stem': alias_stem(license_plate), 'ext': ext.lower(),
+            'kind': kind, 'original_size': original_size, 'record_id': record_id}
+
+
+def start_compress_job(job):
+    """把已登记（且已提交）的任务交给进程池，任务完成后删除源文件，返回任务ID
+
+    交给进程池失败时任务记为失败并释放名额、删除源文件，不抛出异常（调用方的事务已经提交）
+    """
+    staged = job['kind'] == 'preview'
+    args = (_compress_upload, job['source_path'], job['name_stem'], job['ext'], staged)
+    try:
+        try:
+            future = _get_executor().submit(*args)
+        except BrokenProcessPool:
+            _reset_executor()
+            future = _get_executor().submit(*args)
+    except Exception as e:
+        print(f"图片处理任务提交失败: {job['job_id']} - {str(e)}")
+        cancel_compress_job(job)
+        _finish_job(job['job_id'], 'failed', error='图片处理任务提交失败')
+        return job['job_id']
+
+    if staged:
+        _ensure_staging_sweeper()
+    future.add_done_callback(lambda f: _on_job_done(job['job_id'], job['kind'], job['original_size'], job['record_id'], f))
+    return job['job_id']
+
+
+def cancel_compress_job(job):
+    """放弃未交给进程池的任务：释放队列名额并删除源文件（任务记录随调用方的事务回滚）"""
+    _pending.release()
+    if os.path.exists(job['source_path']):
+        os.remove(job['source_path'])
+
+
+def prepare_compress_job(file, license_plate=None, kind='preview', record_id=None, conn=None):
+    """复制上传内容并登记压缩任务，返回待启动的任务，队列已满时抛出 JobQueueFull
+
+    传入 conn 时任务记录写入调用方的事务：调用方提交后再调用 start_compress_job，
+    提交失败时调用 cancel_compress_job，进程池不会处理未提交的任务
+    """
+    if not _pending.acquire(blocking=False):
+        raise JobQueueFull('图片处理繁忙，请稍后重试')
+
+    source_path = None
+    try:
+        original_size = get_upload_size(file)
+        source_path = temp_path('.upload')
+        stream = getattr(file, 'stream', file)
+        stream.seek(0)
+        with open(source_path, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        return _register(source_path, file.filename, original_size, license_plate, kind, record_id, conn)
+    except Exception:
+        _pending.release()
+        if source_path and os.path.exists(source_path):
+            os.remove(source_path)
+        raise
+
+
+def submit_compress_job(file, license_plate=None, kind='preview', record_id=None):
+    """提交图片压缩任务，返回任务ID
+
+    上传内容先写入存储的临时目录，由进程池压缩后存入内容存储（预览任务放入暂存目录）。队列已满时抛出 JobQueueFull。
+    """
+    return start_compress_job(prepare_compress_job(file, license_plate, kind, record_id))
+
+
+def submit_compress_path(source_path, filename, license_plate=None, kind='preview', record_id=None):
+    """提交已在磁盘上的上传文件（例如断点续传接收完整的文件），返回任务ID
+
+    提交成功后文件归任务所有，处理完即删除；队列已满或登记失败时抛出异常，文件保持不变
+    """
+    if not _pending.acquire(blocking=False):
+        raise JobQueueFull('图片处理繁忙，请稍后重试')
+
+    try:
+        job = _register(source_path, filename, os.path.getsize(source_path), license_plate, kind, record_id, None)
+    except Exception:
+        _pending.release()
+        raise
+    return start_compress_job(job)
+
+
+def get_job(job_id):
+    """查询任务状态，不存在时返回None"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT kind, status, result, error, created_at FROM image_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+    finally:
+        conn.close()
+
+    if not row:
+        return None
+
+    kind, status, result, error, created_at = row
+    if status == 'queued' and time.time() - created_at > JOB_STALE_SECONDS:
+        status, error = 'failed', '任务已超时'
+
+    return {
+        'job_id': job_id,
+        'kind': kind,
+        'status': status,
+        'result': json.loads(result) if result else None,
+        'error': error
+    }
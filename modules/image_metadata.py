@@ -0,0 +1,95 @@
+"""
+图片元数据：上传时一次性提取尺寸、大小、格式、EXIF拍摄时间和GPS，按 uploads/ 下的文件名存入数据库，
+查询时不再打开图片文件
+"""
+
+import os
+from datetime import datetime
+
+from PIL import Image
+
+from modules.db import get_db_connection
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_DATETIME = 0x0132
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+
+
+def _gps_degrees(values, ref):
+    """度分秒转换为十进制度数，南纬/西经为负"""
+    if not values or len(values) != 3:
+        return None
+    degrees, minutes, seconds = (float(value) for value in values)
+    result = degrees + minutes / 60 + seconds / 3600
+    if ref in ('S', 'W'):
+        result = -result
+    return round(result, 6)
+
+
+def read_exif_metadata(img):
+    """从已打开的图片读取EXIF拍摄时间和GPS坐标（只读取文件头，不解码像素）"""
+    metadata = {'taken_at': None, 'gps_lat': None, 'gps_lon': None}
+    try:
+        exif = img.getexif()
+        taken_at = exif.get_ifd(EXIF_IFD).get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+        if taken_at:
+            metadata['taken_at'] = datetime.strptime(str(taken_at).strip('\x00 '), '%Y:%m:%d %H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+
+        gps = exif.get_ifd(GPS_IFD)
+        if gps:
+            metadata['gps_lat'] = _gps_degrees(gps.get(GPS_LATITUDE), gps.get(GPS_LATITUDE_REF))
+            metadata['gps_lon'] = _gps_degrees(gps.get(GPS_LONGITUDE), gps.get(GPS_LONGITUDE_REF))
+    except Exception as e:
+        print(f"读取EXIF信息失败: {str(e)}")
+    return metadata
+
+
+def photo_metadata(path, metadata=None):
+    """整理保存后图片的元数据
+
+    metadata 为压缩时已得到的尺寸/格式/EXIF信息，未提供时读取文件头；字节数总是取保存后的文件
+    """
+    if metadata is None:
+        metadata = {'width': None, 'height': None, 'format': None}
+        try:
+            with Image.open(path) as img:
+                metadata.update(width=img.width, height=img.height, format=img.format)
+                metadata.update(read_exif_metadata(img))
+        except Exception as e:
+            print(f"读取图片信息失败: {str(e)}")
+    return dict(metadata, size=os.path.getsize(path))
+
+
+def save_metadata(cursor, filename, metadata):
+    """记录图片元数据（在调用方事务中执行）"""
+    cursor.execute('''
+        INSERT OR REPLACE INTO photo_metadata (photo, width, height, size, format, taken_at, gps_lat, gps_lon,
+                                               focus, brightness, dark_ratio, bright_ratio, plate_contrast, quality_flags)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (filename, metadata.get('width'), metadata.get('height'), metadata.get('size'), metadata.get('format'),
+          metadata.get('taken_at'), metadata.get('gps_lat'), metadata.get('gps_lon'),
+          metadata.get('focus'), metadata.get('brightness'), metadata.get('dark_ratio'), metadata.get('bright_ratio'),
+          metadata.get('plate_contrast'), metadata.get('quality_flags')))
+
+
+def record_metadata(filename, metadata):
+    """使用独立连接记录图片元数据"""
+    conn = get_db_connection()
+    try:
+        save_metadata(conn.cursor(), filename, metadata)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def rename_metadata(cursor, old_name, new_name):
+    """图片改名时保留元数据（在调用方事务中执行）"""
+    cursor.execute('UPDATE photo_metadata SET photo = ? WHERE photo = ?', (new_name, old_name))
+
+
+def forget_metadata(cursor, filenames):
+    """删除图片时清除元数据（在调用方事务中执行）"""
+    cursor.executemany('DELETE FROM photo_metadata WHERE photo = ?',
+                       [(os.path.basename(name),) for name in filenames])
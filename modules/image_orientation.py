@@ -0,0 +1,61 @@
+"""
+图片方向：旋转只记录在数据库中（按 uploads/ 下的文件名），原图保持不变，
+访问时返回按方向生成并缓存的派生图片，重复旋转只需一次数据库写入
+"""
+
+import os
+
+from modules.db import get_db_connection
+
+VALID_ROTATIONS = (0, 90, 180, 270)
+
+
+def normalize_rotation(angle):
+    """将角度规范到 0/90/180/270（顺时针），不是90的整数倍时抛出 ValueError"""
+    angle = int(angle)
+    if angle % 90:
+        raise ValueError('旋转角度必须是90的整数倍')
+    return angle % 360
+
+
+def get_rotation(filename, cursor=None):
+    """图片当前的旋转角度，未旋转过时为0"""
+    conn = None
+    if cursor is None:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT rotation FROM photo_orientations WHERE photo = ?', (filename,))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    finally:
+        if conn:
+            conn.close()
+
+
+def rotate_photo(filename, angle):
+    """在当前方向上再顺时针旋转 angle 度，返回旋转后的角度"""
+    angle = normalize_rotation(angle)
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO photo_orientations (photo, rotation) VALUES (?, ?)
+            ON CONFLICT(photo) DO UPDATE SET rotation = (rotation + excluded.rotation) % 360,
+                                             updated_at = CURRENT_TIMESTAMP
+        ''', (filename, angle))
+        conn.commit()
+        return get_rotation(filename, cursor)
+    finally:
+        conn.close()
+
+
+def rename_rotation(cursor, old_name, new_name):
+    """图片改名时保留方向（在调用方事务中执行）"""
+    cursor.execute('UPDATE photo_orientations SET photo = ? WHERE photo = ?', (new_name, old_name))
+
+
+def forget_rotations(cursor, filenames):
+    """删除图片时清除方向记录（在调用方事务中执行）"""
+    cursor.executemany('DELETE FROM photo_orientations WHERE photo = ?',
+                       [(os.path.basename(name),) for name in filenames])
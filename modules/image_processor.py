@@ -1,18 +1,51 @@
 import os
 import re
 import json
+import math
+import shutil
+import tempfile
+import time
+import uuid
 from datetime import datetime
-from werkzeug.utils import secure_filename
-from PIL import Image
+from flask import Request
+from PIL import Image, ImageOps, features
 import io
 
+from modules.decode_budget import plan_decode, decode_slot, ImageTooLarge, DecodeBusy
+from modules.image_hash import dhash, DHASH_SIZE
+from modules.image_inspect import inspect_image, copy_jpeg
+from modules.image_metadata import read_exif_metadata
+from modules.image_quality import QUALITY_FRAME_SIZE, QUALITY_POLICY, QUALITY_SCORING, PhotoRejected, check_quality, score_photo
+
 # 图片上传配置
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
 COMPRESSED_MAX_WIDTH = 1200  # 压缩后最大宽度
 COMPRESSED_MAX_HEIGHT = 900   # 压缩后最大高度
-COMPRESSED_QUALITY = 85       # JPEG压缩质量 (1-100)
+COMPRESSED_QUALITY = 85       # JPEG压缩质量 (1-100)，按字节预算编码时为最高质量
+COMPRESSED_TARGET_BYTES = 400 * 1024  # 压缩后字节预算
+BUDGET_TOLERANCE = 0.1        # 落在预算的90%~100%之间即停止查找
+BUDGET_MIN_QUALITY = 40       # 预算查找的最低质量，低于该质量时改为缩小尺寸
+BUDGET_MIN_WIDTH = 600        # 缩小尺寸的下限
+BUDGET_MIN_HEIGHT = 450
+# 在JPEG之外额外生成的图片格式（按优先级排列，当前Pillow不支持的格式自动跳过）
+IMAGE_VARIANT_FORMATS = [fmt for fmt in ('avif', 'webp') if features.check(fmt)]
+IMAGE_VARIANT_OPTIONS = {
+    'avif': {'quality': 55, 'speed': 8},
+    'webp': {'quality': 80, 'method': 4},
+}
+IMAGE_VARIANT_MIMETYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 最大文件大小50MB
+# 旋转后的派生图片缓存目录，原图保持不变
+ROTATED_FOLDER = os.path.join(UPLOAD_FOLDER, 'rotated')
+ROTATED_QUALITY = 95
+RESIZE_REDUCING_GAP = 3.0     # 分级缩放：先按整数倍快速缩小，再用LANCZOS精细缩放
+UPLOAD_SPOOL_THRESHOLD = 1024 * 1024  # 上传文件超过1MB后写入临时文件，不再驻留内存
+# 已在尺寸和字节预算内、质量估算不超过该值的JPEG原样保存，不解码也不重新编码
+PASSTHROUGH_ENABLED = True
+PASSTHROUGH_MAX_QUALITY = 92
+# 原样保存时无损去掉EXIF/XMP等附加段（与重新编码的输出一致，不保留GPS等信息）
+PASSTHROUGH_STRIP_METADATA = True
 
 # 确保上传目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -22,98 +55,372 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def compress_image(image_file, max_width=COMPRESSED_MAX_WIDTH, max_height=COMPRESSED_MAX_HEIGHT, quality=COMPRESSED_QUALITY):
-    """优化的图片压缩函数，专门处理大文件"""
+class SpooledUploadRequest(Request):
+    """上传文件按阈值落盘的请求类
+
+    小文件保留在内存中，超过 UPLOAD_SPOOL_THRESHOLD 后自动转存到临时文件，
+    后续的大小检查和解码都直接基于该文件进行。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_THRESHOLD)
+
+
+def get_upload_size(file):
+    """获取上传文件大小，只移动读写位置，不读取文件内容"""
+    stream = getattr(file, 'stream', file)
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+def save_image_variants(img, base_path, reference_size):
+    """为已编码的图片生成WebP/AVIF等同级文件（base_path + '.webp'），返回生成的格式列表
+
+    只保留比原文件小的格式；生成失败不影响原文件。
+    """
+    saved = []
+    for fmt in IMAGE_VARIANT_FORMATS:
+        variant_path = f"{base_path}.{fmt}"
+        tmp_path = f"{variant_path}.part"
+        try:
+            with open(tmp_path, 'wb') as f:
+                img.save(f, format=fmt.upper(), **IMAGE_VARIANT_OPTIONS.get(fmt, {}))
+                size = f.tell()
+            if size < reference_size:
+                os.replace(tmp_path, variant_path)
+                saved.append(fmt)
+                print(f"生成{fmt.upper()}格式: {size / 1024:.1f}KB")
+            elif os.path.exists(variant_path):
+                os.remove(variant_path)
+        except Exception as e:
+            print(f"生成{fmt.upper()}格式失败: {str(e)}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return saved
+
+def image_variant_paths(path):
+    """返回图片已存在的其他格式文件路径 {格式: 路径}"""
+    return {fmt: f"{path}.{fmt}" for fmt in IMAGE_VARIANT_MIMETYPES if os.path.exists(f"{path}.{fmt}")}
+
+def choose_image_variant(path, accept_mimetypes):
+    """根据Accept选择客户端支持的最优格式，返回 (格式, 路径)，没有可用格式时返回 (None, None)
+
+    只认明确声明的类型，*/* 或 image/* 不代表支持新格式
+    """
+    accepted = {value for value, q in accept_mimetypes if q > 0}
+    for fmt in IMAGE_VARIANT_MIMETYPES:
+        if IMAGE_VARIANT_MIMETYPES[fmt] in accepted:
+            variant_path = f"{path}.{fmt}"
+            if os.path.isfile(variant_path):
+                return fmt, variant_path
+    return None, None
+
+def remove_image_variants(path):
+    """删除图片的其他格式文件及旋转后的缓存"""
+    for variant_path in image_variant_paths(path).values():
+        os.remove(variant_path)
+    remove_rotated_images(path)
+
+def rename_image_variants(old_path, new_path):
+    """图片重命名时同步重命名其他格式文件（旋转缓存按文件名生成，直接丢弃）"""
+    for fmt, variant_path in image_variant_paths(old_path).items():
+        os.rename(variant_path, f"{new_path}.{fmt}")
+    remove_rotated_images(old_path)
+
+def _rotated_cache_path(path, rotation):
+    _, ext = os.path.splitext(path)
+    return os.path.join(ROTATED_FOLDER, f"{os.path.basename(path)}.r{rotation}{ext}")
+
+def rotated_image_path(path, rotation):
+    """返回图片顺时针旋转 rotation 度后的派生文件路径，首次请求时生成并缓存
+
+    原图不修改；原图比缓存新时重新生成
+    """
+    cache_path = _rotated_cache_path(path, rotation)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return cache_path
+
+    transpose = {90: Image.Transpose.ROTATE_270, 180: Image.Transpose.ROTATE_180, 270: Image.Transpose.ROTATE_90}[rotation]
+    os.makedirs(ROTATED_FOLDER, exist_ok=True)
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.part"
     try:
-        # 读取文件内容并检查大小
-        file_content = image_file.read()
-        original_size = len(file_content)
+        with Image.open(path) as img:
+            save_format = img.format
+            # 未压缩保存的原图可能带有EXIF方向，先按EXIF摆正
+            rotated = ImageOps.exif_transpose(img).transpose(transpose)
+            save_kwargs = {'quality': ROTATED_QUALITY} if save_format == 'JPEG' else {}
+            rotated.save(tmp_path, format=save_format, **save_kwargs)
+        os.replace(tmp_path, cache_path)
+        print(f"生成旋转缓存: {os.path.basename(cache_path)}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return cache_path
+
+def remove_rotated_images(path):
+    """删除图片旋转后的缓存文件"""
+    for rotation in (90, 180, 270):
+        cache_path = _rotated_cache_path(path, rotation)
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+class _ByteCounter:
+    """只统计写入字节数的文件对象，试编码时不保留编码数据"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+def _jpeg_size(img, quality):
+    """试编码，返回按指定质量编码后的字节数
+
+    试编码使用默认哈夫曼表的基线JPEG，不做 optimize/progressive 的额外扫描，
+    开销约为最终编码的1/4。
+    """
+    counter = _ByteCounter()
+    img.save(counter, format='JPEG', quality=quality)
+    return counter.size
+
+def fit_jpeg_budget(img, target_bytes, max_quality=COMPRESSED_QUALITY, min_quality=BUDGET_MIN_QUALITY, tolerance=BUDGET_TOLERANCE,
+                    max_quality_size=None):
+    """在内存中搜索满足字节预算的编码参数，返回 (图像, 质量, 预计字节数)
+
+    先对质量做二分查找，落在 [预算×(1-tolerance), 预算] 内即停止；
+    最低质量仍超出预算时按"体积与像素数近似成正比"缩小尺寸后重新查找。
+    查找只做低开销的试编码（见 _jpeg_size），调用方按选定的质量做一次优化编码。
+    max_quality_size 为调用方已得到的当前图像最高质量优化编码大小：用它与同质量试编码的
+    比例换算试编码大小（质量越低优化节省越多，换算结果偏大，不会超出预算）。
+    """
+    lower_bound = target_bytes * (1 - tolerance)
+    # 优化编码与试编码的大小比例，没有最高质量的优化编码大小时按1估算
+    ratio = 1.0
+    if max_quality_size is not None:
+        if max_quality_size <= target_bytes:
+            return img, max_quality, max_quality_size
+        ratio = min(max_quality_size / _jpeg_size(img, max_quality), 1.0)
+
+    def estimate(quality):
+        return int(_jpeg_size(img, quality) * ratio)
+
+    while True:
+        # 最高质量已满足预算时不再降低质量
+        size = max_quality_size if max_quality_size is not None else estimate(max_quality)
+        max_quality_size = None
+        if size <= target_bytes:
+            return img, max_quality, size
+
+        min_size = estimate(min_quality)
+        if min_size <= target_bytes:
+            # lo 满足预算，hi 超出预算
+            lo, hi = min_quality, max_quality
+            best_quality, best_size = min_quality, min_size
+            while hi - lo > 1 and best_size < lower_bound:
+                mid = (lo + hi) // 2
+                size = estimate(mid)
+                if size <= target_bytes:
+                    lo, best_quality, best_size = mid, mid, size
+                else:
+                    hi = mid
+            return img, best_quality, best_size
+
+        # 已缩小到最小尺寸，只能以最低质量输出
+        if img.width <= BUDGET_MIN_WIDTH and img.height <= BUDGET_MIN_HEIGHT:
+            return img, min_quality, min_size
+
+        scale = max(math.sqrt(target_bytes / min_size) * 0.95, 0.5)
+        new_width = max(int(img.width * scale), min(BUDGET_MIN_WIDTH, img.width))
+        new_height = max(int(img.height * scale), min(BUDGET_MIN_HEIGHT, img.height))
+        if (new_width, new_height) == img.size:
+            return img, min_quality, min_size
+        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        print(f"最低质量仍超出预算，缩小尺寸至: {new_width}x{new_height}")
+
+def passthrough_eligible(header, max_width=COMPRESSED_MAX_WIDTH, max_height=COMPRESSED_MAX_HEIGHT,
+                         target_bytes=COMPRESSED_TARGET_BYTES):
+    """文件头检查结果（inspect_image）是否已符合存储要求，可以原样保存"""
+    if not PASSTHROUGH_ENABLED or not header or header['format'] != 'JPEG':
+        return False
+    if header['components'] not in (1, 3) or header['quality'] is None:
+        return False
+    if header['width'] > max_width or header['height'] > max_height or header['quality'] > PASSTHROUGH_MAX_QUALITY:
+        return False
+    stored_size = header['size'] - header['metadata_bytes'] if PASSTHROUGH_STRIP_METADATA else header['size']
+    return not target_bytes or stored_size <= target_bytes
+
+def storage_profile():
+    """存储要求，供浏览器在上传前按同样的尺寸和字节预算缩小编码（符合要求的JPEG服务端原样保存）"""
+    return {
+        'format': 'image/jpeg',
+        'max_width': COMPRESSED_MAX_WIDTH,
+        'max_height': COMPRESSED_MAX_HEIGHT,
+        'target_bytes': COMPRESSED_TARGET_BYTES,
+        'quality': COMPRESSED_QUALITY,
+        'min_quality': BUDGET_MIN_QUALITY,
+        'max_quality': PASSTHROUGH_MAX_QUALITY,
+        'passthrough': PASSTHROUGH_ENABLED,
+    }
+
+def _passthrough_image(image_file, header, output, info, quality_policy):
+    """原样保存符合要求的JPEG（可去掉附加段），感知哈希和质量分数按DCT域缩放解码的图像计算"""
+    if info is not None or (QUALITY_SCORING and quality_policy == 'reject'):
+        image_file.seek(0)
+        with Image.open(image_file) as img:
+            exif_metadata = read_exif_metadata(img)
+            # 评分需要 QUALITY_FRAME_SIZE 大小的图像，只计算哈希时以1/8比例解码
+            img.draft('L', QUALITY_FRAME_SIZE if QUALITY_SCORING else (DHASH_SIZE * 8, DHASH_SIZE * 8))
+            scores = score_photo(img)
+            check_quality(scores, quality_policy)
+            if info is not None:
+                info['dhash'] = dhash(img)
+                info['metadata'] = dict(exif_metadata, width=header['width'], height=header['height'], format='JPEG',
+                                        **scores)
         image_file.seek(0)
+
+    img_io = output if output is not None else io.BytesIO()
+    stored_size = copy_jpeg(image_file, img_io, strip_metadata=PASSTHROUGH_STRIP_METADATA)
+    img_io.seek(0)
+    print(f"图片已符合存储要求（{header['width']}x{header['height']}，质量约{header['quality']}），"
+          f"原样保存: {stored_size / 1024:.1f}KB")
+    return img_io, stored_size
+
+def compress_image(image_file, max_width=COMPRESSED_MAX_WIDTH, max_height=COMPRESSED_MAX_HEIGHT, quality=COMPRESSED_QUALITY,
+                   draft=True, output=None, target_bytes=COMPRESSED_TARGET_BYTES, variant_base=None, info=None,
+                   passthrough=True, quality_policy=QUALITY_POLICY):
+    """优化的图片压缩函数，专门处理大文件
+
+    draft=True 时JPEG在解码阶段直接缩小到接近目标尺寸，大图无需解码全部像素
+    output 为可读写的文件对象时编码结果直接写入其中，否则返回内存文件
+    target_bytes 为输出字节预算，quality 为允许的最高质量；target_bytes=None 时按 quality 固定质量编码
+    variant_base 为JPEG最终路径时，用同一帧额外生成WebP/AVIF文件
+    info 为字典时写入已缩小图像的感知哈希 info['dhash']，以及输出图片的尺寸/格式和原图的EXIF信息 info['metadata']，
+    本次的处理方式和CPU时间 info['pipeline']
+    passthrough=True 时先只读取文件头，已符合尺寸、字节预算和质量要求的JPEG原样保存（不生成WebP/AVIF）
+    已缩小的图像在编码前评分，分数并入 info['metadata']；quality_policy 为 'reject' 时不合格的照片抛出 PhotoRejected
+    """
+    try:
+        cpu_start = time.process_time()
+        # 检查文件大小（不读取内容）
+        image_file = getattr(image_file, 'stream', image_file)
+        image_file.seek(0)
+        original_size = get_upload_size(image_file)
         
         print(f"开始处理图片，原始大小: {original_size / 1024 / 1024:.2f}MB")
         
-        # 根据文件大小调整压缩策略
-        if original_size > 20 * 1024 * 1024:  # 大于20MB
-            print("检测到大文件，使用激进压缩策略")
-            max_width = min(800, max_width)
-            max_height = min(600, max_height)
-            quality = min(60, quality)
-        elif original_size > 10 * 1024 * 1024:  # 大于10MB
-            print("检测到中等大文件，使用标准压缩策略")
-            max_width = min(1000, max_width)
-            max_height = min(750, max_height)
-            quality = min(70, quality)
-        elif original_size > 5 * 1024 * 1024:  # 大于5MB
-            print("检测到较大文件，使用温和压缩策略")
-            quality = min(80, quality)
-        
-        # 使用内存文件打开图片，避免磁盘IO
-        img_io_temp = io.BytesIO(file_content)
-        img = Image.open(img_io_temp)
+        header = inspect_image(image_file) if passthrough else None
+        if passthrough_eligible(header, max_width, max_height, target_bytes):
+            img_io, stored_size = _passthrough_image(image_file, header, output, info, quality_policy)
+            if info is not None:
+                info['pipeline'] = {'path': 'passthrough', 'cpu_seconds': time.process_time() - cpu_start,
+                                    'pixels': header['width'] * header['height'],
+                                    'input_bytes': original_size, 'output_bytes': stored_size}
+            return img_io, 'jpeg'
+        
+        # 直接从上传流解码，不复制文件内容
+        img = Image.open(image_file)
         
         original_width, original_height = img.size
         print(f"原始图片尺寸: {original_width}x{original_height}")
         
+        # 压缩输出不保留EXIF，拍摄时间和GPS从原图读取
+        exif_metadata = read_exif_metadata(img) if info is not None else None
+        
         # 计算压缩比例
         ratio = min(max_width / original_width, max_height / original_height, 1)
+        new_width = int(original_width * ratio)
+        new_height = int(original_height * ratio)
         
-        if ratio < 1:
-            new_width = int(original_width * ratio)
-            new_height = int(original_height * ratio)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            print(f"压缩后图片尺寸: {new_width}x{new_height}")
+        # 按解码后占用的内存确定草稿尺寸，超出预算时拒绝（不保存原图）
+        draft_size, decode_bytes = plan_decode(img, (new_width, new_height) if ratio < 1 and draft else None)
         
-        # 转换为RGB模式
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
+        # JPEG使用DCT域缩放（1/2、1/4、1/8）解码，得到不小于目标尺寸的图像（超出内存预算时可能更小）
+        if draft_size and img.format == 'JPEG':
+            img.draft('RGB', draft_size)
+            if img.size != (original_width, original_height):
+                print(f"JPEG草稿模式解码尺寸: {img.size[0]}x{img.size[1]}")
+            if img.width < new_width or img.height < new_height:
+                new_width, new_height = img.size
         
-        # 创建输出内存文件
-        img_io = io.BytesIO()
+        # 大图解码到编码完成期间持有全机共享的名额
+        with decode_slot(decode_bytes):
+            if (new_width, new_height) != img.size:
+                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=RESIZE_REDUCING_GAP)
+                print(f"压缩后图片尺寸: {new_width}x{new_height}")
         
-        # 强制使用JPEG格式以获得最佳压缩
-        save_format = 'JPEG'
-        save_kwargs = {'quality': quality, 'optimize': True, 'progressive': True}
+            # 转换为RGB模式
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGB')
         
-        img.save(img_io, format=save_format, **save_kwargs)
-        img_io.seek(0)
+            # 不合格的照片在编码前拒绝
+            scores = score_photo(img)
+            check_quality(scores, quality_policy)
         
-        # 计算压缩结果
-        compressed_size = len(img_io.getvalue())
-        compression_ratio = (1 - compressed_size / original_size) * 100
+            if info is not None:
+                info['dhash'] = dhash(img)
         
-        print(f"压缩后大小: {compressed_size / 1024:.1f}KB")
-        print(f"压缩率: {compression_ratio:.1f}%")
+            # 编码输出：调用方提供的文件或内存文件
+            img_io = output if output is not None else io.BytesIO()
         
-        # 如果压缩后仍然太大，进行二次压缩
-        if compressed_size > 3 * 1024 * 1024:  # 仍然大于3MB
-            print("进行二次压缩...")
-            img_io.seek(0)
-            img = Image.open(img_io)
-            
-            # 更激进的二次压缩
-            new_width = min(600, int(original_width * 0.4))
-            new_height = min(450, int(original_height * 0.4))
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            img_io_final = io.BytesIO()
-            img.save(img_io_final, format='JPEG', quality=40, optimize=True, progressive=True)
-            img_io_final.seek(0)
-            
-            final_size = len(img_io_final.getvalue())
-            final_compression = (1 - final_size / original_size) * 100
-            print(f"二次压缩后大小: {final_size / 1024:.1f}KB")
-            print(f"总压缩率: {final_compression:.1f}%")
+            # 强制使用JPEG格式以获得最佳压缩
+            save_format = 'JPEG'
+            save_kwargs = {'quality': quality, 'optimize': True, 'progressive': True}
+        
+            img.save(img_io, format=save_format, **save_kwargs)
+            compressed_size = img_io.tell()
+        
+            # 超出字节预算时在内存中查找质量（必要时缩小尺寸），再重新编码一次
+            if target_bytes and compressed_size > target_bytes:
+                img, quality, _ = fit_jpeg_budget(img, target_bytes, max_quality=quality, max_quality_size=compressed_size)
+                print(f"超出字节预算 {target_bytes / 1024:.0f}KB，选定质量: {quality}，尺寸: {img.size[0]}x{img.size[1]}")
             
-            return img_io_final, 'jpeg'
+                img_io.seek(0)
+                img_io.truncate()
+                save_kwargs['quality'] = quality
+                img.save(img_io, format=save_format, **save_kwargs)
+                compressed_size = img_io.tell()
+        
+            # 计算压缩结果
+            img_io.seek(0)
+            compression_ratio = (1 - compressed_size / original_size) * 100
         
-        return img_io, 'jpeg'
+            print(f"压缩后大小: {compressed_size / 1024:.1f}KB")
+            print(f"压缩率: {compression_ratio:.1f}%")
         
+            if variant_base:
+                save_image_variants(img, variant_base, compressed_size)
+        
+            if info is not None:
+                info['metadata'] = dict(exif_metadata, width=img.width, height=img.height, format=save_format, **scores)
+                # 尺寸本就在范围内的图片单独统计，用于估算原样保存节省的CPU时间
+                info['pipeline'] = {'path': 'reencode' if ratio == 1 else 'compress',
+                                    'cpu_seconds': time.process_time() - cpu_start,
+                                    'pixels': original_width * original_height,
+                                    'input_bytes': original_size, 'output_bytes': compressed_size}
+        
+            return img_io, 'jpeg'
+        
+    except (ImageTooLarge, DecodeBusy, PhotoRejected):
+        raise
+    except Image.DecompressionBombError as e:
+        # 上限由 configure_decode_limits 设置，未设置（MAX_IMAGE_PIXELS 为 None）时不会触发；异常信息中带有实际像素数和上限
+        raise ImageTooLarge(f"图片像素数过多: {e}")
     except Exception as e:
         print(f"图片压缩失败: {str(e)}")
         return None, None
 
 def rename_compressed_file(old_file_path, license_plate, index):
-    """根据车牌号重命名已压缩的文件"""
+    """根据车牌号重命名已压缩的文件
+
+    只用于迁移到内容存储之前直接存放在 uploads/ 下的文件（image_store.rename_upload 的兼容分支），新上传不再经过这里
+    """
     try:
         # 获取文件扩展名
         filename = os.path.basename(old_file_path)
@@ -133,8 +440,9 @@ def rename_compressed_file(old_file_path, license_plate, index):
         new_filename = f"{plate_prefix}_{timestamp}_{index+1:02d}{ext}"
         new_file_path = os.path.join(os.path.dirname(old_file_path), new_filename)
         
-        # 重命名文件
+        # 重命名文件（包括其他格式）
         os.rename(old_file_path, new_file_path)
+        rename_image_variants(old_file_path, new_file_path)
         
         # 返回新的相对路径
         return os.path.join('uploads', new_filename).replace('\\', '/')
@@ -143,78 +451,15 @@ def rename_compressed_file(old_file_path, license_plate, index):
         print(f"重命名压缩文件失败: {str(e)}")
         return None
 
-def save_uploaded_file(file, license_plate=None):
-    """保存上传的文件并返回文件路径（带压缩和错误处理）"""
-    if file and file.filename and allowed_file(file.filename):
-        try:
-            # 检查文件大小
-            file_content = file.read()
-            file_size = len(file_content)
-            file.seek(0)
-            
-            if file_size > MAX_FILE_SIZE:
-                print(f"文件过大: {file_size / 1024 / 1024:.2f}MB，超过限制")
-                return None
-            
-            # 获取文件扩展名
-            filename = secure_filename(file.filename)
-            _, ext = os.path.splitext(filename)
-            
-            # 生成时间戳（包含毫秒以避免重复）
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]  # 精确到毫秒
-            
-            # 生成车牌号前缀（使用完整车牌号）
-            if license_plate and license_plate.strip():
-                # 确保车牌号可以完整地作为文件名的一部分
-                plate_prefix = "".join(c for c in license_plate if c.isalnum() or c in "._-")
-            else:
-                plate_prefix = "UNKNOWN"
-            
-            # 查找同车牌同时间的最大序号
-            base_name = f"{plate_prefix}_{timestamp.split('_')[0]}_{timestamp.split('_')[1]}"  # 使用秒级时间戳作为基础
-            max_seq = 0
-            
-            # 扫描uploads目录查找相同前缀的文件
-            for existing_file in os.listdir(UPLOAD_FOLDER):
-                if existing_file.startswith(base_name):
-                    # 提取序号部分
-                    parts = existing_file.replace(base_name, '').split('_')
-                    if len(parts) >= 2 and parts[1].split('.')[0].isdigit():
-                        seq = int(parts[1].split('.')[0])
-                        max_seq = max(max_seq, seq)
-            
-            # 生成新的序号
-            seq = max_seq + 1
-            
-            # 使用秒级时间戳作为文件名基础
-            file_timestamp = f"{timestamp.split('_')[0]}_{timestamp.split('_')[1]}"
-            
-            # 尝试压缩图片
-            img_io, save_format = compress_image(file)
-            
-            if img_io:
-                # 压缩成功，使用压缩后的图片
-                compressed_filename = f"{plate_prefix}_{file_timestamp}_{seq:02d}.{save_format}"
-                file_path = os.path.join(UPLOAD_FOLDER, compressed_filename)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(img_io.getvalue())
-                
-                print(f"图片压缩并保存成功: {compressed_filename}")
-                return os.path.join('uploads', compressed_filename).replace('\\', '/')
-            else:
-                # 压缩失败，保存原始文件
-                original_filename = f"{plate_prefix}_{file_timestamp}_{seq:02d}{ext}"
-                file_path = os.path.join(UPLOAD_FOLDER, original_filename)
-                
-                with open(file_path, 'wb') as f:
-                    f.write(file_content)
-                
-                print(f"图片保存成功（未压缩）: {original_filename}")
-                return os.path.join('uploads', original_filename).replace('\\', '/')
-                
-        except Exception as e:
-            print(f"保存图片失败: {str(e)}")
-            return None
-    
-    return None
\ No newline at end of file
+def write_compressed(file, output_path, variant_base=None, info=None):
+    """压缩上传文件并写入 output_path，返回保存格式；压缩失败时按原格式写入原文件并返回None"""
+    with open(output_path, 'w+b') as output:
+        img_io, save_format = compress_image(file, output=output, variant_base=variant_base, info=info)
+        if not img_io:
+            # 压缩失败，保存原始文件
+            output.seek(0)
+            output.truncate()
+            stream = getattr(file, 'stream', file)
+            stream.seek(0)
+            shutil.copyfileobj(stream, output)
+    return save_format if img_io else None
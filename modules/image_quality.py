@@ -0,0 +1,118 @@
+"""
+照片质量评分：在已缩小的图像上用NumPy计算清晰度（拉普拉斯方差）、曝光（亮度直方图）和车牌区域对比度，
+分数随图片元数据按文件名存入数据库；QUALITY_POLICY 为 'reject' 时模糊、过暗、过曝或看不清车牌的照片上传时即被拒绝
+
+评分在不超过 QUALITY_FRAME_SIZE 的灰度图上进行（压缩输出按整数倍缩小，原样保存的JPEG以DCT域缩放解码），
+分数与原图分辨率无关，每张图片只增加几毫秒
+"""
+
+try:
+    import numpy as np
+except ImportError:  # numpy为可选依赖，未安装时不评分，也不拒绝上传
+    np = None
+
+# 是否评分
+QUALITY_SCORING_ENABLED = True
+QUALITY_SCORING = QUALITY_SCORING_ENABLED and np is not None
+# 评分使用的灰度图最大尺寸
+QUALITY_FRAME_SIZE = (600, 450)
+# 质量不合格的处理方式：'flag' 照常保存并在元数据中标记，'reject' 上传时拒绝
+QUALITY_POLICY = 'flag'
+# 拉普拉斯方差低于该值视为模糊
+QUALITY_MIN_FOCUS = 60.0
+# 亮度不超过 DARK_LEVEL 的像素为欠曝，不低于 BRIGHT_LEVEL 的为过曝
+QUALITY_DARK_LEVEL = 16
+QUALITY_BRIGHT_LEVEL = 240
+# 平均亮度（0~255）低于/高于该值，或欠曝/过曝像素超过该比例时标记
+QUALITY_MIN_BRIGHTNESS = 40
+QUALITY_MAX_BRIGHTNESS = 220
+QUALITY_MAX_CLIPPED_RATIO = 0.5
+# 车牌区域：水平梯度（字符笔画）最密集的窗口，按 QUALITY_PLATE_STRIDE 像素步长查找
+QUALITY_PLATE_WINDOW = (96, 32)
+QUALITY_PLATE_STRIDE = 8
+# 车牌区域亮度5%~95%分位差低于该值时视为看不清车牌
+QUALITY_MIN_PLATE_CONTRAST = 40.0
+QUALITY_FLAG_LABELS = {
+    'blurry': '模糊',
+    'dark': '过暗',
+    'overexposed': '过曝',
+    'low_contrast': '车牌区域对比度低',
+}
+
+
+class PhotoRejected(ValueError):
+    """照片质量不合格，按策略拒绝上传"""
+
+
+def quality_frame(img):
+    """评分使用的灰度图：按整数倍缩小到 QUALITY_FRAME_SIZE 以内"""
+    factor = max(-(-img.width // QUALITY_FRAME_SIZE[0]), -(-img.height // QUALITY_FRAME_SIZE[1]), 1)
+    frame = img.reduce(factor) if factor > 1 else img
+    return frame if frame.mode == 'L' else frame.convert('L')
+
+
+def _plate_contrast(pixels):
+    """车牌区域对比度：用积分图找出水平梯度总和最大的窗口，取窗口内亮度的5%~95%分位差"""
+    height, width = pixels.shape
+    window_width, window_height = min(QUALITY_PLATE_WINDOW[0], width - 1), min(QUALITY_PLATE_WINDOW[1], height)
+    gradient = np.abs(np.diff(pixels, axis=1))
+    integral = np.zeros((height + 1, width), dtype=np.int64)
+    integral[1:, 1:] = gradient.cumsum(axis=0).cumsum(axis=1)
+    sums = (integral[window_height:, window_width:] - integral[:-window_height, window_width:]
+            - integral[window_height:, :-window_width] + integral[:-window_height, :-window_width])
+    sums = sums[::QUALITY_PLATE_STRIDE, ::QUALITY_PLATE_STRIDE]
+    row, col = np.unravel_index(np.argmax(sums), sums.shape)
+    top, left = row * QUALITY_PLATE_STRIDE, col * QUALITY_PLATE_STRIDE
+    low, high = np.percentile(pixels[top:top + window_height, left:left + window_width + 1], (5, 95))
+    return float(high - low)
+
+
+def score_photo(img):
+    """计算照片质量分数，返回可并入图片元数据的字典；未启用评分或图像过小时返回空字典
+
+    quality_flags 为不合格项（逗号分隔，见 QUALITY_FLAG_LABELS），全部合格时为空字符串
+    """
+    if not QUALITY_SCORING or img.width < 3 or img.height < 3:
+        return {}
+    pixels = np.asarray(quality_frame(img), dtype=np.int16)
+
+    # 清晰度：4邻域拉普拉斯算子响应的方差，失焦或抖动的照片边缘平缓，方差很小
+    laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                 - 4 * pixels[1:-1, 1:-1])
+    focus = float(laplacian.var())
+
+    # 曝光：亮度直方图的均值和两端截断比例
+    histogram = np.bincount(pixels.ravel(), minlength=256)
+    total = pixels.size
+    brightness = float(np.dot(histogram, np.arange(256)) / total)
+    dark_ratio = float(histogram[:QUALITY_DARK_LEVEL + 1].sum() / total)
+    bright_ratio = float(histogram[QUALITY_BRIGHT_LEVEL:].sum() / total)
+
+    plate_contrast = _plate_contrast(pixels)
+
+    flags = []
+    if focus < QUALITY_MIN_FOCUS:
+        flags.append('blurry')
+    if brightness < QUALITY_MIN_BRIGHTNESS or dark_ratio > QUALITY_MAX_CLIPPED_RATIO:
+        flags.append('dark')
+    if brightness > QUALITY_MAX_BRIGHTNESS or bright_ratio > QUALITY_MAX_CLIPPED_RATIO:
+        flags.append('overexposed')
+    if plate_contrast < QUALITY_MIN_PLATE_CONTRAST:
+        flags.append('low_contrast')
+
+    return {
+        'focus': round(focus, 1),
+        'brightness': round(brightness, 1),
+        'dark_ratio': round(dark_ratio, 4),
+        'bright_ratio': round(bright_ratio, 4),
+        'plate_contrast': round(plate_contrast, 1),
+        'quality_flags': ','.join(flags),
+    }
+
+
+def check_quality(scores, policy=QUALITY_POLICY):
+    """按策略处理不合格的照片（scores 为 score_photo 的结果）：'reject' 时抛出 PhotoRejected"""
+    flags = scores.get('quality_flags')
+    if policy == 'reject' and flags:
+        labels = '、'.join(QUALITY_FLAG_LABELS.get(flag, flag) for flag in flags.split(','))
+        raise PhotoRejected(f"照片质量不合格（{labels}），请重新拍摄")
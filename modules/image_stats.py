@@ -0,0 +1,52 @@
+"""
+图片处理统计：compress_image 在 info['pipeline'] 中返回本次的处理方式和CPU时间，存储时累计到数据库
+（压缩在进程池中执行，各进程的计数通过数据库汇总）
+"""
+
+# passthrough 原样保存；reencode 尺寸在范围内但仍需重新编码；compress 缩小尺寸后编码
+PIPELINE_PATHS = ('passthrough', 'reencode', 'compress')
+
+
+def record_pipeline_run(cursor, run):
+    """累计一次处理（在调用方事务中执行），run 为 compress_image 返回的 info['pipeline']"""
+    if not run:
+        return
+    cursor.execute('''
+        INSERT INTO image_pipeline_stats (path, count, cpu_seconds, pixels, input_bytes, output_bytes)
+        VALUES (?, 1, ?, ?, ?, ?)
+        ON CONFLICT(path) DO UPDATE SET count = count + 1,
+                                         cpu_seconds = cpu_seconds + excluded.cpu_seconds,
+                                         pixels = pixels + excluded.pixels,
+                                         input_bytes = input_bytes + excluded.input_bytes,
+                                         output_bytes = output_bytes + excluded.output_bytes
+    ''', (run['path'], run['cpu_seconds'], run['pixels'], run['input_bytes'], run['output_bytes']))
+
+
+def pipeline_summary(cursor):
+    """汇总原样保存的比例和节省的CPU时间
+
+    节省的CPU时间为估算值：原样保存的图片数乘以同尺寸范围内重新编码的平均CPU时间（没有样本时按缩小编码的每像素CPU时间换算），
+    再减去检查和复制实际用去的时间
+    """
+    cursor.execute('SELECT path, count, cpu_seconds, pixels, input_bytes, output_bytes FROM image_pipeline_stats')
+    stats = {path: {'count': 0, 'cpu_seconds': 0.0, 'pixels': 0, 'input_bytes': 0, 'output_bytes': 0}
+             for path in PIPELINE_PATHS}
+    for path, count, cpu_seconds, pixels, input_bytes, output_bytes in cursor.fetchall():
+        stats[path] = {'count': count, 'cpu_seconds': round(cpu_seconds, 3), 'pixels': pixels,
+                       'input_bytes': input_bytes, 'output_bytes': output_bytes}
+
+    passthrough, reencode, compress = stats['passthrough'], stats['reencode'], stats['compress']
+    total = sum(stat['count'] for stat in stats.values())
+    if reencode['count']:
+        avoided = passthrough['count'] * reencode['cpu_seconds'] / reencode['count']
+    elif compress['pixels']:
+        avoided = passthrough['pixels'] * compress['cpu_seconds'] / compress['pixels']
+    else:
+        avoided = None
+
+    return {
+        'total': total,
+        'passthrough_rate': round(passthrough['count'] / total, 4) if total else 0,
+        'estimated_cpu_seconds_saved': round(max(0.0, avoided - passthrough['cpu_seconds']), 3) if avoided is not None else None,
+        'paths': stats,
+    }
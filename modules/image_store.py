@@ -0,0 +1,564 @@
+"""
+内容寻址的图片存储
+
+文件按内容的SHA-256命名，存放在 uploads/blobs/ab/cd/<hash><ext> 分片目录中，相同内容只保存一份；
+对外仍使用"车牌_时间_序号"形式的文件名，作为别名记录在数据库中，
+违停记录中的 photo_path（uploads/<别名>）保持不变。
+
+压缩预览的图片先以随机文件名放在 uploads/staging/ 暂存目录，提交记录时才原子移入内容存储并分配别名，
+一直未提交的由 sweep_staging 按期限删除。
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+from werkzeug.security import safe_join
+
+from modules.db import get_db_connection, fetch_referenced_photos, rename_record_photos
+from modules.image_hash import DUPLICATE_MAX_DISTANCE, file_dhash, find_similar, save_dhash
+from modules.image_metadata import forget_metadata, photo_metadata, rename_metadata, save_metadata
+from modules.image_orientation import forget_rotations, rename_rotation
+from modules.image_stats import record_pipeline_run
+from modules.image_processor import (UPLOAD_FOLDER, IMAGE_VARIANT_FORMATS, remove_image_variants,
+                                     rename_compressed_file, rename_image_variants, write_compressed)
+
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+# 暂存目录与分片目录位于同一文件系统，写完后原子重命名
+BLOB_TMP_FOLDER = os.path.join(BLOB_FOLDER, 'tmp')
+HASH_CHUNK_SIZE = 1024 * 1024
+# 同一前缀（车牌+秒）允许的最大序号
+MAX_ALIAS_SEQUENCE = 999
+# 预览图片暂存目录，与内容存储位于同一文件系统，提交时原子重命名
+STAGING_FOLDER = os.path.join(UPLOAD_FOLDER, 'staging')
+# 预览后超过该时间（秒）仍未提交的暂存图片会被清理
+STAGING_TTL = 24 * 3600
+# 引入暂存目录之前，预览图片直接以该前缀的别名存入内容存储
+LEGACY_PREVIEW_PREFIX = 'UNKNOWN_'
+
+os.makedirs(BLOB_TMP_FOLDER, exist_ok=True)
+os.makedirs(STAGING_FOLDER, exist_ok=True)
+
+
+def blob_path(digest, ext):
+    """内容文件路径：按哈希前4位分两级目录，单个目录内的文件数保持在可控范围"""
+    return os.path.join(BLOB_FOLDER, digest[:2], digest[2:4], f"{digest}{ext}")
+
+
+def temp_path(suffix='.part'):
+    """暂存目录中的临时文件路径"""
+    return os.path.join(BLOB_TMP_FOLDER, f"{uuid.uuid4().hex}{suffix}")
+
+
+def staging_path(name):
+    """暂存图片路径，文件名不合法时返回None"""
+    return safe_join(STAGING_FOLDER, name)
+
+
+def hash_file(path):
+    """计算文件的SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def plate_prefix(license_plate=None):
+    """别名中的车牌部分"""
+    if license_plate and license_plate.strip():
+        # 确保车牌号可以完整地作为文件名的一部分
+        return "".join(c for c in license_plate if c.isalnum() or c in "._-")
+    return "UNKNOWN"
+
+
+def alias_stem(license_plate=None):
+    """别名前缀：车牌_秒级时间戳，序号在插入别名时分配"""
+    return f"{plate_prefix(license_plate)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+def _insert_alias(cursor, stem, ext, digest, start=1):
+    """从 start 开始依次尝试序号插入别名（由主键保证唯一），返回别名"""
+    for seq in range(start, MAX_ALIAS_SEQUENCE + 1):
+        alias = f"{stem}_{seq:02d}{ext}"
+        cursor.execute('INSERT OR IGNORE INTO image_aliases (alias, hash) VALUES (?, ?)', (alias, digest))
+        if cursor.rowcount:
+            return alias
+    raise ValueError(f'文件名序号已用尽: {stem}')
+
+
+def add_blob(conn, source_path, ext, stem=None, alias=None, dhash=None, metadata=None, start=1, staged_name=None):
+    """将写好的文件（连同同级的WebP/AVIF文件）存入内容存储并创建别名，返回别名
+
+    source_path 会被移走或删除。stem 用于从 start 开始自动分配序号，alias 指定完整别名（迁移旧文件时使用）。
+    dhash、metadata 为压缩时已得到的感知哈希和图片元数据，未提供时从文件读取。
+    staged_name 为移入的暂存图片文件名，其暂存记录和方向在同一事务中转移给新别名。
+    """
+    digest = hash_file(source_path)
+    size = os.path.getsize(source_path)
+    if dhash is None:
+        dhash = file_dhash(source_path)
+    metadata = photo_metadata(source_path, metadata)
+    cursor = conn.cursor()
+    # 持有写锁期间移动文件，与回收无引用文件的操作互斥
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+            INSERT INTO image_blobs (hash, ext, size, refcount) VALUES (?, ?, ?, 1)
+            ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1
+        ''', (digest, ext, size))
+        cursor.execute('SELECT ext FROM image_blobs WHERE hash = ?', (digest,))
+        stored_ext = cursor.fetchone()[0]
+
+        if alias:
+            cursor.execute('INSERT INTO image_aliases (alias, hash) VALUES (?, ?)', (alias, digest))
+        else:
+            alias = _insert_alias(cursor, stem, ext, digest, start=start)
+
+        if staged_name:
+            cursor.execute('DELETE FROM staged_uploads WHERE name = ?', (staged_name,))
+            rename_rotation(cursor, staged_name, alias)
+        if dhash is not None:
+            save_dhash(cursor, digest, dhash)
+        save_metadata(cursor, alias, metadata)
+
+        target = blob_path(digest, stored_ext)
+        if os.path.exists(target):
+            # 相同内容已存在，丢弃新文件
+            os.remove(source_path)
+            remove_image_variants(source_path)
+            print(f"图片内容已存在，复用: {digest[:12]}")
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source_path, target)
+            rename_image_variants(source_path, target)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return alias
+
+
+def store_compressed_upload(conn, file, ext, stem):
+    """压缩上传文件并存入内容存储，返回 (别名, 文件大小)"""
+    tmp_path = temp_path()
+    info = {}
+    try:
+        save_format = write_compressed(file, tmp_path, variant_base=tmp_path if IMAGE_VARIANT_FORMATS else None, info=info)
+        stored_ext = f".{save_format}" if save_format else ext
+        size = os.path.getsize(tmp_path)
+        alias = add_blob(conn, tmp_path, stored_ext, stem=stem, dhash=info.get('dhash'), metadata=info.get('metadata'))
+        record_pipeline_run(conn.cursor(), info.get('pipeline'))
+        conn.commit()
+        return alias, size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+            remove_image_variants(tmp_path)
+
+
+def stage_compressed_upload(conn, file, ext):
+    """压缩预览图片并放入暂存目录，返回 (文件名, 文件大小)
+
+    感知哈希和元数据记录在暂存表中，提交记录时由 rename_upload 移入内容存储
+    """
+    tmp_path = temp_path()
+    info = {}
+    try:
+        save_format = write_compressed(file, tmp_path, variant_base=tmp_path if IMAGE_VARIANT_FORMATS else None, info=info)
+        name = f"{uuid.uuid4().hex}{f'.{save_format}' if save_format else ext}"
+        size = os.path.getsize(tmp_path)
+        dhash = info.get('dhash')
+        conn.execute('INSERT INTO staged_uploads (name, dhash, metadata, created_at) VALUES (?, ?, ?, ?)', (
+            name, f"{dhash:016x}" if dhash is not None else None,
+            json.dumps(info['metadata'], ensure_ascii=False) if info.get('metadata') else None, time.time()
+        ))
+        record_pipeline_run(conn.cursor(), info.get('pipeline'))
+        target = staging_path(name)
+        os.replace(tmp_path, target)
+        rename_image_variants(tmp_path, target)
+        conn.commit()
+        return name, size
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+            remove_image_variants(tmp_path)
+
+
+def store_raw_upload(conn, stream, ext, stem):
+    """不压缩，按原内容存入内容存储，返回别名"""
+    tmp_path = temp_path(ext)
+    try:
+        stream.seek(0)
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        return add_blob(conn, tmp_path, ext, stem=stem)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def resolve_alias(cursor, alias):
+    """别名对应的内容文件路径，别名不存在时返回None"""
+    cursor.execute('''
+        SELECT b.hash, b.ext FROM image_aliases a
+        JOIN image_blobs b ON b.hash = a.hash
+        WHERE a.alias = ?
+    ''', (alias,))
+    row = cursor.fetchone()
+    return blob_path(*row) if row else None
+
+
+def resolve_upload(filename):
+    """将 uploads/ 下的文件名解析为实际文件路径，兼容迁移前直接存放的文件，不存在时返回None"""
+    conn = get_db_connection()
+    try:
+        path = resolve_alias(conn.cursor(), filename)
+    finally:
+        conn.close()
+
+    if path and os.path.isfile(path):
+        return path
+
+    staged_path = staging_path(filename)
+    if staged_path and os.path.isfile(staged_path):
+        return staged_path
+
+    legacy_path = safe_join(UPLOAD_FOLDER, filename)
+    if legacy_path and os.path.isfile(legacy_path):
+        return legacy_path
+    return None
+
+
+def upload_exists(filename):
+    return resolve_upload(filename) is not None
+
+
+def release_aliases(cursor, aliases):
+    """删除别名并减少引用计数（在调用方事务中执行）
+
+    返回 (已删除的别名集合, 引用计数归零的 [(hash, ext)])，归零的内容文件由 purge_blobs 在提交后删除
+    """
+    removed = set()
+    released = []
+    for alias in aliases:
+        cursor.execute('SELECT hash FROM image_aliases WHERE alias = ?', (alias,))
+        row = cursor.fetchone()
+        if not row:
+            continue
+        digest = row[0]
+        cursor.execute('DELETE FROM image_aliases WHERE alias = ?', (alias,))
+        cursor.execute('UPDATE image_blobs SET refcount = refcount - 1 WHERE hash = ?', (digest,))
+        cursor.execute('SELECT ext, refcount FROM image_blobs WHERE hash = ?', (digest,))
+        blob = cursor.fetchone()
+        if blob and blob[1] <= 0:
+            cursor.execute('DELETE FROM image_phash WHERE hash = ?', (digest,))
+            cursor.execute('DELETE FROM image_blobs WHERE hash = ?', (digest,))
+            released.append((digest, blob[0]))
+        removed.add(alias)
+    return removed, released
+
+
+def purge_blobs(conn, blobs):
+    """删除已没有引用的内容文件，返回删除的文件数
+
+    持有写锁确认期间没有被新的上传重新引用后再删除
+    """
+    if not blobs:
+        return 0
+
+    removed = 0
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for digest, ext in blobs:
+            cursor.execute('SELECT 1 FROM image_blobs WHERE hash = ?', (digest,))
+            if cursor.fetchone():
+                continue
+            path = blob_path(digest, ext)
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+            remove_image_variants(path)
+    finally:
+        # 只做了查询，结束事务释放写锁
+        conn.rollback()
+    return removed
+
+
+def _retype_alias(cursor, alias, ext):
+    """别名扩展名对应的类型与新内容不同时改用新扩展名（新名称已被占用时不改），返回别名"""
+    if mimetypes.guess_type(alias)[0] == mimetypes.guess_type(f"x{ext}")[0]:
+        return alias
+    new_alias = f"{os.path.splitext(alias)[0]}{ext}"
+    cursor.execute('SELECT 1 FROM image_aliases WHERE alias = ?', (new_alias,))
+    if cursor.fetchone():
+        return alias
+    cursor.execute('UPDATE image_aliases SET alias = ? WHERE alias = ?', (new_alias, alias))
+    rename_metadata(cursor, alias, new_alias)
+    rename_rotation(cursor, alias, new_alias)
+    return new_alias
+
+
+def replace_blobs(conn, replacements):
+    """用重新编码的文件替换内容文件（一批在同一事务中完成），返回 {旧哈希: [新内容的别名]}
+
+    replacements 为 [{'hash': 原内容哈希, 'new_hash', 'path', 'ext', 'dhash', 'metadata'}]，path 为写好的新文件
+    （连同同级的WebP/AVIF文件），会被移走或删除。原内容的全部别名改为引用新内容，别名的扩展名与新格式不符时改名
+    并同步修改违停记录中的路径；图片元数据更新尺寸、格式和字节数，拍摄时间和GPS保留原值。
+    替换期间已被删除的内容跳过，原内容文件在提交后回收。
+    """
+    replaced = {}
+    released = []
+    renames = {}
+    cursor = conn.cursor()
+    # 持有写锁期间移动文件，与回收无引用文件的操作互斥
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for item in replacements:
+            cursor.execute('SELECT ext FROM image_blobs WHERE hash = ?', (item['hash'],))
+            old = cursor.fetchone()
+            cursor.execute('SELECT alias FROM image_aliases WHERE hash = ?', (item['hash'],))
+            aliases = [row[0] for row in cursor.fetchall()]
+            if not old or not aliases or item['new_hash'] == item['hash']:
+                os.remove(item['path'])
+                remove_image_variants(item['path'])
+                continue
+
+            size = os.path.getsize(item['path'])
+            cursor.execute('''
+                INSERT INTO image_blobs (hash, ext, size, refcount) VALUES (?, ?, ?, ?)
+                ON CONFLICT(hash) DO UPDATE SET refcount = refcount + excluded.refcount
+            ''', (item['new_hash'], item['ext'], size, len(aliases)))
+            cursor.execute('SELECT ext FROM image_blobs WHERE hash = ?', (item['new_hash'],))
+            stored_ext = cursor.fetchone()[0]
+            cursor.execute('UPDATE image_aliases SET hash = ? WHERE hash = ?', (item['new_hash'], item['hash']))
+            cursor.execute('DELETE FROM image_phash WHERE hash = ?', (item['hash'],))
+            cursor.execute('DELETE FROM image_blobs WHERE hash = ?', (item['hash'],))
+            if item.get('dhash') is not None:
+                save_dhash(cursor, item['new_hash'], item['dhash'])
+
+            metadata = item.get('metadata') or {}
+            names = []
+            for alias in aliases:
+                name = _retype_alias(cursor, alias, stored_ext)
+                if name != alias:
+                    renames[alias] = name
+                # EXIF信息保留，尺寸、格式和按新图像计算的质量分数更新（未评分时保留原分数）
+                cursor.execute('''
+                    UPDATE photo_metadata SET width = ?, height = ?, size = ?, format = ?,
+                        focus = COALESCE(?, focus), brightness = COALESCE(?, brightness),
+                        dark_ratio = COALESCE(?, dark_ratio), bright_ratio = COALESCE(?, bright_ratio),
+                        plate_contrast = COALESCE(?, plate_contrast), quality_flags = COALESCE(?, quality_flags)
+                    WHERE photo = ?
+                ''', (metadata.get('width'), metadata.get('height'), size, metadata.get('format'),
+                      metadata.get('focus'), metadata.get('brightness'), metadata.get('dark_ratio'),
+                      metadata.get('bright_ratio'), metadata.get('plate_contrast'), metadata.get('quality_flags'), name))
+                names.append(name)
+
+            target = blob_path(item['new_hash'], stored_ext)
+            if os.path.exists(target):
+                os.remove(item['path'])
+                remove_image_variants(item['path'])
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(item['path'], target)
+                rename_image_variants(item['path'], target)
+            released.append((item['hash'], old[0]))
+            replaced[item['hash']] = names
+
+        rename_record_photos(cursor, renames)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    purge_blobs(conn, released)
+    return replaced
+
+
+def delete_uploads(photo_paths):
+    """删除一组图片（uploads/<文件名> 形式），返回删除的图片数
+
+    别名引用计数归零时才删除内容文件；迁移前直接存放的文件直接删除
+    """
+    photo_paths = [path for path in photo_paths if isinstance(path, str) and path]
+    if not photo_paths:
+        return 0
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        removed, released = release_aliases(cursor, [os.path.basename(path) for path in photo_paths])
+        cursor.executemany('DELETE FROM staged_uploads WHERE name = ?',
+                           [(os.path.basename(path),) for path in photo_paths])
+        forget_rotations(cursor, photo_paths)
+        forget_metadata(cursor, photo_paths)
+        conn.commit()
+        purge_blobs(conn, released)
+    finally:
+        conn.close()
+
+    deleted_files = len(removed)
+    for path in photo_paths:
+        if os.path.basename(path) in removed:
+            continue
+        # 移除可能的前导斜杠
+        file_path = os.path.join(os.getcwd(), path.lstrip('/'))
+        if not os.path.isfile(file_path):
+            file_path = staging_path(os.path.basename(path))
+        if file_path and os.path.isfile(file_path):
+            os.remove(file_path)
+            remove_image_variants(file_path)
+            deleted_files += 1
+    return deleted_files
+
+
+def find_near_duplicates(filenames, license_plate, max_distance=DUPLICATE_MAX_DISTANCE):
+    """按感知哈希查找与该车牌已有图片近似重复的上传图片
+
+    返回 [{'index': 序号, 'photo': 文件名, 'matches': [{'photo_path': ..., 'distance': ...}]}]，
+    没有感知哈希的图片（迁移前的文件、非图片）不参与比对
+    """
+    duplicates = []
+    prefix = f"{plate_prefix(license_plate)}_"
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for index, filename in enumerate(filenames):
+            cursor.execute('''
+                SELECT p.dhash FROM image_aliases a
+                JOIN image_phash p ON p.hash = a.hash
+                WHERE a.alias = ?
+                UNION ALL
+                SELECT dhash FROM staged_uploads WHERE name = ? AND dhash IS NOT NULL
+            ''', (filename, filename))
+            row = cursor.fetchone()
+            if not row:
+                continue
+            matches = [
+                {'photo_path': f"uploads/{alias}", 'distance': distance}
+                for alias, distance in find_similar(cursor, int(row[0], 16), max_distance, alias_prefix=prefix)
+                if alias not in filenames
+            ]
+            if matches:
+                duplicates.append({'index': index, 'photo': filename, 'matches': matches})
+    finally:
+        conn.close()
+    return duplicates
+
+
+def rename_alias(old_name, new_name):
+    """修改别名，别名不存在或新名称已被占用时返回False"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1 FROM image_aliases WHERE alias = ?', (new_name,))
+        if cursor.fetchone():
+            return False
+        cursor.execute('UPDATE image_aliases SET alias = ? WHERE alias = ?', (new_name, old_name))
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def rename_upload(filename, license_plate, index):
+    """提交记录时按车牌号重新命名预览阶段上传的图片，返回新的相对路径，失败时返回None
+
+    暂存目录中的图片原子移入内容存储并分配别名；已在内容存储中的只修改别名；迁移前直接存放的文件仍按原方式重命名
+    """
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT dhash, metadata FROM staged_uploads WHERE name = ?', (filename,))
+        staged = cursor.fetchone()
+        if staged:
+            _, ext = os.path.splitext(filename)
+            dhash, metadata = staged
+            alias = add_blob(conn, staging_path(filename), ext, stem=alias_stem(license_plate), start=index + 1,
+                             dhash=int(dhash, 16) if dhash else None,
+                             metadata=json.loads(metadata) if metadata else None, staged_name=filename)
+            return f"uploads/{alias}"
+
+        cursor.execute('SELECT hash FROM image_aliases WHERE alias = ?', (filename,))
+        row = cursor.fetchone()
+        if row:
+            _, ext = os.path.splitext(filename)
+            cursor.execute('DELETE FROM image_aliases WHERE alias = ?', (filename,))
+            alias = _insert_alias(cursor, alias_stem(license_plate), ext, row[0], start=index + 1)
+            rename_metadata(cursor, filename, alias)
+            rename_rotation(cursor, filename, alias)
+            conn.commit()
+            return f"uploads/{alias}"
+    except Exception as e:
+        conn.rollback()
+        print(f"重命名图片别名失败: {str(e)}")
+        return None
+    finally:
+        conn.close()
+
+    legacy_path = safe_join(UPLOAD_FOLDER, filename)
+    if legacy_path and os.path.isfile(legacy_path):
+        return rename_compressed_file(legacy_path, license_plate, index)
+    return None
+
+
+def sweep_staging(ttl=STAGING_TTL):
+    """删除预览后超过 ttl 秒仍未提交的图片，返回删除的图片数
+
+    包括暂存目录中的文件和暂存记录，以及引入暂存目录之前以 UNKNOWN_ 前缀存入内容存储的预览别名。
+    仍被违停记录引用的（提交时移入失败）保留；引用情况一次查询得出。
+    持有写锁期间删除，与提交时的移入互斥。
+    """
+    cutoff = time.time() - ttl
+    expired = set()
+    with os.scandir(STAGING_FOLDER) as entries:
+        for entry in entries:
+            # 只看主文件（随机名+扩展名），WebP/AVIF及旋转缓存随主文件删除
+            if entry.name.count('.') == 1 and entry.is_file() and entry.stat().st_mtime < cutoff:
+                expired.add(entry.name)
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT name FROM staged_uploads WHERE created_at < ?', (cutoff,))
+        expired.update(row[0] for row in cursor.fetchall())
+        cursor.execute('''
+            SELECT alias FROM image_aliases
+            WHERE substr(alias, 1, ?) = ? AND created_at < datetime(?, 'unixepoch')
+        ''', (len(LEGACY_PREVIEW_PREFIX), LEGACY_PREVIEW_PREFIX, cutoff))
+        legacy = {row[0] for row in cursor.fetchall()}
+
+        referenced = fetch_referenced_photos(cursor, expired | legacy)
+        expired -= referenced
+        legacy -= referenced
+
+        cursor.executemany('DELETE FROM staged_uploads WHERE name = ?', [(name,) for name in expired])
+        removed, released = release_aliases(cursor, legacy)
+        forget_rotations(cursor, expired | removed)
+        forget_metadata(cursor, expired | removed)
+        for name in expired:
+            path = staging_path(name)
+            if os.path.exists(path):
+                os.remove(path)
+            remove_image_variants(path)
+        conn.commit()
+        purge_blobs(conn, released)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    if expired or removed:
+        print(f"已清理未提交的预览图片: {len(expired) + len(removed)} 张")
+    return len(expired) + len(removed)
@@ -0,0 +1,247 @@
+"""
+断点续传上传（参考 tus 协议），移动网络中断后从已接收的位置继续，不必重新上传整张图片
+
+    POST   /api/uploads                创建上传，声明文件名和总大小
+    PUT    /api/uploads/<id>           按 Upload-Offset 头追加一段数据
+    GET    /api/uploads/<id>（HEAD）   查询已接收的字节数，中断后从这里继续
+    POST   /api/uploads/<id>/complete  接收完整后交给压缩任务
+    DELETE /api/uploads/<id>           取消上传
+
+数据直接追加到暂存文件，已接收的字节数以文件大小为准（中断的请求已写入的部分同样保留）；
+请求体按块读取写入，单个上传占用的内存与文件大小无关。
+"""
+
+import os
+import re
+import time
+import uuid
+
+from werkzeug.exceptions import ClientDisconnected
+
+from modules.db import get_db_connection
+from modules.image_processor import allowed_file, MAX_FILE_SIZE
+from modules.image_store import BLOB_TMP_FOLDER, temp_path
+
+try:
+    import fcntl
+except ImportError:  # Windows 开发环境不支持，同一上传的并发写入不做互斥
+    fcntl = None
+
+RESUMABLE_FOLDER = os.path.join(BLOB_TMP_FOLDER, 'resumable')
+# 建议客户端每段的大小，弱网下单次请求失败只需重传这一段
+RESUMABLE_CHUNK_SIZE = 1024 * 1024
+# 超过该时间（秒）没有收到新数据的上传会被清理
+RESUMABLE_UPLOAD_TTL = 24 * 3600
+WRITE_BLOCK_SIZE = 64 * 1024
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+os.makedirs(RESUMABLE_FOLDER, exist_ok=True)
+
+
+class UploadError(Exception):
+    """上传请求无效，status 为HTTP状态码，offset 为服务端已接收的字节数（客户端据此继续）"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _upload_path(upload_id):
+    return os.path.join(RESUMABLE_FOLDER, f"{upload_id}.part")
+
+
+def _lock(f):
+    """对暂存文件加排他锁，同一上传正在被其他请求写入时抛出 UploadError"""
+    if fcntl is None:
+        return
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise UploadError('该上传正在写入，请稍后重试', 409)
+
+
+def _session(cursor, upload_id):
+    cursor.execute('SELECT filename, length FROM upload_sessions WHERE id = ?', (upload_id,))
+    return cursor.fetchone()
+
+
+def create_upload(filename, length):
+    """创建上传，返回上传ID"""
+    if not filename or not allowed_file(filename):
+        raise UploadError('不支持的文件格式')
+    if length <= 0:
+        raise UploadError('文件大小无效')
+    if length > MAX_FILE_SIZE:
+        raise UploadError(f'文件过大，超过{MAX_FILE_SIZE/(1024*1024):.0f}MB限制', 413)
+
+    upload_id = uuid.uuid4().hex
+    open(_upload_path(upload_id), 'wb').close()
+    now = time.time()
+    conn = get_db_connection()
+    try:
+        conn.execute('INSERT INTO upload_sessions (id, filename, length, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                     (upload_id, filename, length, now, now))
+        conn.commit()
+    finally:
+        conn.close()
+    return upload_id
+
+
+def get_upload(upload_id):
+    """查询上传状态 {'upload_id', 'filename', 'length', 'offset'}，不存在时返回None"""
+    if not _UPLOAD_ID.match(upload_id):
+        return None
+    conn = get_db_connection()
+    try:
+        session = _session(conn.cursor(), upload_id)
+    finally:
+        conn.close()
+
+    path = _upload_path(upload_id)
+    if not session or not os.path.exists(path):
+        return None
+    return {'upload_id': upload_id, 'filename': session[0], 'length': session[1], 'offset': os.path.getsize(path)}
+
+
+def _touch(upload_id):
+    conn = get_db_connection()
+    try:
+        conn.execute('UPDATE upload_sessions SET updated_at = ? WHERE id = ?', (time.time(), upload_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def append_chunk(upload_id, offset, stream):
+    """从 offset 处追加 stream 中的数据，返回已接收的字节数
+
+    offset 必须等于已接收的字节数（否则抛出 409，附带当前位置）；超出声明大小的一段整体丢弃。
+    连接中断时保留已写入的部分。
+    """
+    upload = get_upload(upload_id)
+    if not upload:
+        raise UploadError('上传不存在或已过期', 404)
+
+    with open(_upload_path(upload_id), 'r+b') as f:
+        _lock(f)
+        received = os.fstat(f.fileno()).st_size
+        if offset != received:
+            raise UploadError('偏移量与已接收的数据不一致', 409, received)
+
+        start = received
+        f.seek(received)
+        try:
+            for block in iter(lambda: stream.read(WRITE_BLOCK_SIZE), b''):
+                if received + len(block) > upload['length']:
+                    f.truncate(start)
+                    raise UploadError('数据超出声明的文件大小', 413, start)
+                f.write(block)
+                received += len(block)
+        except ClientDisconnected:
+            f.flush()
+            _touch(upload_id)
+            raise UploadError('连接中断', 400, received)
+
+    _touch(upload_id)
+    return received
+
+
+def complete_upload(upload_id):
+    """确认数据已接收完整并结束会话，返回 {'path', 'filename', 'length'}
+
+    文件移到存储的临时目录，交由调用方处理；压缩任务提交失败时用 restore_upload 恢复会话，客户端可以稍后重试
+    """
+    upload = get_upload(upload_id)
+    if not upload:
+        raise UploadError('上传不存在或已过期', 404)
+
+    path = _upload_path(upload_id)
+    with open(path, 'rb') as f:
+        _lock(f)
+        received = os.fstat(f.fileno()).st_size
+        if received != upload['length']:
+            raise UploadError('数据尚未接收完整', 409, received)
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+            conn.commit()
+            if not cursor.rowcount:
+                raise UploadError('上传不存在或已过期', 404)
+        finally:
+            conn.close()
+        target = temp_path('.upload')
+        os.replace(path, target)
+    return {'path': target, 'filename': upload['filename'], 'length': upload['length']}
+
+
+def restore_upload(upload_id, upload):
+    """恢复 complete_upload 结束的会话
+
+    恢复失败时删除文件后抛出异常（存储临时目录中的文件不会被 sweep_uploads 清理）
+    """
+    try:
+        os.replace(upload['path'], _upload_path(upload_id))
+        now = time.time()
+        conn = get_db_connection()
+        try:
+            conn.execute('INSERT OR IGNORE INTO upload_sessions (id, filename, length, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                         (upload_id, upload['filename'], upload['length'], now, now))
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception:
+        for path in (upload['path'], _upload_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+
+def cancel_upload(upload_id):
+    """取消上传并删除暂存文件，上传不存在时返回False"""
+    if not _UPLOAD_ID.match(upload_id):
+        return False
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+        conn.commit()
+        found = cursor.rowcount > 0
+    finally:
+        conn.close()
+
+    if found and os.path.exists(_upload_path(upload_id)):
+        os.remove(_upload_path(upload_id))
+    return found
+
+
+def sweep_uploads(ttl=RESUMABLE_UPLOAD_TTL):
+    """删除超过 ttl 秒没有收到新数据的上传（包括没有会话记录的暂存文件），返回删除的数量"""
+    cutoff = time.time() - ttl
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM upload_sessions WHERE updated_at < ?', (cutoff,))
+        expired = {row[0] for row in cursor.fetchall()}
+        cursor.execute('SELECT id FROM upload_sessions')
+        active = {row[0] for row in cursor.fetchall()} - expired
+        cursor.executemany('DELETE FROM upload_sessions WHERE id = ?', [(upload_id,) for upload_id in expired])
+        conn.commit()
+    finally:
+        conn.close()
+
+    removed = 0
+    with os.scandir(RESUMABLE_FOLDER) as entries:
+        for entry in entries:
+            upload_id, _ = os.path.splitext(entry.name)
+            if upload_id in active or (upload_id not in expired and entry.stat().st_mtime >= cutoff):
+                continue
+            os.remove(entry.path)
+            removed += 1
+
+    if removed:
+        print(f"已清理未完成的断点续传上传: {removed} 个")
+    return removed
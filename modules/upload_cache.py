@@ -0,0 +1,225 @@
+"""
+上传图片访问的解析缓存（每个worker进程各自一份）
+
+访问一张图片需要查询别名和方向、检查AVIF/WebP文件是否存在并读取文件信息，
+解析结果连同强ETag按文件名缓存一小段时间，重复访问不再查询数据库和文件系统。
+内容文件以SHA-256命名，ETag直接取自文件名；迁移前的文件按 inode/修改时间/大小生成。
+
+页面和API给出的图片地址带内容版本（/uploads/<别名>?v=<版本>，版本为内容哈希前缀加方向），
+版本与当前内容一致时响应可长期缓存（immutable）；不带版本或版本已过期的别名URL每次验证（no-cache）。
+send_upload 供两个入口（modules.app_main 与开发用的 app/app.py）的 /uploads 路由共用。
+"""
+
+import json
+import mimetypes
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+
+from flask import abort, current_app, request, send_file
+
+from modules.db import get_db_connection
+from modules.image_orientation import get_rotation
+from modules.image_processor import UPLOAD_FOLDER, IMAGE_VARIANT_MIMETYPES, image_variant_paths, rotated_image_path
+from modules.image_store import resolve_upload
+
+UPLOAD_CACHE_SIZE = 4096
+# 缓存有效期（秒），其他worker改名/删除/旋转后最多这么久生效
+UPLOAD_CACHE_TTL = 30
+# 别名URL不按内容命名，同一URL的内容会改变（旋转后返回派生文件、批量重新编码替换内容），
+# 浏览器每次按强ETag验证（no-cache），内容未变时只返回304
+ALIAS_CACHE_CONTROL = 'public, no-cache'
+# 带版本的URL内容不会改变：旋转、重新编码后版本随之改变，页面改用新地址
+VERSIONED_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 版本取内容哈希的前缀长度
+PHOTO_VERSION_LENGTH = 16
+# 批量查询版本时每条SQL的别名数（低于SQLite的参数个数限制）
+PHOTO_VERSION_BATCH = 500
+
+_CONTENT_NAME = re.compile(r'^[0-9a-f]{64}\.')
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def file_etag(path, stat):
+    """文件的强ETag：内容文件取哈希文件名（含格式/方向后缀），其他文件取 inode-修改时间-大小"""
+    name = os.path.basename(path)
+    if _CONTENT_NAME.match(name):
+        return name
+    return f"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+
+def _file_info(path):
+    stat = os.stat(path)
+    return {'path': path, 'etag': file_etag(path, stat), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def photo_version(digest, rotation):
+    """图片的内容版本：内容哈希前缀，旋转过的加上方向"""
+    version = digest[:PHOTO_VERSION_LENGTH]
+    return f"{version}-r{rotation}" if rotation else version
+
+
+def _resolve(filename):
+    full_path = resolve_upload(filename)
+    if not full_path:
+        return None
+
+    # 内容文件以哈希命名，按别名的扩展名确定类型
+    mimetype = mimetypes.guess_type(filename)[0]
+    rotation = get_rotation(filename)
+    if rotation:
+        files = {None: dict(_file_info(rotated_image_path(full_path, rotation)), mimetype=mimetype)}
+    else:
+        files = {None: dict(_file_info(full_path), mimetype=mimetype)}
+        for fmt, variant_path in image_variant_paths(full_path).items():
+            files[fmt] = dict(_file_info(variant_path), mimetype=IMAGE_VARIANT_MIMETYPES[fmt])
+    # 暂存图片和迁移前的文件不按内容命名，没有版本
+    name = os.path.basename(full_path)
+    version = photo_version(name[:64], rotation) if _CONTENT_NAME.match(name) else None
+    return {'rotation': rotation, 'version': version, 'files': files}
+
+
+def lookup_upload(filename):
+    """返回图片的解析结果 {'rotation', 'version', 'files': {格式或None: {'path', 'etag', 'size', 'mtime', 'mimetype'}}}
+
+    图片不存在时返回None（不缓存，新上传的图片可以立即访问）
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(filename)
+        if cached and cached[0] > now:
+            _cache.move_to_end(filename)
+            return cached[1]
+
+    entry = _resolve(filename)
+    with _lock:
+        if entry is None:
+            _cache.pop(filename, None)
+        else:
+            _cache[filename] = (now + UPLOAD_CACHE_TTL, entry)
+            _cache.move_to_end(filename)
+            while len(_cache) > UPLOAD_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return entry
+
+
+def choose_file(entry, accept_mimetypes):
+    """按Accept从解析结果中选择要返回的文件（只认明确声明的类型）"""
+    accepted = {value for value, q in accept_mimetypes if q > 0}
+    for fmt in IMAGE_VARIANT_MIMETYPES:
+        if fmt in entry['files'] and IMAGE_VARIANT_MIMETYPES[fmt] in accepted:
+            return entry['files'][fmt]
+    return entry['files'][None]
+
+
+def forget_upload(*filenames):
+    """图片改名、删除或旋转后清除本进程的缓存"""
+    with _lock:
+        for filename in filenames:
+            _cache.pop(os.path.basename(filename), None)
+
+
+def upload_file_response(file, cache_control=ALIAS_CACHE_CONTROL):
+    """返回 uploads/ 下的文件（lookup_upload 解析结果中的一项），带强ETag和指定的 Cache-Control
+
+    应用配置了 UPLOAD_ACCEL_REDIRECT 时只返回 X-Accel-Redirect 头，由 nginx 发送文件内容（Range/条件请求由 nginx 处理），
+    worker 立即释放；开启 USE_X_SENDFILE 时 send_file 返回 X-Sendfile 头；
+    否则（开发环境）由应用直接发送，支持 If-None-Match/If-Modified-Since（304）和 Range（206）
+    """
+    accel_prefix = current_app.config.get('UPLOAD_ACCEL_REDIRECT')
+    relative_path = os.path.relpath(file['path'], UPLOAD_FOLDER)
+    if accel_prefix and not relative_path.startswith('..'):
+        response = current_app.response_class(mimetype=file['mimetype'])
+        response.headers['X-Accel-Redirect'] = accel_prefix + quote(relative_path.replace(os.sep, '/'))
+    else:
+        response = send_file(file['path'], mimetype=file['mimetype'], etag=file['etag'],
+                             last_modified=file['mtime'])
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def send_upload(filename):
+    """返回上传的图片，客户端支持时优先返回AVIF/WebP格式；旋转过的图片返回按方向缓存的派生文件
+
+    请求的 ?v= 与当前内容版本一致时可长期缓存，否则（不带版本或已过期）返回当前内容并要求每次验证。
+    图片不存在时抛出 NotFound
+    """
+    entry = lookup_upload(filename)
+    if not entry:
+        abort(404)
+
+    def respond(entry):
+        version = request.args.get('v')
+        cache_control = VERSIONED_CACHE_CONTROL if version and version == entry['version'] else ALIAS_CACHE_CONTROL
+        return upload_file_response(choose_file(entry, request.accept_mimetypes), cache_control)
+
+    try:
+        response = respond(entry)
+    except FileNotFoundError:
+        # 缓存期间文件已被其他进程改名或删除，重新解析一次
+        forget_upload(filename)
+        entry = lookup_upload(filename)
+        if not entry:
+            abort(404)
+        response = respond(entry)
+    # 同一URL按Accept返回不同格式，缓存需要区分
+    if not entry['rotation']:
+        response.vary.add('Accept')
+    return response
+
+
+def fetch_photo_versions(filenames):
+    """批量查询内容存储中图片的版本 {别名: 版本}，不在内容存储中的图片（暂存、迁移前的文件）不返回"""
+    filenames = list(dict.fromkeys(filenames))
+    versions = {}
+    if not filenames:
+        return versions
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for start in range(0, len(filenames), PHOTO_VERSION_BATCH):
+            batch = filenames[start:start + PHOTO_VERSION_BATCH]
+            cursor.execute(f'''
+                SELECT a.alias, a.hash, COALESCE(o.rotation, 0) FROM image_aliases a
+                LEFT JOIN photo_orientations o ON o.photo = a.alias
+                WHERE a.alias IN ({', '.join('?' * len(batch))})
+            ''', batch)
+            versions.update((alias, photo_version(digest, rotation)) for alias, digest, rotation in cursor.fetchall())
+    finally:
+        conn.close()
+    return versions
+
+
+def _photo_paths(photo_path):
+    """photo_path 字段（JSON数组或单个路径）中的图片路径列表"""
+    if not photo_path:
+        return []
+    try:
+        paths = json.loads(photo_path)
+    except (json.JSONDecodeError, TypeError):
+        return [photo_path]
+    return [path for path in paths if isinstance(path, str) and path] if isinstance(paths, list) else [photo_path]
+
+
+def add_photo_urls(items):
+    """为带 photo_path 的记录加上 photo_urls {图片路径: 访问地址}，所有记录的版本一次查询
+
+    内容存储中的图片地址带版本（可长期缓存），其他图片使用普通地址
+    """
+    paths = {item['photo_path']: _photo_paths(item['photo_path']) for item in items if item.get('photo_path')}
+    versions = fetch_photo_versions(os.path.basename(path) for photo_paths in paths.values() for path in photo_paths)
+    for item in items:
+        if 'photo_path' not in item:
+            continue
+        urls = {}
+        for path in paths.get(item['photo_path'], []):
+            version = versions.get(os.path.basename(path))
+            url = '/' + path.lstrip('/')
+            urls[path] = f"{url}?v={version}" if version else url
+        item['photo_urls'] = urls
+    return items
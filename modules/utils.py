@@ -1,6 +1,9 @@
 from datetime import datetime
 import json
-import os
+
+from modules.db import VEHICLE_FIELDS, VIOLATION_FIELDS, PHOTO_METADATA_FIELDS
+from modules.image_store import delete_uploads
+from modules.upload_cache import add_photo_urls, forget_upload
 
 # 时间计算辅助函数
 def calculate_time_span(first_date, last_date):
@@ -67,6 +70,32 @@ def count_recent_violations(violation_dates, days=30):
     except:
         return 0
 
+def serialize_vehicles(vehicles, fields=None):
+    """将车辆查询结果转换为API/页面使用的字典列表"""
+    fields = fields or tuple(VEHICLE_FIELDS)
+    return [dict(zip(fields, v)) for v in vehicles]
+
+def serialize_violations(violations, fields=None):
+    """将违停记录查询结果转换为API/页面使用的字典列表
+
+    包含 photo_path 时同时给出 photo_urls（带内容版本、可长期缓存的图片地址）
+    """
+    fields = fields or tuple(VIOLATION_FIELDS)
+    result = []
+    for v in violations:
+        item = dict(zip(fields, v))
+        if 'description' in item:
+            item['description'] = item['description'] or ''
+        result.append(item)
+    if 'photo_path' in fields:
+        add_photo_urls(result)
+    return result
+
+def serialize_photo_metadata(photos, fields=None):
+    """将图片元数据查询结果转换为API使用的字典列表"""
+    fields = fields or tuple(PHOTO_METADATA_FIELDS)
+    return [dict(zip(fields, photo)) for photo in photos]
+
 def delete_image_files(photo_path):
     """删除图片文件"""
     deleted_files = 0
@@ -75,23 +104,11 @@ def delete_image_files(photo_path):
             if photo_path.startswith('['):
                 # JSON格式的多张图片
                 photo_paths = json.loads(photo_path)
-                for path in photo_paths:
-                    # 处理路径，确保正确构造文件路径
-                    if isinstance(path, str):
-                        # 移除可能的前导斜杠
-                        clean_path = path.lstrip('/')
-                        file_path = os.path.join(os.getcwd(), clean_path)
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                            deleted_files += 1
             else:
                 # 单张图片
-                # 移除可能的前导斜杠
-                clean_path = photo_path.lstrip('/')
-                file_path = os.path.join(os.getcwd(), clean_path)
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    deleted_files += 1
+                photo_paths = [photo_path]
+            deleted_files = delete_uploads(photo_paths)
+            forget_upload(*photo_paths)
         except Exception as e:
             print(f"删除图片文件失败: {e}")
     
@@ -65,4 +65,24 @@ def sanitize_input(text):
 def validate_violation_type(violation_type):
     """验证违停类型"""
     valid_types = ['占用消防通道', '占用人行道', '逆向停车', '压线停车', '禁止停车区域', '其他']
-    return violation_type in valid_types
\ No newline at end of file
+    return violation_type in valid_types
+
+def parse_fields(fields_param, allowed_fields):
+    """解析 ?fields= 参数（逗号分隔），返回 (字段元组, 无效字段列表)
+
+    未提供参数时返回 (None, [])，表示使用全部字段
+    """
+    if not fields_param:
+        return None, []
+    
+    fields = []
+    invalid = []
+    for name in fields_param.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name in allowed_fields:
+            fields.append(name)
+        else:
+            invalid.append(name)
+    return tuple(fields) or None, invalid
\ No newline at end of file
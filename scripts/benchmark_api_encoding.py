@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API编码基准测试：比较 jsonify / 紧凑数组JSON / MessagePack 的载荷大小和序列化耗时
+
+三种格式都按接口的实际路径计时：在请求上下文中以对应的 Accept 调用 api_response，
+包括 serialize_violations 的规整和 photo_urls 的版本查询。
+测试在临时工作目录中进行，使用临时数据库（模拟照片写入内容存储别名表），不影响正式数据。
+
+用法: python scripts/benchmark_api_encoding.py [记录数] [重复次数]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from flask import Flask
+
+from modules.api_encoding import api_response, JSON_MIMETYPE, COMPACT_MIMETYPE, MSGPACK_MIMETYPE, msgpack
+from modules.db import VIOLATION_FIELDS, init_db, get_db_connection
+from modules.utils import serialize_violations
+
+LOCATIONS = ['武汉市江汉区解放大道', '武汉市武昌区中南路', '宜昌市西陵区东山大道', '襄阳市樊城区长征路']
+TYPES = ['占用消防通道', '占用人行道', '逆向停车', '压线停车', '禁止停车区域', '其他']
+
+
+def make_rows(count, fields):
+    """生成可复现的模拟违停记录"""
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        record = {
+            'id': i + 1,
+            'license_plate': f"鄂A{rng.randint(10000, 99999)}",
+            'location': rng.choice(LOCATIONS),
+            'violation_type': rng.choice(TYPES),
+            'description': '车辆停放在人行道上，影响行人通行' if rng.random() < 0.6 else None,
+            'photo_path': f'["uploads/鄂A{rng.randint(10000, 99999)}_20250101_120000_{i + 1:05d}.jpeg"]',
+            'created_at': f"2025-01-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        }
+        rows.append(tuple(record[name] for name in fields))
+    return rows
+
+
+def register_photos(count):
+    """把模拟记录的照片写入别名表，使 photo_urls 与正式数据一样带内容版本"""
+    rows = make_rows(count, ('photo_path',))
+    aliases = [(os.path.basename(path), hashlib.sha256(path.encode('utf-8')).hexdigest())
+               for (photo_path,) in rows for path in json.loads(photo_path)]
+    conn = get_db_connection()
+    try:
+        conn.executemany('INSERT OR IGNORE INTO image_blobs (hash, ext, size, refcount) VALUES (?, ?, 0, 1)',
+                         [(digest, '.jpeg') for _, digest in aliases])
+        conn.executemany('INSERT OR IGNORE INTO image_aliases (alias, hash) VALUES (?, ?)', aliases)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def measure(encode, repeat):
+    """返回 (编码结果, 平均耗时毫秒)"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        body = encode()
+    elapsed = (time.perf_counter() - start) / repeat * 1000
+    return body, elapsed
+
+
+def run_benchmark(count, repeat):
+    app = Flask(__name__)
+    scenarios = [
+        ('全部字段', tuple(VIOLATION_FIELDS)),
+        ('fields=id,created_at', ('id', 'created_at')),
+    ]
+    formats = [('jsonify', JSON_MIMETYPE), ('compact+json', COMPACT_MIMETYPE)]
+    if msgpack is not None:
+        formats.append(('msgpack', MSGPACK_MIMETYPE))
+
+    for title, fields in scenarios:
+        rows = make_rows(count, fields)
+
+        print(f"\n📊 {title}（{count} 条记录，重复 {repeat} 次）")
+        print("-" * 72)
+        print(f"{'格式':<16} {'大小(KB)':>10} {'gzip后(KB)':>12} {'序列化(ms)':>12} {'相对jsonify':>12}")
+        print("-" * 72)
+
+        baseline_size = None
+        for name, mimetype in formats:
+            with app.test_request_context(headers={'Accept': mimetype}):
+                body, elapsed = measure(lambda: api_response(fields, rows, serialize_violations).get_data(), repeat)
+            size = len(body)
+            gzip_size = len(gzip.compress(body, compresslevel=6))
+            if baseline_size is None:
+                baseline_size = size
+            print(f"{name:<16} {size / 1024:>10.1f} {gzip_size / 1024:>12.1f} {elapsed:>12.2f} {size / baseline_size * 100:>11.1f}%")
+
+    if msgpack is None:
+        print("\n⚠️  未安装msgpack，跳过MessagePack测试")
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    # 在临时工作目录中运行，数据库不影响正式数据
+    workdir = tempfile.mkdtemp(prefix='violation_bench_api_')
+    os.chdir(workdir)
+    try:
+        _stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            init_db()
+        finally:
+            sys.stdout = _stdout
+        register_photos(count)
+        run_benchmark(count, repeat)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
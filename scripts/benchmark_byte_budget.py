@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字节预算编码基准测试：比较按原文件大小分级选择质量（旧策略）与按字节预算查找质量的CPU耗时和输出大小
+
+用法: python scripts/benchmark_byte_budget.py [图片目录] [预算KB]
+未指定目录时在临时目录生成不同内容复杂度的测试图片
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from PIL import Image, ImageFilter
+
+from modules.image_processor import compress_image, COMPRESSED_TARGET_BYTES, COMPRESSED_MAX_WIDTH, COMPRESSED_MAX_HEIGHT, COMPRESSED_QUALITY
+
+CORPUS_SIZES = [(4000, 3000), (6000, 4000)]
+REPEAT = 3
+
+
+def generate_corpus(target_dir):
+    """生成平滑、中等纹理、强噪声三类内容的JPEG"""
+    paths = []
+    for width, height in CORPUS_SIZES:
+        gradient = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+        noise = Image.effect_noise((width, height), 64).convert('RGB')
+        fractal = Image.effect_mandelbrot((width, height), (-2, -1.5, 1, 1.5), 80).convert('RGB')
+        variants = {
+            'smooth': gradient.filter(ImageFilter.GaussianBlur(3)),
+            'textured': Image.blend(fractal, noise, 0.3),
+            'noisy': Image.blend(gradient, noise, 0.8),
+        }
+        for name, img in variants.items():
+            path = os.path.join(target_dir, f"{name}_{width}x{height}.jpg")
+            if not os.path.exists(path):
+                img.save(path, 'JPEG', quality=95)
+            paths.append(path)
+    return paths
+
+
+def legacy_params(original_size):
+    """旧版按原文件大小分级的压缩参数 (最大宽, 最大高, 质量)
+
+    旧版另有"输出大于3MB时二次压缩"，在1200x900以内的输出中不会触发，这里不再模拟
+    """
+    if original_size > 20 * 1024 * 1024:
+        return min(800, COMPRESSED_MAX_WIDTH), min(600, COMPRESSED_MAX_HEIGHT), min(60, COMPRESSED_QUALITY)
+    if original_size > 10 * 1024 * 1024:
+        return min(1000, COMPRESSED_MAX_WIDTH), min(750, COMPRESSED_MAX_HEIGHT), min(70, COMPRESSED_QUALITY)
+    if original_size > 5 * 1024 * 1024:
+        return COMPRESSED_MAX_WIDTH, COMPRESSED_MAX_HEIGHT, min(80, COMPRESSED_QUALITY)
+    return COMPRESSED_MAX_WIDTH, COMPRESSED_MAX_HEIGHT, COMPRESSED_QUALITY
+
+
+def measure(path, **kwargs):
+    """返回 (最少CPU耗时秒, 输出字节数)"""
+    best = None
+    output_size = 0
+    for _ in range(REPEAT):
+        with open(path, 'rb') as f:
+            start = time.process_time()
+            img_io, _ = compress_image(f, **kwargs)
+            elapsed = time.process_time() - start
+        output_size = len(img_io.getvalue()) if img_io else 0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output_size
+
+
+def run_benchmark(paths, target_bytes):
+    # 压缩函数的过程日志不参与输出
+    devnull = open(os.devnull, 'w')
+    rows = []
+    for path in paths:
+        original_size = os.path.getsize(path)
+        max_width, max_height, quality = legacy_params(original_size)
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            legacy = measure(path, max_width=max_width, max_height=max_height, quality=quality, target_bytes=None)
+            budget = measure(path, target_bytes=target_bytes)
+        finally:
+            sys.stdout = stdout
+        rows.append((os.path.basename(path), original_size, legacy, budget))
+    devnull.close()
+
+    print(f"字节预算: {target_bytes / 1024:.0f}KB，每项取 {REPEAT} 次中最少的CPU时间")
+    print(f"{'文件':<26} {'原始(MB)':>9} {'分级CPU(ms)':>12} {'分级输出(KB)':>13} {'预算CPU(ms)':>12} {'预算输出(KB)':>13} {'预算占用':>9}")
+    print("-" * 102)
+    for name, original_size, (legacy_cpu, legacy_size), (budget_cpu, budget_size) in rows:
+        print(f"{name:<26} {original_size / 1024 / 1024:>9.1f} {legacy_cpu * 1000:>12.0f} {legacy_size / 1024:>13.1f} "
+              f"{budget_cpu * 1000:>12.0f} {budget_size / 1024:>13.1f} {budget_size / target_bytes * 100:>8.0f}%")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        image_dir = sys.argv[1]
+        paths = sorted(
+            os.path.join(image_dir, name) for name in os.listdir(image_dir)
+            if name.lower().endswith(('.jpg', '.jpeg', '.png'))
+        )
+    else:
+        image_dir = os.path.join(tempfile.gettempdir(), 'violation_bench_budget')
+        os.makedirs(image_dir, exist_ok=True)
+        print(f"生成测试图片: {image_dir}")
+        paths = generate_corpus(image_dir)
+
+    if not paths:
+        print("❌ 没有找到图片")
+        sys.exit(1)
+
+    target_bytes = int(float(sys.argv[2]) * 1024) if len(sys.argv) > 2 else COMPRESSED_TARGET_BYTES
+    run_benchmark(paths, target_bytes)
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片处理流程基准测试：读取文件头（inspect_image）、压缩（compress_image）、保存上传（store_compressed_upload，
+与压缩任务相同：压缩、计算内容哈希、移入内容存储并写入别名/元数据/感知哈希）各阶段的吞吐、p50/p95延迟、峰值内存和输出字节数，分单张和并发两种方式运行，结果可保存为基线供之后比较
+
+用法: python scripts/benchmark_image_pipeline.py [选项]
+    --corpus DIR          测试图片目录（默认临时目录，按固定种子生成，已生成的直接复用）
+    --quick               只使用不超过8MB的图片
+    --repeat N            单张测试每张图片每个阶段的重复次数（默认3）
+    --concurrency N       并发测试的进程数（默认2，与gunicorn的worker数一致）
+    --save-baseline FILE  保存结果为JSON基线
+    --compare FILE        与基线比较，延迟/内存/输出超出容差时以状态码1退出
+
+测试图片包括 JPEG/PNG/WebP/BMP/调色板GIF，0.5MB~48MB，多种宽高比，JPEG/WebP带不同的EXIF方向。
+测试在临时工作目录中进行，上传目录和数据库与正式数据隔离（保存阶段每次存入后即删除，重复运行不会命中已有内容）；各阶段在独立进程中运行，峰值内存互不影响。
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from PIL import Image, ImageFilter
+
+CORPUS_SEED = 20240601
+# (名称, 格式, 宽高比, 目标大小MB, EXIF方向)
+CORPUS = [
+    ('jpeg_small', 'JPEG', (4, 3), 0.5, 1),
+    ('jpeg_phone', 'JPEG', (4, 3), 4, 6),
+    ('jpeg_portrait', 'JPEG', (3, 4), 8, 8),
+    ('jpeg_pano', 'JPEG', (3, 1), 6, 1),
+    ('jpeg_wide', 'JPEG', (16, 9), 15, 3),
+    ('jpeg_huge', 'JPEG', (4, 3), 30, 6),
+    ('png_screenshot', 'PNG', (9, 16), 2, None),
+    ('png_large', 'PNG', (16, 9), 40, None),
+    ('webp_phone', 'WEBP', (4, 3), 1.5, 6),
+    ('gif_palette', 'GIF', (4, 3), 1, None),
+    ('bmp_medium', 'BMP', (4, 3), 12, None),
+    ('bmp_max', 'BMP', (1, 1), 48, None),
+]
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif', 'BMP': '.bmp'}
+SAVE_OPTIONS = {'JPEG': {'quality': 92}, 'PNG': {'compress_level': 6}, 'WEBP': {'quality': 90}}
+# 生成的文件大小与目标相差超过该比例时按比例调整尺寸重新生成
+SIZE_TOLERANCE = 0.15
+MAX_GENERATE_ATTEMPTS = 4
+QUICK_MAX_MB = 8
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+
+STAGES = ['inspect', 'compress', 'save']
+# 并发测试的阶段（完整的上传保存流程）
+CONCURRENT_STAGE = 'save'
+# 与基线比较时允许的变化：延迟波动较大，输出字节数应基本一致
+LATENCY_TOLERANCE = 0.25
+RSS_TOLERANCE = 0.20
+OUTPUT_TOLERANCE = 0.05
+# 低于该值的延迟变化（毫秒）不计入，避免只读文件头等极短阶段的计时噪声
+LATENCY_FLOOR_MS = 5
+
+# 2: 保存阶段改为测量 store_compressed_upload，与旧基线不可比
+BASELINE_VERSION = 2
+
+
+def _content(rng, width, height):
+    """可复现的测试内容：分形纹理放大后叠加噪声，接近照片的压缩难度"""
+    base_width, base_height = min(width, 1024), min(height, 1024)
+    x0, y0 = rng.uniform(-2.0, -0.5), rng.uniform(-1.2, 0.2)
+    fractal = Image.effect_mandelbrot((base_width, base_height), (x0, y0, x0 + 1.5, y0 + 1.0), 96)
+    fractal = fractal.filter(ImageFilter.GaussianBlur(1)).resize((width, height), Image.Resampling.BILINEAR)
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.frombytes('L', (width, height), rng.randbytes(width * height))
+    channels = (fractal, Image.blend(gradient, fractal, 0.5), gradient)
+    return Image.merge('RGB', [Image.blend(channel, noise, 0.25) for channel in channels])
+
+
+def _save(img, path, fmt, orientation):
+    options = dict(SAVE_OPTIONS.get(fmt, {}))
+    if fmt == 'GIF':
+        img = img.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+    if orientation is not None:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        exif[EXIF_DATETIME] = '2024:06:01 08:30:00'
+        options['exif'] = exif.tobytes()
+    img.save(path, fmt, **options)
+
+
+def _dimensions(aspect, pixels):
+    width = max(64, int(math.sqrt(pixels * aspect[0] / aspect[1])))
+    return width, max(64, int(width * aspect[1] / aspect[0]))
+
+
+def generate_image(path, fmt, aspect, target_bytes, orientation, seed):
+    """按目标大小生成测试图片：先用小样本估算每像素字节数，再按实际大小修正尺寸"""
+    sample_path = path + '.sample'
+    _save(_content(random.Random(seed), 512, 512), sample_path, fmt, orientation)
+    bytes_per_pixel = os.path.getsize(sample_path) / (512 * 512)
+    os.remove(sample_path)
+
+    pixels = target_bytes / bytes_per_pixel
+    for _ in range(MAX_GENERATE_ATTEMPTS):
+        width, height = _dimensions(aspect, pixels)
+        _save(_content(random.Random(seed), width, height), path, fmt, orientation)
+        size = os.path.getsize(path)
+        if abs(size - target_bytes) <= target_bytes * SIZE_TOLERANCE:
+            break
+        pixels *= target_bytes / size
+    return width, height
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def generate_corpus(corpus_dir, quick=False):
+    """生成（或复用）测试图片，返回清单 [{'name', 'path', 'format', 'width', 'height', 'orientation', 'size', 'sha256'}]"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    manifest_path = os.path.join(corpus_dir, 'corpus.json')
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            cached = {item['name']: item for item in json.load(f)}
+    except (OSError, ValueError):
+        cached = {}
+
+    corpus = []
+    for index, (name, fmt, aspect, size_mb, orientation) in enumerate(CORPUS):
+        if quick and size_mb > QUICK_MAX_MB:
+            continue
+        path = os.path.join(corpus_dir, name + FORMAT_EXTENSIONS[fmt])
+        item = cached.get(name)
+        if item and item.get('seed') == CORPUS_SEED + index and os.path.exists(path) and os.path.getsize(path) == item['size']:
+            corpus.append(dict(item, path=path))
+            continue
+
+        print(f"生成测试图片: {name}（{fmt}，约{size_mb}MB）")
+        width, height = generate_image(path, fmt, aspect, int(size_mb * 1024 * 1024), orientation, CORPUS_SEED + index)
+        item = {'name': name, 'format': fmt, 'width': width, 'height': height, 'orientation': orientation,
+                'seed': CORPUS_SEED + index, 'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+        cached[name] = item
+        corpus.append(dict(item, path=path))
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump([{k: v for k, v in item.items() if k != 'path'} for item in cached.values()], f, indent=2)
+    return corpus
+
+
+def peak_rss_mb():
+    """当前进程的峰值内存（MB），Linux下读取VmHWM"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, p):
+    """最近秩百分位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_stage(stage, path):
+    """执行一次阶段，返回 (输出字节数, 处理方式)"""
+    from modules.image_inspect import inspect_image
+    from modules.image_processor import compress_image, image_variant_paths
+
+    if stage == 'inspect':
+        with open(path, 'rb') as f:
+            header = inspect_image(f)
+        return 0, header['format'] if header else None
+
+    if stage == 'compress':
+        info = {}
+        with open(path, 'rb') as f, tempfile.TemporaryFile() as output:
+            compress_image(f, output=output, info=info)
+            return os.fstat(output.fileno()).st_size, info.get('pipeline', {}).get('path')
+
+    # 与压缩任务相同的保存流程，写入临时工作目录的数据库；各进程使用不同的车牌前缀
+    from modules.db import get_db_connection
+    from modules.image_store import alias_stem, delete_uploads, resolve_upload, store_compressed_upload
+    _, ext = os.path.splitext(path)
+    conn = get_db_connection()
+    try:
+        with open(path, 'rb') as f:
+            alias, _ = store_compressed_upload(conn, f, ext.lower(), alias_stem(f"BENCH{os.getpid()}"))
+    finally:
+        conn.close()
+    saved_path = resolve_upload(alias)
+    output_bytes = sum(os.path.getsize(name) for name in [saved_path] + list(image_variant_paths(saved_path).values()))
+    # 删除别名和内容文件，下次保存同一张图片时仍走完整流程
+    delete_uploads([f"uploads/{alias}"])
+    return output_bytes, 'save'
+
+
+def _init_worker():
+    """使用与服务进程相同的解码像素上限，压缩函数的过程日志不参与输出"""
+    from modules.decode_budget import configure_decode_limits
+    configure_decode_limits()
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _measure_single(stage, path, repeat, queue):
+    """在独立进程中重复执行一个阶段，返回各次延迟、CPU时间、输出字节数和峰值内存"""
+    _init_worker()
+    import modules.image_processor  # noqa: F401  导入本身的内存不计入阶段
+    import modules.image_inspect  # noqa: F401
+    import modules.image_store  # noqa: F401
+    idle_rss = peak_rss_mb()
+    latencies, cpu_times = [], []
+    output_bytes, pipeline = 0, None
+    for _ in range(repeat):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        output_bytes, pipeline = run_stage(stage, path)
+        latencies.append(time.perf_counter() - start)
+        cpu_times.append(time.process_time() - cpu_start)
+    queue.put({'latencies': latencies, 'cpu_times': cpu_times, 'output_bytes': output_bytes,
+               'pipeline': pipeline, 'peak_rss_mb': peak_rss_mb(), 'idle_rss_mb': idle_rss})
+
+
+def measure_single(stage, path, repeat):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_measure_single, args=(stage, path, repeat, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def _concurrent_task(task):
+    name, path = task
+    start = time.perf_counter()
+    output_bytes, _ = run_stage(CONCURRENT_STAGE, path)
+    return name, time.perf_counter() - start, output_bytes, os.getpid(), peak_rss_mb()
+
+
+def measure_concurrent(corpus, repeat, concurrency):
+    """多个进程同时处理全部图片（与进程池/多worker部署相同），返回整体吞吐和各进程峰值内存"""
+    tasks = [(item['name'], item['path']) for _ in range(repeat) for item in corpus]
+    random.Random(CORPUS_SEED).shuffle(tasks)
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(concurrency, initializer=_init_worker) as pool:
+        start = time.perf_counter()
+        results = list(pool.imap_unordered(_concurrent_task, tasks))
+        wall = time.perf_counter() - start
+
+    latencies = [latency for _, latency, _, _, _ in results]
+    worker_peaks = {}
+    for _, _, _, pid, rss in results:
+        worker_peaks[pid] = max(worker_peaks.get(pid, 0), rss)
+    input_bytes = sum(os.path.getsize(path) for _, path in tasks)
+    return {
+        'stage': CONCURRENT_STAGE,
+        'concurrency': concurrency,
+        'images': len(tasks),
+        'wall_seconds': round(wall, 3),
+        'images_per_second': round(len(tasks) / wall, 3),
+        'input_mb_per_second': round(input_bytes / 1024 / 1024 / wall, 3),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'peak_rss_mb': round(max(worker_peaks.values()), 1),
+        'total_peak_rss_mb': round(sum(worker_peaks.values()), 1),
+        'output_bytes': sum(output_bytes for _, _, output_bytes, _, _ in results) // repeat,
+    }
+
+
+def run_single(corpus, repeat):
+    """每张图片每个阶段单独运行，返回 {'stages': 阶段汇总, 'images': 每张图片的结果}"""
+    images = {item['name']: {} for item in corpus}
+    stages = {}
+    for stage in STAGES:
+        latencies, cpu_times, output_bytes, peaks = [], [], 0, []
+        input_bytes = 0
+        for item in corpus:
+            result = measure_single(stage, item['path'], repeat)
+            latencies += result['latencies']
+            cpu_times += result['cpu_times']
+            output_bytes += result['output_bytes']
+            input_bytes += item['size'] * repeat
+            peaks.append(result['peak_rss_mb'])
+            images[item['name']][stage] = {
+                'p50_ms': round(percentile(result['latencies'], 50) * 1000, 1),
+                'cpu_ms': round(min(result['cpu_times']) * 1000, 1),
+                'peak_rss_mb': round(result['peak_rss_mb'], 1),
+                'rss_delta_mb': round(result['peak_rss_mb'] - result['idle_rss_mb'], 1),
+                'output_bytes': result['output_bytes'],
+                'pipeline': result['pipeline'],
+            }
+        total = sum(latencies)
+        stages[stage] = {
+            'images': len(latencies),
+            'images_per_second': round(len(latencies) / total, 3) if total else None,
+            'input_mb_per_second': round(input_bytes / 1024 / 1024 / total, 3) if total else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'cpu_ms': round(sum(cpu_times) * 1000 / len(cpu_times), 1),
+            'peak_rss_mb': round(max(peaks), 1),
+            'output_bytes': output_bytes,
+        }
+    return {'stages': stages, 'images': images}
+
+
+def print_report(corpus, single, concurrent):
+    print(f"\n{'图片':<16} {'格式':<5} {'尺寸':>11} {'方向':>4} {'大小(MB)':>9} " +
+          ' '.join(f"{stage + '(ms)':>13}" for stage in STAGES) + f" {'峰值RSS(MB)':>12} {'输出(KB)':>9} {'处理方式':<12}")
+    print("-" * 130)
+    for item in corpus:
+        result = single['images'][item['name']]
+        print(f"{item['name']:<16} {item['format']:<5} {item['width']:>5}x{item['height']:<5} {item['orientation'] or '-':>4} "
+              f"{item['size'] / 1024 / 1024:>9.1f} " + ' '.join(f"{result[stage]['p50_ms']:>13.1f}" for stage in STAGES) +
+              f" {max(result[stage]['peak_rss_mb'] for stage in STAGES):>12.0f} "
+              f"{result['compress']['output_bytes'] / 1024:>9.1f} {result['compress']['pipeline'] or '-':<12}")
+
+    print(f"\n{'阶段':<20} {'张数':>5} {'吞吐(张/s)':>11} {'吞吐(MB/s)':>11} {'p50(ms)':>9} {'p95(ms)':>9} {'峰值RSS(MB)':>12} {'输出(KB)':>10}")
+    print("-" * 96)
+    rows = [(f"单张 {stage}", stats) for stage, stats in single['stages'].items()]
+    rows.append((f"并发x{concurrent['concurrency']} {concurrent['stage']}", concurrent))
+    for label, stats in rows:
+        print(f"{label:<20} {stats['images']:>5} {stats['images_per_second'] or 0:>11.2f} {stats['input_mb_per_second'] or 0:>11.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['peak_rss_mb']:>12.0f} {stats['output_bytes'] / 1024:>10.1f}")
+    print(f"并发测试 {concurrent['concurrency']} 个进程峰值内存合计: {concurrent['total_peak_rss_mb']:.0f}MB")
+
+
+def environment():
+    from PIL import features
+    return {
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'libjpeg_turbo': features.check_feature('libjpeg_turbo'),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def _exceeds(current, baseline, tolerance, floor=0):
+    return baseline is not None and current is not None and current > max(baseline * (1 + tolerance), baseline + floor)
+
+
+def compare_baseline(result, baseline):
+    """返回超出容差的指标列表"""
+    regressions = []
+    if baseline.get('version') != BASELINE_VERSION:
+        print("⚠️  基线版本不同，跳过比较")
+        return regressions
+    baseline_corpus = {item['name']: item['sha256'] for item in baseline['corpus']}
+    current_corpus = {item['name']: item['sha256'] for item in result['corpus']}
+    same_corpus = baseline_corpus == current_corpus
+    if not same_corpus:
+        print("⚠️  测试图片与基线不同（--quick 或 Pillow 版本不同），只比较同名图片的结果")
+    if baseline['environment'] != result['environment']:
+        print("⚠️  运行环境与基线不同，延迟的比较仅供参考")
+
+    checks = [('p50_ms', LATENCY_TOLERANCE, LATENCY_FLOOR_MS), ('p95_ms', LATENCY_TOLERANCE, LATENCY_FLOOR_MS),
+              ('peak_rss_mb', RSS_TOLERANCE, 0), ('output_bytes', OUTPUT_TOLERANCE, 0)]
+    sections = []
+    if same_corpus:
+        sections += [(f"单张 {stage}", stats, baseline['single']['stages'].get(stage))
+                     for stage, stats in result['single']['stages'].items()]
+    if same_corpus and baseline['concurrent']['concurrency'] == result['concurrent']['concurrency']:
+        sections.append(("并发", result['concurrent'], baseline['concurrent']))
+    for label, stats, base in sections:
+        if not base:
+            continue
+        for key, tolerance, floor in checks:
+            if _exceeds(stats[key], base[key], tolerance, floor):
+                regressions.append(f"{label} {key}: {base[key]} → {stats[key]}")
+
+    for name, stages in result['single']['images'].items():
+        if baseline_corpus.get(name) != current_corpus[name]:
+            continue
+        base_stages = baseline['single']['images'].get(name, {})
+        for stage, stats in stages.items():
+            base = base_stages.get(stage)
+            if base and _exceeds(stats['output_bytes'], base['output_bytes'], OUTPUT_TOLERANCE):
+                regressions.append(f"{name} {stage} output_bytes: {base['output_bytes']} → {stats['output_bytes']}")
+            if base and base['pipeline'] != stats['pipeline']:
+                regressions.append(f"{name} {stage} 处理方式: {base['pipeline']} → {stats['pipeline']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图片处理流程基准测试')
+    parser.add_argument('--corpus', default=os.path.join(tempfile.gettempdir(), 'violation_bench_pipeline'))
+    parser.add_argument('--quick', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    corpus_dir = os.path.abspath(args.corpus)
+    baseline_paths = [os.path.abspath(path) if path else None for path in (args.save_baseline, args.compare)]
+    corpus = generate_corpus(corpus_dir, quick=args.quick)
+
+    # 在临时工作目录中运行，上传目录和数据库不影响正式数据
+    workdir = tempfile.mkdtemp(prefix='violation_bench_')
+    os.chdir(workdir)
+    try:
+        from modules.db import init_db
+        _stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            init_db()
+        finally:
+            sys.stdout = _stdout
+        print(f"单张测试: {len(corpus)} 张图片 x {len(STAGES)} 个阶段 x {args.repeat} 次")
+        single = run_single(corpus, args.repeat)
+        print(f"并发测试: {args.concurrency} 个进程")
+        concurrent = measure_concurrent(corpus, args.repeat, args.concurrency)
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        'version': BASELINE_VERSION,
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'environment': environment(),
+        'repeat': args.repeat,
+        'corpus': [{k: v for k, v in item.items() if k != 'path'} for item in corpus],
+        'single': single,
+        'concurrent': concurrent,
+    }
+    print_report(corpus, single, concurrent)
+
+    save_path, compare_path = baseline_paths
+    if save_path:
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"✅ 基线已保存: {save_path}")
+
+    if compare_path:
+        with open(compare_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(result, baseline)
+        if regressions:
+            print(f"❌ 与基线相比有 {len(regressions)} 项超出容差:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("✅ 与基线相比没有超出容差的变化")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JPEG草稿模式解码基准测试：比较 compress_image 开启/关闭 draft 时的耗时和峰值内存
+
+用法: python scripts/benchmark_jpeg_draft.py [图片目录]
+未指定目录时在临时目录生成手机照片尺寸的测试图片（12/24/48百万像素）
+"""
+
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from PIL import Image
+
+# 常见手机照片尺寸
+CORPUS_SIZES = [(4000, 3000), (6000, 4000), (8000, 6000)]
+
+
+def generate_corpus(target_dir):
+    """生成带噪声纹理的大尺寸JPEG，文件大小接近真实手机照片"""
+    paths = []
+    for width, height in CORPUS_SIZES:
+        path = os.path.join(target_dir, f"phone_{width}x{height}.jpg")
+        if not os.path.exists(path):
+            base = Image.linear_gradient('L').resize((width, height))
+            noise = Image.effect_noise((width, height), 64)
+            img = Image.merge('RGB', (base, noise, Image.blend(base, noise, 0.5)))
+            img.save(path, 'JPEG', quality=95)
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb():
+    """当前进程的峰值内存（MB）
+
+    Linux下优先读取VmHWM：ru_maxrss在exec后会保留父进程的峰值，不适合子进程测量
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_once(path, draft, queue):
+    """在独立进程中执行一次压缩，返回耗时和峰值内存"""
+    from modules.image_processor import compress_image
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f, tempfile.TemporaryFile() as output:
+        img_io, _ = compress_image(f, draft=draft, output=output)
+        output_size = os.fstat(output.fileno()).st_size if img_io else 0
+    elapsed = time.perf_counter() - start
+
+    peak_rss = peak_rss_mb()
+    queue.put((elapsed, peak_rss, output_size))
+
+
+def measure(path, draft):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_once, args=(path, draft, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def run_benchmark(paths):
+    print(f"{'文件':<28} {'大小(MB)':>9} {'模式':<8} {'耗时(ms)':>10} {'峰值RSS(MB)':>12} {'输出(KB)':>10}")
+    print("-" * 84)
+    for path in paths:
+        size = os.path.getsize(path) / 1024 / 1024
+        for draft in (False, True):
+            elapsed, peak_rss, output_size = measure(path, draft)
+            mode = 'draft' if draft else 'full'
+            print(f"{os.path.basename(path):<28} {size:>9.1f} {mode:<8} {elapsed * 1000:>10.0f} {peak_rss:>12.0f} {output_size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        image_dir = sys.argv[1]
+        paths = sorted(
+            os.path.join(image_dir, name) for name in os.listdir(image_dir)
+            if name.lower().endswith(('.jpg', '.jpeg'))
+        )
+    else:
+        image_dir = os.path.join(tempfile.gettempdir(), 'violation_bench_jpeg')
+        os.makedirs(image_dir, exist_ok=True)
+        print(f"生成测试图片: {image_dir}")
+        paths = generate_corpus(image_dir)
+
+    if not paths:
+        print("❌ 没有找到JPEG图片")
+        sys.exit(1)
+
+    run_benchmark(paths)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静态资源构建脚本：生成带内容哈希的CSS/JS文件和资源清单
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.getcwd())
+
+from modules.assets import build_assets, ASSET_DIST_DIR, ASSET_MANIFEST
+
+if __name__ == "__main__":
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), 'static')
+
+    if not os.path.isdir(static_dir):
+        print(f"❌ 静态目录不存在: {static_dir}")
+        sys.exit(1)
+
+    manifest = build_assets(static_dir)
+    for logical_name, hashed_name in sorted(manifest.items()):
+        print(f"  {logical_name} -> {hashed_name}")
+    print(f"✅ 构建完成，共 {len(manifest)} 个资源，清单: {os.path.join(static_dir, ASSET_DIST_DIR, ASSET_MANIFEST)}")
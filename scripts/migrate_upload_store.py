@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传文件迁移脚本：将直接存放在 uploads/ 下的图片移入内容寻址存储，原文件名保留为别名
+
+迁移后违停记录中的 photo_path 无需修改；未迁移的文件仍可正常访问。
+同时为已存储的图片补充感知哈希（近似重复检测）和图片元数据（尺寸、EXIF等）。
+用法: python scripts/migrate_upload_store.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.getcwd())
+
+from modules.db import init_db, get_db_connection
+from modules.image_processor import UPLOAD_FOLDER, IMAGE_VARIANT_MIMETYPES
+from modules.image_hash import file_dhash, save_dhash
+from modules.image_metadata import photo_metadata, save_metadata
+from modules.image_store import add_blob, blob_path
+
+
+def is_variant_file(filename):
+    """同级的WebP/AVIF文件随原图一起迁移"""
+    base, ext = os.path.splitext(filename)
+    return ext[1:] in IMAGE_VARIANT_MIMETYPES and os.path.splitext(base)[1] != ''
+
+
+def migrate_uploads():
+    init_db()
+    conn = get_db_connection()
+    migrated = skipped = failed = 0
+
+    try:
+        cursor = conn.cursor()
+        with os.scandir(UPLOAD_FOLDER) as entries:
+            for entry in entries:
+                # 跳过子目录、隐藏文件、处理中的临时文件和其他格式文件
+                if not entry.is_file() or entry.name.startswith('.') or entry.name.endswith(('.part', '.upload')):
+                    continue
+                if is_variant_file(entry.name):
+                    continue
+
+                cursor.execute('SELECT 1 FROM image_aliases WHERE alias = ?', (entry.name,))
+                if cursor.fetchone():
+                    skipped += 1
+                    continue
+
+                _, ext = os.path.splitext(entry.name)
+                try:
+                    add_blob(conn, entry.path, ext.lower(), alias=entry.name)
+                    migrated += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ 迁移失败: {entry.name} - {str(e)}")
+    finally:
+        conn.close()
+
+    print(f"✅ 迁移完成: {migrated} 个文件，已存在 {skipped} 个，失败 {failed} 个")
+
+
+def backfill_dhashes():
+    """为缺少感知哈希的内容文件计算并记录哈希"""
+    conn = get_db_connection()
+    filled = 0
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT b.hash, b.ext FROM image_blobs b
+            LEFT JOIN image_phash p ON p.hash = b.hash
+            WHERE p.hash IS NULL
+        ''')
+        for digest, ext in cursor.fetchall():
+            value = file_dhash(blob_path(digest, ext))
+            if value is not None:
+                save_dhash(cursor, digest, value)
+                filled += 1
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"✅ 感知哈希补充完成: {filled} 个文件")
+
+
+def backfill_metadata():
+    """为缺少元数据的图片别名读取并记录元数据"""
+    conn = get_db_connection()
+    filled = 0
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT a.alias, b.hash, b.ext FROM image_aliases a
+            JOIN image_blobs b ON b.hash = a.hash
+            LEFT JOIN photo_metadata m ON m.photo = a.alias
+            WHERE m.photo IS NULL
+        ''')
+        for alias, digest, ext in cursor.fetchall():
+            path = blob_path(digest, ext)
+            if os.path.exists(path):
+                save_metadata(cursor, alias, photo_metadata(path))
+                filled += 1
+        conn.commit()
+    finally:
+        conn.close()
+
+    print(f"✅ 图片元数据补充完成: {filled} 个文件")
+
+
+if __name__ == "__main__":
+    if not os.path.isdir(UPLOAD_FOLDER):
+        print(f"❌ 上传目录不存在: {UPLOAD_FOLDER}")
+        sys.exit(1)
+    migrate_uploads()
+    backfill_dhashes()
+    backfill_metadata()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静态资源预压缩脚本：构建/部署时为static目录生成.gz和.br文件
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.getcwd())
+
+from modules.compression import precompress_static, brotli
+
+if __name__ == "__main__":
+    static_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), 'static')
+
+    if not os.path.isdir(static_dir):
+        print(f"❌ 静态目录不存在: {static_dir}")
+        sys.exit(1)
+
+    if brotli is None:
+        print("⚠️  未安装brotli，只生成.gz文件")
+
+    count = precompress_static(static_dir)
+    print(f"✅ 预压缩完成，共生成 {count} 个文件")
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量重新编码脚本：修改压缩参数（最大尺寸、质量、字节预算）或新增WebP/AVIF格式后，
+将违停记录引用的已有图片按新参数重新编码
+
+按内容文件处理（多个别名共用的图片只编码一次），在进程池中并行编码，新文件写入暂存目录后原子移入内容存储；
+每批结果在一个事务中更新别名、图片元数据和违停记录路径，并写入检查点，中断后再次运行从检查点继续。
+编码进程降低CPU优先级并按 --max-mbps 限制读写速度，可以在正常服务期间运行。
+
+用法: python scripts/reencode_uploads.py [选项]
+    --max-width N / --max-height N / --quality N / --target-kb N   新的压缩参数（默认取当前配置）
+    --force               已符合新参数的图片也重新编码
+    --workers N           编码进程数（默认与压缩任务进程池相同）
+    --batch-size N        每批更新数据库的图片数（默认50）
+    --max-mbps N          全部进程合计的读写速度上限 MB/s（默认20，0为不限制）
+    --limit N             最多处理的图片数（试运行）
+    --dry-run             只统计需要重新编码的图片
+    --restart             忽略检查点重新开始
+
+迁移前直接存放在 uploads/ 下的文件不处理，请先运行 scripts/migrate_upload_store.py。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+sys.path.insert(0, os.getcwd())
+
+from modules.db import init_db, get_db_connection, fetch_record_photo_names
+from modules.decode_budget import configure_decode_limits
+from modules.image_inspect import inspect_image
+from modules.image_jobs import COMPRESS_POOL_WORKERS
+from modules.image_processor import (COMPRESSED_MAX_WIDTH, COMPRESSED_MAX_HEIGHT, COMPRESSED_QUALITY, COMPRESSED_TARGET_BYTES,
+                                     IMAGE_VARIANT_FORMATS, compress_image, image_variant_paths, remove_image_variants)
+from modules.image_store import blob_path, hash_file, replace_blobs, temp_path
+
+CHECKPOINT_PATH = os.path.join(os.getcwd(), 'data', 'reencode_checkpoint.json')
+# 编码进程的CPU优先级（nice值），为正常请求让出CPU
+REENCODE_NICE = 10
+# 判断已符合新参数时允许的质量估算误差
+QUALITY_SLACK = 2
+
+
+def build_profile(args):
+    return {
+        'max_width': args.max_width,
+        'max_height': args.max_height,
+        'quality': args.quality,
+        'target_bytes': args.target_kb * 1024 if args.target_kb else None,
+        'variants': list(IMAGE_VARIANT_FORMATS),
+    }
+
+
+def conforms(path, header, profile):
+    """图片已是新参数下的编码结果：JPEG、尺寸和字节数在范围内、质量不高于新质量，且其他格式文件齐全"""
+    if not header or header['format'] != 'JPEG' or header['quality'] is None:
+        return False
+    if header['width'] > profile['max_width'] or header['height'] > profile['max_height']:
+        return False
+    if header['quality'] > profile['quality'] + QUALITY_SLACK:
+        return False
+    if profile['target_bytes'] and header['size'] > profile['target_bytes']:
+        return False
+    return set(profile['variants']) <= set(image_variant_paths(path))
+
+
+def _init_worker():
+    """编码进程降低优先级并使用与服务相同的解码像素上限，压缩函数的过程日志不输出"""
+    configure_decode_limits()
+    try:
+        os.nice(REENCODE_NICE)
+    except (AttributeError, OSError):
+        pass
+    sys.stdout = open(os.devnull, 'w')
+
+
+def reencode_blob(digest, ext, profile, force, dry_run, byte_rate):
+    """在进程池中执行：按新参数重新编码一个内容文件，返回结果字典（'status' 为 reencoded/skipped/missing/failed/pending）
+
+    新文件写入暂存目录，由主进程在事务中替换；byte_rate 为本进程的读写速度上限（字节/秒）
+    """
+    started = time.monotonic()
+    source = blob_path(digest, ext)
+    result = {'hash': digest, 'status': 'skipped'}
+    if not os.path.exists(source):
+        result['status'] = 'missing'
+        return result
+
+    with open(source, 'rb') as f:
+        header = inspect_image(f)
+    if not force and conforms(source, header, profile):
+        return result
+    if dry_run:
+        result['status'] = 'pending'
+        return result
+
+    tmp_path = temp_path()
+    info = {}
+    try:
+        with open(source, 'rb') as f, open(tmp_path, 'w+b') as output:
+            img_io, save_format = compress_image(
+                f, max_width=profile['max_width'], max_height=profile['max_height'], quality=profile['quality'],
+                output=output, target_bytes=profile['target_bytes'],
+                variant_base=tmp_path if profile['variants'] else None, info=info, passthrough=False,
+                quality_policy='flag'
+            )
+        if not img_io:
+            raise ValueError('压缩失败')
+        result.update(status='reencoded', path=tmp_path, ext=f".{save_format}", new_hash=hash_file(tmp_path),
+                      dhash=info.get('dhash'), metadata=info.get('metadata'),
+                      input_bytes=os.path.getsize(source), output_bytes=os.path.getsize(tmp_path))
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        remove_image_variants(tmp_path)
+        result.update(status='failed', error=str(e))
+        return result
+
+    # 按读写的字节数限速
+    if byte_rate:
+        moved = result['input_bytes'] + result['output_bytes'] + sum(
+            os.path.getsize(path) for path in image_variant_paths(tmp_path).values())
+        delay = moved / byte_rate - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+    return result
+
+
+def load_checkpoint(profile, restart):
+    """读取检查点，参数不同或指定重新开始时返回空集合"""
+    if restart or not os.path.exists(CHECKPOINT_PATH):
+        return set()
+    with open(CHECKPOINT_PATH, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('profile') != profile:
+        print("⚠️  压缩参数与检查点不同，重新开始")
+        return set()
+    return set(checkpoint['done'])
+
+
+def save_checkpoint(profile, done):
+    """原子写入检查点"""
+    tmp_path = f"{CHECKPOINT_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'profile': profile, 'done': sorted(done), 'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')}, f)
+    os.replace(tmp_path, CHECKPOINT_PATH)
+
+
+def collect_blobs():
+    """违停记录引用的内容文件 [(哈希, 扩展名)]，以及迁移前直接存放、不在内容存储中的图片数"""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        photos = fetch_record_photo_names(cursor)
+        blobs = {}
+        legacy = 0
+        for photo in photos:
+            cursor.execute('''
+                SELECT b.hash, b.ext FROM image_aliases a
+                JOIN image_blobs b ON b.hash = a.hash
+                WHERE a.alias = ?
+            ''', (photo,))
+            row = cursor.fetchone()
+            if row:
+                blobs.setdefault(row[0], row[1])
+            else:
+                legacy += 1
+    finally:
+        conn.close()
+    return list(blobs.items()), legacy
+
+
+def flush(conn, batch, done, profile, counts):
+    """在一个事务中替换一批内容文件并写入检查点"""
+    replacements = [result for result in batch if result['status'] == 'reencoded']
+    try:
+        replace_blobs(conn, replacements)
+    except Exception as e:
+        print(f"❌ 更新数据库失败，本批 {len(replacements)} 张图片下次重试: {str(e)}")
+        for result in replacements:
+            if os.path.exists(result['path']):
+                os.remove(result['path'])
+            remove_image_variants(result['path'])
+        counts['reencoded'] -= len(replacements)
+        counts['failed'] += len(replacements)
+        batch = [result for result in batch if result['status'] != 'reencoded']
+    done.update(result['hash'] for result in batch if result['status'] in ('reencoded', 'skipped', 'missing'))
+    # 重新编码后的内容已符合新参数，继续运行时不再检查
+    done.update(result['new_hash'] for result in batch if result['status'] == 'reencoded')
+    save_checkpoint(profile, done)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按新的压缩参数重新编码已有图片')
+    parser.add_argument('--max-width', type=int, default=COMPRESSED_MAX_WIDTH)
+    parser.add_argument('--max-height', type=int, default=COMPRESSED_MAX_HEIGHT)
+    parser.add_argument('--quality', type=int, default=COMPRESSED_QUALITY)
+    parser.add_argument('--target-kb', type=int, default=COMPRESSED_TARGET_BYTES // 1024)
+    parser.add_argument('--force', action='store_true')
+    parser.add_argument('--workers', type=int, default=COMPRESS_POOL_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--max-mbps', type=float, default=20)
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--restart', action='store_true')
+    args = parser.parse_args()
+
+    init_db()
+    profile = build_profile(args)
+    done = set() if args.dry_run else load_checkpoint(profile, args.restart)
+    blobs, legacy = collect_blobs()
+    if legacy:
+        print(f"⚠️  {legacy} 张图片不在内容存储中，已跳过，请先运行 scripts/migrate_upload_store.py")
+    remaining = [(digest, ext) for digest, ext in blobs if digest not in done]
+    todo = remaining[:args.limit] if args.limit else remaining
+    print(f"共 {len(blobs)} 个内容文件，检查点已完成 {len(blobs) - len(remaining)} 个，"
+          f"本次处理 {len(todo)} 个（{args.workers} 个进程）")
+
+    byte_rate = args.max_mbps * 1024 * 1024 / args.workers if args.max_mbps else None
+    counts = {'reencoded': 0, 'skipped': 0, 'missing': 0, 'failed': 0, 'pending': 0}
+    saved_bytes = 0
+    batch = []
+    conn = get_db_connection()
+    started = time.monotonic()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+            queue = iter(todo)
+            running = set()
+            while True:
+                # 提交的任务数保持在进程数的两倍以内，未完成的编码结果不会大量堆积在暂存目录
+                while len(running) < args.workers * 2:
+                    item = next(queue, None)
+                    if item is None:
+                        break
+                    running.add(executor.submit(reencode_blob, *item, profile, args.force, args.dry_run, byte_rate))
+                if not running:
+                    break
+
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    counts[result['status']] += 1
+                    if result['status'] == 'failed':
+                        print(f"❌ 重新编码失败: {result['hash'][:12]} - {result['error']}")
+                    elif result['status'] == 'reencoded':
+                        saved_bytes += result['input_bytes'] - result['output_bytes']
+                    batch.append(result)
+
+                if len(batch) >= args.batch_size and not args.dry_run:
+                    flush(conn, batch, done, profile, counts)
+                    batch = []
+                    processed = sum(counts.values())
+                    print(f"进度 {processed}/{len(todo)}：重新编码 {counts['reencoded']}，已符合 {counts['skipped']}，"
+                          f"失败 {counts['failed']}，{processed / (time.monotonic() - started):.1f} 张/秒")
+        if batch and not args.dry_run:
+            flush(conn, batch, done, profile, counts)
+    except KeyboardInterrupt:
+        # 已编码但未提交的文件丢弃，下次从检查点继续
+        for result in batch:
+            if result.get('path') and os.path.exists(result['path']):
+                os.remove(result['path'])
+                remove_image_variants(result['path'])
+        print("⚠️  已中断，再次运行从检查点继续")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    if args.dry_run:
+        print(f"✅ 需要重新编码 {counts['pending']} 个，已符合新参数 {counts['skipped']} 个，文件缺失 {counts['missing']} 个")
+        return
+    print(f"✅ 完成：重新编码 {counts['reencoded']} 个，已符合新参数 {counts['skipped']} 个，文件缺失 {counts['missing']} 个，"
+          f"失败 {counts['failed']} 个，节省 {saved_bytes / 1024 / 1024:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
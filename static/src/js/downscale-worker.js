@@ -0,0 +1,149 @@
+// 上传前在浏览器中缩小编码图片（在Worker中执行，不阻塞页面）
+// 按服务端的存储要求（/api/storage-profile）缩小到最大尺寸内，并在质量范围内查找满足字节预算的JPEG，
+// 符合要求的JPEG服务端原样保存，不再重新压缩
+
+// 每次缩小不超过一半，避免一步缩小过多产生锯齿
+const DOWNSCALE_STEP = 0.5;
+// 从原图开头查找EXIF段的字节数
+const EXIF_SEARCH_BYTES = 128 * 1024;
+const EXIF_HEADER = [0x45, 0x78, 0x69, 0x66, 0x00, 0x00];  // "Exif\0\0"
+const EXIF_ORIENTATION_TAG = 0x0112;
+
+self.onmessage = function(event) {
+    const { id, file, profile } = event.data;
+    downscaleImage(file, profile)
+        .then(result => self.postMessage({ id, ...result }))
+        .catch(error => self.postMessage({ id, error: error.message }));
+};
+
+async function downscaleImage(file, profile) {
+    // 按EXIF方向解码，画布中的像素已经是正向的
+    const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    const scale = Math.min(profile.max_width / bitmap.width, profile.max_height / bitmap.height, 1);
+    const width = Math.floor(bitmap.width * scale);
+    const height = Math.floor(bitmap.height * scale);
+
+    // 尺寸和大小已符合要求的JPEG直接上传
+    if (scale === 1 && file.type === profile.format && file.size <= profile.target_bytes) {
+        bitmap.close();
+        return { blob: null, width, height };
+    }
+
+    const canvas = drawScaled(bitmap, width, height);
+    bitmap.close();
+
+    const encoded = await fitBudget(canvas, profile);
+    const exif = await readExifSegment(file);
+    // 像素已旋转为正向，复制的EXIF方向改为1，避免查看器再旋转一次
+    const blob = exif ? insertSegment(encoded, resetOrientation(exif)) : encoded;
+    return { blob, width, height };
+}
+
+function drawScaled(source, width, height) {
+    let current = source;
+    let currentWidth = source.width;
+    let currentHeight = source.height;
+
+    while (currentWidth * DOWNSCALE_STEP > width && currentHeight * DOWNSCALE_STEP > height) {
+        currentWidth = Math.floor(currentWidth * DOWNSCALE_STEP);
+        currentHeight = Math.floor(currentHeight * DOWNSCALE_STEP);
+        current = drawTo(current, currentWidth, currentHeight);
+    }
+    return drawTo(current, width, height);
+}
+
+function drawTo(source, width, height) {
+    const canvas = new OffscreenCanvas(width, height);
+    const context = canvas.getContext('2d');
+    context.imageSmoothingEnabled = true;
+    context.imageSmoothingQuality = 'high';
+    context.drawImage(source, 0, 0, width, height);
+    return canvas;
+}
+
+// 与服务端 fit_jpeg_budget 相同：最高质量满足预算时直接使用，否则在 [min_quality, quality] 内二分查找
+async function fitBudget(canvas, profile) {
+    const encode = quality => canvas.convertToBlob({ type: profile.format, quality: quality / 100 });
+
+    let best = await encode(profile.quality);
+    if (!profile.target_bytes || best.size <= profile.target_bytes) {
+        return best;
+    }
+
+    let lo = profile.min_quality;
+    let hi = profile.quality;
+    best = await encode(lo);
+    if (best.size > profile.target_bytes) {
+        // 最低质量仍超出预算，交给服务端缩小
+        return best;
+    }
+    while (hi - lo > 1) {
+        const mid = Math.floor((lo + hi) / 2);
+        const blob = await encode(mid);
+        if (blob.size <= profile.target_bytes) {
+            lo = mid;
+            best = blob;
+        } else {
+            hi = mid;
+        }
+    }
+    return best;
+}
+
+// 取出原图的EXIF段（APP1），画布编码的JPEG不含EXIF，服务端需要从中读取拍摄时间和GPS
+async function readExifSegment(file) {
+    if (file.type !== 'image/jpeg') {
+        return null;
+    }
+    const bytes = new Uint8Array(await file.slice(0, EXIF_SEARCH_BYTES).arrayBuffer());
+    if (bytes[0] !== 0xFF || bytes[1] !== 0xD8) {
+        return null;
+    }
+
+    let offset = 2;
+    while (offset + 4 <= bytes.length && bytes[offset] === 0xFF) {
+        const marker = bytes[offset + 1];
+        const length = (bytes[offset + 2] << 8) | bytes[offset + 3];
+        // 扫描数据开始后不再有附加段
+        if (marker === 0xDA) {
+            break;
+        }
+        if (marker === 0xE1 && offset + 2 + length <= bytes.length &&
+            EXIF_HEADER.every((value, i) => bytes[offset + 4 + i] === value)) {
+            return bytes.slice(offset, offset + 2 + length);
+        }
+        offset += 2 + length;
+    }
+    return null;
+}
+
+// 把EXIF段（APP1）IFD0中的方向标签改为1（正常），返回修改后的段
+function resetOrientation(segment) {
+    const view = new DataView(segment.buffer, segment.byteOffset, segment.byteLength);
+    const tiff = 4 + EXIF_HEADER.length;
+    if (segment.length < tiff + 8) {
+        return segment;
+    }
+    const littleEndian = view.getUint16(tiff) === 0x4949;  // "II"
+    const ifd = tiff + view.getUint32(tiff + 4, littleEndian);
+    if (ifd + 2 > segment.length) {
+        return segment;
+    }
+    const count = view.getUint16(ifd, littleEndian);
+    for (let i = 0; i < count; i++) {
+        const entry = ifd + 2 + i * 12;
+        if (entry + 12 > segment.length) {
+            break;
+        }
+        if (view.getUint16(entry, littleEndian) === EXIF_ORIENTATION_TAG) {
+            view.setUint16(entry + 8, 1, littleEndian);
+            break;
+        }
+    }
+    return segment;
+}
+
+// 把段插入到JPEG的SOI标记之后
+function insertSegment(blob, segment) {
+    return new Blob([blob.slice(0, 2), segment, blob.slice(2)], { type: blob.type });
+}
@@ -0,0 +1,1206 @@
+// 页面加载时恢复之前的车牌号和设置默认时间
+window.addEventListener('DOMContentLoaded', function() {
+    const savedPlate = localStorage.getItem('lastLicensePlate');
+    const savedProvince = localStorage.getItem('lastProvince');
+    const savedLetter = localStorage.getItem('lastLetter');
+
+    if (savedPlate && savedProvince) {
+        document.getElementById('license_plate').value = savedPlate;
+        document.getElementById('province_prefix').value = savedProvince;
+
+        if (savedLetter) {
+            document.getElementById('letter_prefix').value = savedLetter;
+        }
+
+        updateLicensePlateValidation();
+    }
+
+    // 设置默认违规时间为当前时间
+    const now = new Date();
+    const year = now.getFullYear();
+    const month = String(now.getMonth() + 1).padStart(2, '0');
+    const day = String(now.getDate()).padStart(2, '0');
+    const hours = String(now.getHours()).padStart(2, '0');
+    const minutes = String(now.getMinutes()).padStart(2, '0');
+
+    const defaultDateTime = `${year}-${month}-${day}T${hours}:${minutes}`;
+    document.getElementById('violation_time').value = defaultDateTime;
+});
+
+document.getElementById('violationForm').addEventListener('submit', function(e) {
+    e.preventDefault();
+
+    // 防止重复提交
+    const submitButton = this.querySelector('button[type="submit"]');
+    if (submitButton.classList.contains('submitting')) {
+        console.log('提交已在进行中，阻止重复提交');
+        return; // 如果按钮已标记为提交中，说明正在提交中，直接返回
+    }
+
+    const provincePrefix = document.getElementById('province_prefix').value;
+    const letterPrefix = document.getElementById('letter_prefix').value;
+    const licensePlate = document.getElementById('license_plate').value;
+
+    if (!provincePrefix) {
+        showMessage('请选择省份', 'error');
+        return;
+    }
+
+    if (provincePrefix !== '特殊' && !letterPrefix) {
+        showMessage('请选择字母', 'error');
+        return;
+    }
+
+    if (!licensePlate) {
+        showMessage('请输入车牌号码', 'error');
+        return;
+    }
+
+    let fullLicensePlate;
+
+    if (provincePrefix === '特殊') {
+        // 特殊车牌：省份 + 第三格内容
+        fullLicensePlate = provincePrefix + licensePlate;
+    } else {
+        // 普通车牌：省份 + 字母 + 第三格内容
+        // 验证车牌长度（第三格5-6位）
+        if (licensePlate.length < 5 || licensePlate.length > 6) {
+            showMessage('车牌号码应为5-6位', 'error');
+            return;
+        }
+
+        fullLicensePlate = provincePrefix + letterPrefix + licensePlate;
+
+        // 前端格式验证 - 只做基础检查，具体的格式验证交给后端
+        if (fullLicensePlate.length < 7) {
+            showMessage('车牌号码格式不完整', 'error');
+            return;
+        }
+    }
+
+    // 禁用提交按钮，防止重复提交
+    submitButton.disabled = true;
+    submitButton.classList.add('submitting');
+    const originalButtonText = submitButton.innerHTML;
+    submitButton.innerHTML = '提交中...';
+
+    const formData = new FormData(this);
+    // 保留原始的license_plate字段用于获取location等值
+    formData.set('license_plate', fullLicensePlate);
+    formData.delete('province_prefix');
+    formData.delete('letter_prefix');
+
+    // 确保违规时间被正确添加
+    const violationTime = document.getElementById('violation_time').value;
+    if (violationTime) {
+        formData.set('violation_time', violationTime);
+    }
+
+    // 添加多张照片文件到FormData（优先使用压缩后的文件）
+    if (compressedImages.length > 0) {
+        // 添加多张压缩后的图片路径
+        compressedImages.forEach(img => {
+            formData.append('compressed_photos', img.path);
+        });
+    } else if (window.compressedFilePath) {
+        // 单张压缩图片（向后兼容）
+        formData.append('compressed_photo_path', window.compressedFilePath);
+    } else if (window.selectedFiles && window.selectedFiles.length > 0) {
+        // 直接上传原始文件（如果没有压缩）
+        const files = window.selectedFiles;
+        files.forEach(file => {
+            formData.append('photo', file);
+        });
+    } else {
+        // 原始文件上传
+        const photoInput = document.getElementById('photoInput');
+        if (photoInput.files.length > 0) {
+            const files = Array.from(photoInput.files);
+            files.forEach(file => {
+                formData.append('photo', file);
+            });
+        }
+    }
+
+    fetch('/submit_violation', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => {
+        // 检查响应状态
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return response.json();
+    })
+    .then(data => {
+        // 恢复提交按钮状态
+        if (submitButton) {
+            submitButton.disabled = false;
+            submitButton.classList.remove('submitting');
+            submitButton.innerHTML = originalButtonText;
+        }
+
+        if (data.success) {
+            // 保存当前车牌号到localStorage
+            const currentPlate = document.getElementById('license_plate').value;
+            const currentProvince = document.getElementById('province_prefix').value;
+            const currentLetter = document.getElementById('letter_prefix').value;
+            localStorage.setItem('lastLicensePlate', currentPlate);
+            localStorage.setItem('lastProvince', currentProvince);
+            localStorage.setItem('lastLetter', currentLetter);
+
+            // 清空压缩图片缓存
+            compressedImages = [];
+            window.compressedFilePath = null;
+            window.selectedFiles = null; // 清除选中的文件
+
+            // 隐藏上传按钮
+            const uploadButton = document.getElementById('uploadButton');
+            if (uploadButton) {
+                uploadButton.style.display = 'none';
+            }
+
+            // 清空文件输入框
+            const photoInput = document.getElementById('photoInput');
+            if (photoInput) {
+                photoInput.value = '';
+            }
+
+            // 清空预览区域
+            const imagePreview = document.getElementById('imagePreview');
+            const multiImagePreview = document.getElementById('multiImagePreview');
+            if (imagePreview) {
+                imagePreview.style.display = 'none';
+            }
+            if (multiImagePreview) {
+                multiImagePreview.style.display = 'none';
+            }
+
+            // 显示成功提示（与该车牌已有图片近似重复时一并提示）
+            let successMessage = data.message;
+            if (data.duplicate_photos && data.duplicate_photos.length) {
+                successMessage += `（${data.duplicate_photos.length} 张图片与该车牌已有记录的图片近似重复）`;
+            }
+            showSuccessModal('🎉 违停记录提交成功！', successMessage);
+
+            // 3秒后自动跳转到统计页面
+            setTimeout(() => {
+                window.location.href = '/';
+            }, 3000);
+        } else {
+            showMessage(data.message, 'error');
+        }
+    })
+    .catch(error => {
+        // 恢复提交按钮状态
+        if (submitButton) {
+            submitButton.disabled = false;
+            submitButton.classList.remove('submitting');
+            submitButton.innerHTML = originalButtonText;
+        }
+
+        console.error('提交请求失败:', error);
+        // 检查是否是网络问题或其他错误
+        if (error.name === 'TypeError' && error.message.includes('fetch')) {
+            showMessage('网络连接失败，请检查网络后重试', 'error');
+        } else {
+            showMessage('提交失败: ' + error.message + '，请重试', 'error');
+        }
+    });
+});
+
+function showMessage(message, type) {
+    const messageDiv = document.getElementById('message');
+    messageDiv.className = `message ${type}`;
+    messageDiv.textContent = message;
+    messageDiv.style.display = 'block';
+
+    setTimeout(() => {
+        messageDiv.style.display = 'none';
+    }, 3000);
+}
+
+function showSuccessModal(title, message) {
+    // 创建弹窗元素
+    const modal = document.createElement('div');
+    modal.className = 'success-modal';
+
+    modal.innerHTML = `
+        <div class="success-modal-content">
+            <div class="success-modal-icon">🎉</div>
+            <div class="success-modal-title">${title}</div>
+            <div class="success-modal-message">${message}</div>
+            <div class="success-modal-countdown">3秒后自动跳转到统计页面...</div>
+            <button class="success-modal-close" onclick="window.location.href='/'">立即查看统计</button>
+        </div>
+    `;
+
+    // 添加到页面
+    document.body.appendChild(modal);
+
+    // 倒计时更新
+    let countdown = 3;
+    const countdownElement = modal.querySelector('.success-modal-countdown');
+
+    const countdownInterval = setInterval(() => {
+        countdown--;
+        if (countdown > 0) {
+            countdownElement.textContent = `${countdown}秒后自动跳转到统计页面...`;
+        } else {
+            clearInterval(countdownInterval);
+        }
+    }, 1000);
+
+    // 点击背景关闭（可选）
+    modal.addEventListener('click', function(e) {
+        if (e.target === modal) {
+            document.body.removeChild(modal);
+            clearInterval(countdownInterval);
+        }
+    });
+}
+
+function takePhoto() {
+    const isSecureContext = window.isSecureContext || location.protocol === 'https:' || location.hostname === 'localhost';
+
+    if (!isSecureContext) {
+        showAlternativeCameraOptions();
+        return;
+    }
+
+    if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
+        showAlternativeCameraOptions();
+        return;
+    }
+
+    navigator.mediaDevices.getUserMedia({ 
+        video: { 
+            facingMode: 'environment',
+            width: { ideal: 1280 },
+            height: { ideal: 720 }
+        } 
+    })
+    .then(stream => {
+        createCameraModal(stream);
+    })
+    .catch(err => {
+        console.error('无法访问摄像头:', err);
+        showAlternativeCameraOptions();
+    });
+}
+
+function createCameraModal(stream) {
+    const video = document.createElement('video');
+    video.style.width = '100%';
+    video.style.maxWidth = '400px';
+    video.style.borderRadius = '10px';
+    video.style.marginBottom = '20px';
+    video.autoplay = true;
+    video.srcObject = stream;
+
+    const canvas = document.createElement('canvas');
+    canvas.style.display = 'none';
+
+    const captureBtn = document.createElement('button');
+    captureBtn.textContent = '📸 拍照';
+    captureBtn.className = 'btn';
+    captureBtn.style.marginBottom = '10px';
+
+    const cancelBtn = document.createElement('button');
+    cancelBtn.textContent = '❌ 取消';
+    cancelBtn.className = 'btn';
+    cancelBtn.style.background = 'linear-gradient(135deg, #ff6b6b 0%, #ee5a24 100%)';
+
+    const modal = document.createElement('div');
+    modal.style.cssText = `
+        position: fixed;
+        top: 0;
+        left: 0;
+        width: 100%;
+        height: 100%;
+        background: rgba(0,0,0,0.8);
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+        align-items: center;
+        z-index: 1000;
+        padding: 20px;
+    `;
+
+    modal.appendChild(video);
+    modal.appendChild(canvas);
+    modal.appendChild(captureBtn);
+    modal.appendChild(cancelBtn);
+    document.body.appendChild(modal);
+
+    captureBtn.onclick = function() {
+        // 已获取存储要求时直接按最大尺寸截取，上传前无需再缩小
+        const profile = storageProfile;
+        const scale = profile ? Math.min(profile.max_width / video.videoWidth, profile.max_height / video.videoHeight, 1) : 1;
+        canvas.width = Math.floor(video.videoWidth * scale);
+        canvas.height = Math.floor(video.videoHeight * scale);
+        const context = canvas.getContext('2d');
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(video, 0, 0, canvas.width, canvas.height);
+
+        stream.getTracks().forEach(track => track.stop());
+
+        canvas.toBlob(function(blob) {
+            const url = URL.createObjectURL(blob);
+            showPhotoPreview(url, modal, blob);
+        }, 'image/jpeg', profile ? profile.quality / 100 : 0.8);
+    };
+
+    cancelBtn.onclick = function() {
+        stream.getTracks().forEach(track => track.stop());
+        document.body.removeChild(modal);
+    };
+}
+
+function showPhotoPreview(url, modal, blob) {
+    const img = document.createElement('img');
+    img.src = url;
+    img.style.width = '100%';
+    img.style.maxWidth = '300px';
+    img.style.borderRadius = '10px';
+    img.style.marginTop = '20px';
+
+    modal.innerHTML = '';
+    modal.appendChild(img);
+
+    const saveBtn = document.createElement('button');
+    saveBtn.textContent = '💾 保存照片';
+    saveBtn.className = 'btn';
+    saveBtn.style.marginTop = '20px';
+    saveBtn.onclick = function() {
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = `violation_${new Date().getTime()}.jpg`;
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+
+        showMessage('照片已保存到本地', 'success');
+        document.body.removeChild(modal);
+        URL.revokeObjectURL(url);
+    };
+
+    const closeBtn = document.createElement('button');
+    closeBtn.textContent = '❌ 关闭';
+    closeBtn.className = 'btn';
+    closeBtn.style.background = 'linear-gradient(135deg, #ff6b6b 0%, #ee5a24 100%)';
+    closeBtn.style.marginLeft = '10px';
+    closeBtn.onclick = function() {
+        document.body.removeChild(modal);
+        URL.revokeObjectURL(url);
+    };
+
+    // 拍摄的照片直接作为待上传的照片
+    const useBtn = document.createElement('button');
+    useBtn.textContent = '📤 使用这张照片';
+    useBtn.className = 'btn';
+    useBtn.style.marginTop = '20px';
+    useBtn.style.marginLeft = '10px';
+    useBtn.onclick = function() {
+        compressedImages = [];
+        window.compressedFilePath = null;
+        window.selectedFiles = [new File([blob], `violation_${new Date().getTime()}.jpg`, { type: 'image/jpeg' })];
+
+        const uploadButton = document.getElementById('uploadButton');
+        if (uploadButton) {
+            uploadButton.style.display = 'block';
+        }
+        showMessage('已选择拍摄的照片', 'success');
+        document.body.removeChild(modal);
+        URL.revokeObjectURL(url);
+    };
+
+    modal.appendChild(saveBtn);
+    modal.appendChild(useBtn);
+    modal.appendChild(closeBtn);
+}
+
+function showAlternativeCameraOptions() {
+    const modal = document.createElement('div');
+    modal.style.cssText = `
+        position: fixed;
+        top: 0;
+        left: 0;
+        width: 100%;
+        height: 100%;
+        background: rgba(0,0,0,0.8);
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+        align-items: center;
+        z-index: 1000;
+        padding: 20px;
+        color: white;
+    `;
+
+    modal.innerHTML = `
+        <div style="background: white; color: #333; padding: 30px; border-radius: 15px; max-width: 400px; text-align: center;">
+            <h3 style="margin-bottom: 20px;">📷 相机功能不可用</h3>
+            <p style="margin-bottom: 20px; line-height: 1.5;">
+                由于浏览器安全限制，无法直接访问相机。请尝试以下方法：
+            </p>
+            <div style="text-align: left; margin-bottom: 20px;">
+                <p style="margin-bottom: 10px;">📱 <strong>手机用户：</strong></p>
+                <p style="margin-left: 20px; margin-bottom: 10px;">• 使用系统相机拍照后上传</p>
+                <p style="margin-bottom: 10px;">💻 <strong>电脑用户：</strong></p>
+                <p style="margin-left: 20px; margin-bottom: 10px;">• 确保使用HTTPS或localhost</p>
+                <p style="margin-left: 20px; margin-bottom: 10px;">• 检查浏览器相机权限</p>
+            </div>
+            <div style="margin-bottom: 20px;">
+                <label for="fileUpload" style="display: inline-block; padding: 10px 20px; background: #4facfe; color: white; border-radius: 8px; cursor: pointer;">
+                    📁 选择照片上传
+                </label>
+                <input type="file" id="fileUpload" accept="image/*" multiple style="display: none;" onchange="handleFileSelect(this)">
+            </div>
+            <button onclick="document.body.removeChild(this.closest('div').parentElement)" style="padding: 10px 20px; background: #ff6b6b; color: white; border: none; border-radius: 8px; cursor: pointer;">
+                关闭
+            </button>
+        </div>
+    `;
+
+    document.body.appendChild(modal);
+}
+
+function handleFileSelect(input) {
+    const file = input.files[0];
+    if (file && file.type.startsWith('image/')) {
+        showMessage(`已选择照片: ${file.name}`, 'success');
+    }
+}
+
+// 存储多张压缩后的图片信息
+let compressedImages = [];
+
+// 上传状态控制
+let isUploading = false;
+
+function handlePhotoSelect(input) {
+    // 清空之前的压缩图片缓存
+    compressedImages = [];
+    window.compressedFilePath = null;
+
+    const files = Array.from(input.files);
+    if (files.length === 0) return;
+
+    // 验证所有文件都是图片
+    const nonImageFiles = files.filter(file => !file.type.startsWith('image/'));
+    if (nonImageFiles.length > 0) {
+        showMessage('请只选择图片文件', 'error');
+        input.value = '';
+        return;
+    }
+
+    // 显示选中的文件信息
+    if (files.length === 1) {
+        showMessage(`已选择1张图片: ${files[0].name}`, 'success');
+    } else {
+        showMessage(`已选择${files.length}张图片`, 'success');
+    }
+
+    // 显示上传按钮
+    const uploadButton = document.getElementById('uploadButton');
+    if (uploadButton) {
+        uploadButton.style.display = 'block';
+    }
+
+    // 保存选中的文件到全局变量，供上传时使用
+    window.selectedFiles = files;
+}
+
+function uploadSelectedPhotos() {
+    // 检查是否已选择文件
+    if (!window.selectedFiles || window.selectedFiles.length === 0) {
+        showMessage('请先选择照片', 'error');
+        return;
+    }
+
+    // 检查是否正在上传
+    if (isUploading) {
+        showMessage('⏳ 正在处理图片，请等待完成后再上传', 'warning');
+        return;
+    }
+
+    const files = window.selectedFiles;
+
+    // 设置上传状态为true
+    isUploading = true;
+    disableUploadControls(true);
+
+    // 隐藏之前的预览
+    const compressedPreview = document.getElementById('compressedPreview');
+    const multiImagePreview = document.getElementById('multiImagePreview');
+    if (compressedPreview) compressedPreview.style.display = 'none';
+    if (multiImagePreview) multiImagePreview.style.display = 'none';
+
+    // 隐藏上传按钮
+    const uploadButton = document.getElementById('uploadButton');
+    if (uploadButton) {
+        uploadButton.style.display = 'none';
+    }
+
+    if (files.length === 1) {
+        // 单张图片处理（原有逻辑）
+        const file = files[0];
+        showMessage(`正在压缩照片: ${file.name}...`, 'success');
+        compressAndPreviewImage(file, 0, 1);
+    } else {
+        // 多张图片处理 - 顺序处理
+        showMessage(`开始处理 ${files.length} 张图片...`, 'success');
+        processImagesSequentially(files, 0);
+    }
+}
+
+function uploadSelectedPhotos() {
+    // 检查是否正在上传
+    if (isUploading) {
+        showMessage('⏳ 正在处理图片，请等待完成后再上传', 'warning');
+        return;
+    }
+
+    const files = window.selectedFiles;
+    if (!files || files.length === 0) {
+        showMessage('请选择要上传的照片', 'error');
+        return;
+    }
+
+    // 设置上传状态为true
+    isUploading = true;
+    disableUploadControls(true);
+
+    // 清空之前的压缩图片
+    compressedImages = [];
+    window.compressedFilePath = null;
+
+    // 隐藏之前的预览
+    const compressedPreview = document.getElementById('compressedPreview');
+    const multiImagePreview = document.getElementById('multiImagePreview');
+    if (compressedPreview) compressedPreview.style.display = 'none';
+    if (multiImagePreview) multiImagePreview.style.display = 'none';
+
+    if (files.length === 1) {
+        // 单张图片处理（原有逻辑）
+        const file = files[0];
+        showMessage(`正在压缩照片: ${file.name}...`, 'success');
+        compressAndPreviewImage(file, 0, 1);
+    } else {
+        // 多张图片处理 - 顺序处理
+        showMessage(`开始处理 ${files.length} 张图片...`, 'success');
+        processImagesSequentially(files, 0);
+    }
+}
+
+function processImagesSequentially(files, currentIndex) {
+    if (currentIndex >= files.length) {
+        // 所有图片处理完成
+        showMultiImagePreview();
+        // 重新启用上传控件
+        isUploading = false;
+        disableUploadControls(false);
+        return;
+    }
+
+    const file = files[currentIndex];
+    compressAndPreviewImage(file, currentIndex, files.length, () => {
+        // 处理完当前图片后，处理下一张
+        setTimeout(() => {
+            processImagesSequentially(files, currentIndex + 1);
+        }, 300); // 间隔300ms
+    });
+}
+
+function compressAndPreviewImage(file, index, total, callback) {
+    const formData = new FormData();
+    formData.append('file', file);
+
+    // 获取完整车牌号（包含省份和字母）
+    const provincePrefix = document.getElementById('province_prefix').value;
+    const letterPrefix = document.getElementById('letter_prefix').value;
+    const licensePlate = document.getElementById('license_plate').value.trim();
+
+    let fullLicensePlate = '';
+    if (provincePrefix === '特殊') {
+        fullLicensePlate = provincePrefix + licensePlate;
+    } else if (licensePlate) {
+        fullLicensePlate = provincePrefix + letterPrefix + licensePlate;
+    }
+
+    if (fullLicensePlate) {
+        formData.append('license_plate', fullLicensePlate);
+    }
+
+    // 显示压缩进度
+    showMessage(`正在压缩第 ${index + 1} 张图片: ${file.name}`, 'success');
+
+    // 先在浏览器中缩小到存储要求以内；较大的图片使用断点续传，弱网下中断后从已上传的位置继续
+    const upload = downscaleForUpload(file).then(prepared => {
+        formData.set('file', prepared, prepared.name);
+        return prepared.size > RESUMABLE_THRESHOLD
+            ? uploadResumable(prepared, percent => showMessage(`正在上传第 ${index + 1} 张图片: ${percent}%`, 'success'))
+            : fetch('/api/compress-preview', {
+                method: 'POST',
+                body: formData
+            }).then(response => response.json());
+    });
+
+    upload
+    .then(data => data.job_id ? waitForCompressJob(data.status_url) : data)
+    .then(data => {
+        if (data.success) {
+            // 保存压缩后的图片信息
+            compressedImages.push({
+                path: data.compressed_path,
+                filename: data.filename,
+                original_size: data.original_size,
+                compressed_size: data.compressed_size,
+                compression_ratio: data.compression_ratio
+            });
+
+            // 显示压缩完成信息
+            let compressionMessage = `✅ 第 ${index + 1} 张图片压缩完成！\n`;
+            compressionMessage += `📁 文件名: ${data.filename}\n`;
+            compressionMessage += `📊 ${data.original_size} → ${data.compressed_size} (${data.compression_ratio})`;
+
+            showMessage(compressionMessage, 'success');
+
+            // 如果是单张图片，显示预览
+            if (!callback) {
+                showCompressedPreview(data);
+            }
+
+            // 如果是单张图片，处理完成后重新启用控件
+            if (!callback) {
+                isUploading = false;
+                disableUploadControls(false);
+            }
+
+            // 调用回调函数处理下一张图片
+            if (callback) {
+                callback();
+            }
+        } else {
+            showMessage(`❌ 第 ${index + 1} 张图片压缩失败: ${data.message}`, 'error');
+            // 压缩失败时也要重新启用控件
+            if (!callback) {
+                isUploading = false;
+                disableUploadControls(false);
+            }
+        }
+    })
+    .catch(error => {
+        showMessage(`❌ 第 ${index + 1} 张图片压缩失败: ${error.message}`, 'error');
+        // 压缩失败时也要重新启用控件
+        if (!callback) {
+            isUploading = false;
+            disableUploadControls(false);
+        }
+    });
+}
+
+// 压缩在后台进程中执行，轮询任务状态直到完成或失败
+const JOB_POLL_INTERVAL = 500;
+const JOB_POLL_TIMEOUT = 120000;
+
+function waitForCompressJob(statusUrl) {
+    const startTime = Date.now();
+
+    return new Promise((resolve, reject) => {
+        function poll() {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.success || data.status === 'done') {
+                        resolve(data);
+                    } else if (Date.now() - startTime > JOB_POLL_TIMEOUT) {
+                        reject(new Error('处理超时，请重试'));
+                    } else {
+                        setTimeout(poll, JOB_POLL_INTERVAL);
+                    }
+                })
+                .catch(reject);
+        }
+        setTimeout(poll, JOB_POLL_INTERVAL);
+    });
+}
+
+// 浏览器端缩小：按服务端存储要求在Worker中缩小编码，不支持Worker/OffscreenCanvas时上传原图由服务端压缩
+const DOWNSCALE_WORKER_URL = document.currentScript ? document.currentScript.dataset.downscaleWorker : null;
+const DOWNSCALE_TIMEOUT = 30000;
+
+let storageProfile = null;
+let storageProfilePromise = null;
+let downscaleWorker = null;
+let downscaleRequestId = 0;
+const downscaleRequests = new Map();
+
+function loadStorageProfile() {
+    if (!storageProfilePromise) {
+        storageProfilePromise = fetch('/api/storage-profile')
+            .then(response => response.json())
+            .then(data => {
+                storageProfile = data.success ? data : null;
+                return storageProfile;
+            })
+            .catch(error => {
+                console.warn('获取存储要求失败，上传原图:', error);
+                storageProfilePromise = null;
+                return null;
+            });
+    }
+    return storageProfilePromise;
+}
+
+function getDownscaleWorker() {
+    if (!downscaleWorker) {
+        downscaleWorker = new Worker(DOWNSCALE_WORKER_URL);
+        downscaleWorker.onmessage = function(event) {
+            const request = downscaleRequests.get(event.data.id);
+            if (request) {
+                downscaleRequests.delete(event.data.id);
+                request(event.data);
+            }
+        };
+    }
+    return downscaleWorker;
+}
+
+function downscaleForUpload(file) {
+    if (!DOWNSCALE_WORKER_URL || typeof Worker === 'undefined' || typeof OffscreenCanvas === 'undefined') {
+        return Promise.resolve(file);
+    }
+
+    return loadStorageProfile().then(profile => {
+        if (!profile) {
+            return file;
+        }
+        return new Promise(resolve => {
+            const id = ++downscaleRequestId;
+            const timer = setTimeout(() => {
+                downscaleRequests.delete(id);
+                resolve({ error: '缩小超时' });
+            }, DOWNSCALE_TIMEOUT);
+            downscaleRequests.set(id, result => {
+                clearTimeout(timer);
+                resolve(result);
+            });
+            getDownscaleWorker().postMessage({ id, file, profile });
+        }).then(result => {
+            if (result.error) {
+                console.warn('浏览器缩小图片失败，上传原图:', result.error);
+                return file;
+            }
+            // 已符合要求或缩小后反而更大时上传原图
+            if (!result.blob || result.blob.size >= file.size) {
+                return file;
+            }
+            const name = file.name.replace(/\.[^.]*$/, '') + '.jpg';
+            console.log(`浏览器缩小图片: ${file.name} ${file.size} → ${result.blob.size} 字节（${result.width}x${result.height}）`);
+            return new File([result.blob], name, { type: profile.format, lastModified: file.lastModified });
+        });
+    });
+}
+
+// 断点续传：超过该大小的图片分段上传，失败的分段查询服务端位置后重试
+const RESUMABLE_THRESHOLD = 2 * 1024 * 1024;
+const RESUMABLE_MAX_RETRIES = 5;
+const RESUMABLE_RETRY_DELAY = 2000;
+// 压缩队列已满（503）时重新提交 complete 的次数
+const COMPLETE_MAX_RETRIES = 10;
+
+function uploadResumable(file, onProgress) {
+    return fetch('/api/uploads', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, length: file.size })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            return data;
+        }
+        return uploadChunks(file, data.upload_url, data.chunk_size, onProgress)
+            .then(() => completeUpload(data.upload_url));
+    });
+}
+
+// 压缩队列已满时服务端保留已上传的数据，按 Retry-After 稍后重新 complete，不必重新上传
+function completeUpload(uploadUrl) {
+    let retries = 0;
+
+    function attempt() {
+        return fetch(`${uploadUrl}/complete`, { method: 'POST' })
+            .then(response => response.json().then(data => {
+                if (response.status === 503 && ++retries <= COMPLETE_MAX_RETRIES) {
+                    const delay = Number(response.headers.get('Retry-After')) * 1000 || RESUMABLE_RETRY_DELAY;
+                    return new Promise(resolve => setTimeout(resolve, delay)).then(attempt);
+                }
+                return data;
+            }));
+    }
+    return attempt();
+}
+
+function uploadChunks(file, uploadUrl, chunkSize, onProgress) {
+    let retries = 0;
+
+    function putChunk(offset) {
+        return fetch(uploadUrl, {
+            method: 'PUT',
+            headers: {
+                'Upload-Offset': String(offset),
+                'Content-Type': 'application/offset+octet-stream'
+            },
+            body: file.slice(offset, offset + chunkSize)
+        })
+        .then(response => response.json().then(data => {
+            // 偏移不一致时按服务端已接收的位置继续
+            if (data.success || (response.status === 409 && data.offset !== undefined)) {
+                return data.offset;
+            }
+            const error = new Error(data.message);
+            error.fatal = response.status !== 409 && response.status < 500;
+            throw error;
+        }));
+    }
+
+    function next(offset) {
+        onProgress(Math.floor(offset * 100 / file.size));
+        if (offset >= file.size) {
+            return Promise.resolve();
+        }
+        return putChunk(offset).then(nextOffset => {
+            retries = 0;
+            return next(nextOffset);
+        }, resume);
+    }
+
+    // 网络中断：稍后查询服务端已接收的字节数，从该位置继续
+    function resume(error) {
+        if (error.fatal || ++retries > RESUMABLE_MAX_RETRIES) {
+            return Promise.reject(error);
+        }
+        return new Promise(resolve => setTimeout(resolve, RESUMABLE_RETRY_DELAY))
+            .then(() => fetch(uploadUrl, { method: 'HEAD', cache: 'no-store' }))
+            .then(response => {
+                if (!response.ok) {
+                    const expired = new Error('上传已失效，请重新选择图片');
+                    expired.fatal = true;
+                    throw expired;
+                }
+                return Number(response.headers.get('Upload-Offset'));
+            })
+            .then(next, resume);
+    }
+
+    return next(0);
+}
+
+// 禁用/启用上传控件
+function disableUploadControls(disable) {
+    // 获取所有可能的DOM元素
+    const photoInput = document.getElementById('photoInput');
+    const cameraBtn = document.querySelector('.camera-btn');
+    const uploadBtn = document.getElementById('uploadButton');
+    const pasteBtn = document.querySelector('.paste-btn');
+    const dropZone = document.getElementById('dropZone');
+    const submitBtn = document.querySelector('button[type="submit"]');
+
+    // 禁用/启用文件输入
+    if (photoInput) {
+        photoInput.disabled = disable;
+    }
+
+    // 禁用/启用按钮
+    if (cameraBtn) {
+        cameraBtn.disabled = disable;
+        cameraBtn.style.opacity = disable ? '0.6' : '1';
+        cameraBtn.style.cursor = disable ? 'not-allowed' : 'pointer';
+    }
+
+    if (uploadBtn) {
+        uploadBtn.disabled = disable;
+        uploadBtn.style.opacity = disable ? '0.6' : '1';
+        uploadBtn.style.cursor = disable ? 'not-allowed' : 'pointer';
+    }
+
+    if (pasteBtn) {
+        pasteBtn.disabled = disable;
+        pasteBtn.style.opacity = disable ? '0.6' : '1';
+        pasteBtn.style.cursor = disable ? 'not-allowed' : 'pointer';
+    }
+
+    // 禁用/启用拖拽区域
+    if (dropZone) {
+        dropZone.style.opacity = disable ? '0.6' : '1';
+        dropZone.style.pointerEvents = disable ? 'none' : 'auto';
+        if (disable) {
+            dropZone.classList.remove('drag-over');
+        }
+    }
+
+    // 禁用/启用提交按钮
+    if (submitBtn) {
+        // 只有在启用时才移除提交状态类，禁用时添加提交状态类
+        if (disable) {
+            submitBtn.disabled = true;
+            submitBtn.classList.add('submitting');
+        } else {
+            submitBtn.disabled = false;
+            submitBtn.classList.remove('submitting');
+        }
+        submitBtn.style.opacity = disable ? '0.6' : '1';
+        submitBtn.style.cursor = disable ? 'not-allowed' : 'pointer';
+    }
+
+    // 更新拖拽区域文本
+    if (dropZone) {
+        const dropText = dropZone.querySelector('.drop-text');
+        const dropSubtext = dropZone.querySelector('.drop-subtext');
+
+        if (disable) {
+            if (dropText) dropText.textContent = '正在处理图片...';
+            if (dropSubtext) dropSubtext.textContent = '请等待处理完成';
+        } else {
+            if (dropText) dropText.textContent = '拖拽图片到这里上传';
+            if (dropSubtext) dropSubtext.textContent = '或者点击下方按钮选择文件';
+        }
+    }
+}
+
+function showCompressedPreview(data) {
+    // 创建或更新预览区域
+    let previewDiv = document.getElementById('compressedPreview');
+    if (!previewDiv) {
+        previewDiv = document.createElement('div');
+        previewDiv.id = 'compressedPreview';
+        previewDiv.className = 'compressed-preview';
+
+        // 插入到上传按钮后面
+        const uploadBtn = document.querySelector('.camera-btn');
+        uploadBtn.parentNode.insertBefore(previewDiv, uploadBtn.nextSibling);
+    }
+
+    // 计算更详细的数据
+    const originalMB = parseFloat(data.original_size);
+    const compressedKB = parseFloat(data.compressed_size);
+    const compressedMB = (compressedKB / 1024).toFixed(2);
+    const savedMB = (originalMB - compressedKB/1024).toFixed(2);
+    const savedRatio = parseFloat(data.compression_ratio);
+
+    // 根据压缩率设置颜色
+    let ratioColor = '#28a745'; // 绿色
+    if (savedRatio >= 90) {
+        ratioColor = '#dc3545'; // 红色表示极高压缩
+    } else if (savedRatio >= 70) {
+        ratioColor = '#fd7e14'; // 橙色表示高压缩
+    }
+
+    previewDiv.innerHTML = `
+        <div class="preview-header">
+            <h4>🖼️ 压缩预览</h4>
+            <button class="remove-preview" onclick="removeCompressedPreview()">✕</button>
+        </div>
+        <div class="preview-content">
+            <img src="${data.compressed_url}" alt="压缩预览" class="preview-image">
+            <div class="preview-info">
+                <div class="preview-stats">
+                    <div class="stat-item">
+                        <span class="stat-label">原始大小</span>
+                        <span class="stat-value original">${data.original_size}</span>
+                    </div>
+                    <div class="stat-arrow">→</div>
+                    <div class="stat-item">
+                        <span class="stat-label">压缩后</span>
+                        <span class="stat-value compressed">${data.compressed_size}</span>
+                    </div>
+                </div>
+                <div class="compression-summary">
+                    <span class="saved-space">节省 ${savedMB}MB</span>
+                    <span class="compression-ratio" style="color: ${ratioColor}; font-weight: bold;">(${data.compression_ratio})</span>
+                </div>
+                ${savedRatio >= 90 ? '<div class="compression-badge">🔥 极限压缩</div>' : 
+                  savedRatio >= 70 ? '<div class="compression-badge">⚡ 高效压缩</div>' : 
+                  '<div class="compression-badge">✅ 标准压缩</div>'}
+                <div class="filename-info" style="margin-top: 8px; padding: 6px 10px; background: #f8f9fa; border-radius: 4px; font-size: 12px; color: #6c757d;">
+                    📁 文件名: ${data.filename || '未知'}
+                </div>
+            </div>
+        </div>
+    `;
+
+    // 存储压缩后的文件路径供表单提交使用
+    window.compressedFilePath = data.compressed_path;
+}
+
+function removeCompressedPreview() {
+    const previewDiv = document.getElementById('compressedPreview');
+    if (previewDiv) {
+        previewDiv.remove();
+    }
+    window.compressedFilePath = null;
+    compressedImages = []; // 清空压缩图片数组
+
+    // 清空文件输入
+    const photoInput = document.getElementById('photoInput');
+    photoInput.value = '';
+}
+
+function showMultiImagePreview() {
+    // 创建或更新多图片预览区域
+    let previewDiv = document.getElementById('multiImagePreview');
+    if (!previewDiv) {
+        previewDiv = document.createElement('div');
+        previewDiv.id = 'multiImagePreview';
+        previewDiv.className = 'multi-image-preview';
+
+        // 插入到上传按钮后面
+        const uploadBtn = document.querySelector('.camera-btn');
+        uploadBtn.parentNode.insertBefore(previewDiv, uploadBtn.nextSibling);
+    }
+
+    // 计算汇总统计
+    let totalOriginalSize = 0;
+    let totalCompressedSize = 0;
+
+    compressedImages.forEach(img => {
+        const originalMB = parseFloat(img.original_size);
+        const compressedKB = parseFloat(img.compressed_size);
+        totalOriginalSize += originalMB;
+        totalCompressedSize += compressedKB / 1024;
+    });
+
+    const totalSaved = totalOriginalSize - totalCompressedSize;
+    const totalCompressionRatio = (1 - totalCompressedSize / totalOriginalSize) * 100;
+
+    // 生成预览HTML
+    let imagesHtml = compressedImages.map((img, index) => `
+        <div class="image-item">
+            <img src="/${img.path}" alt="图片${index + 1}" class="preview-image">
+            <div class="image-info">
+                <div class="filename">📁 ${img.filename}</div>
+                <div class="size-info">${img.original_size} → ${img.compressed_size}</div>
+            </div>
+        </div>
+    `).join('');
+
+    previewDiv.innerHTML = `
+        <div class="preview-header">
+            <h4>🖼️ 多图预览 (${compressedImages.length} 张)</h4>
+            <button class="remove-preview" onclick="removeMultiImagePreview()">✕</button>
+        </div>
+        <div class="preview-stats">
+            <div class="stat-summary">
+                <span class="total-original">原始总计: ${totalOriginalSize.toFixed(2)}MB</span>
+                <span class="arrow">→</span>
+                <span class="total-compressed">压缩总计: ${totalCompressedSize.toFixed(1)}MB</span>
+                <span class="total-saved">节省: ${totalSaved.toFixed(2)}MB</span>
+                <span class="total-ratio">(${totalCompressionRatio.toFixed(1)}%)</span>
+            </div>
+        </div>
+        <div class="images-grid">
+            ${imagesHtml}
+        </div>
+    `;
+}
+
+function removeMultiImagePreview() {
+    const previewDiv = document.getElementById('multiImagePreview');
+    if (previewDiv) {
+        previewDiv.remove();
+    }
+    compressedImages = []; // 清空压缩图片数组
+    window.compressedFilePath = null; // 也清空单张图片路径
+}
+
+function updateLicensePlateValidation() {
+    const provinceSelect = document.getElementById('province_prefix');
+    const letterSelect = document.getElementById('letter_prefix');
+    const licenseInput = document.getElementById('license_plate');
+    const helpDiv = document.getElementById('plateHelp');
+    const isSpecial = provinceSelect.value === '特殊';
+
+    if (isSpecial) {
+        // 特殊车牌模式：隐藏第二格，第一格显示"特殊"，第三格允许中文输入
+        letterSelect.style.display = 'none';
+        // 只转换大写，不强制替换内容
+        if (licenseInput.value !== licenseInput.value.toUpperCase()) {
+            licenseInput.value = licenseInput.value.toUpperCase();
+        }
+        licenseInput.placeholder = '如：使123456';
+        licenseInput.maxLength = 10;
+        helpDiv.textContent = '请输入特殊车牌号码（如：使123456）';
+        helpDiv.style.color = '#666';
+    } else {
+        // 普通车牌模式：显示所有三格
+        letterSelect.style.display = 'block';
+
+        // 第三格只允许数字和字母，5-6位
+        const currentValue = licenseInput.value;
+        const cleanValue = currentValue.toUpperCase().replace(/[^A-Z0-9]/g, '');
+        let finalValue = cleanValue;
+        if (cleanValue.length > 6) {
+            finalValue = cleanValue.substring(0, 6);
+        }
+
+        // 只有当值实际改变时才更新，避免重复输入
+        if (currentValue !== finalValue) {
+            licenseInput.value = finalValue;
+        }
+        licenseInput.maxLength = 6;
+
+        // 根据当前输入给出提示
+        if (finalValue.length === 0) {
+            helpDiv.textContent = '请输入5-6位数字或字母大写（如：12345或A1B2C3）';
+            helpDiv.style.color = '#666';
+        } else if (finalValue.length < 5) {
+            helpDiv.textContent = `已输入${finalValue.length}位，还需${5-finalValue.length}位（最少5位）`;
+            helpDiv.style.color = '#ff6b6b';
+        } else if (finalValue.length >= 5 && finalValue.length <= 6) {
+            helpDiv.textContent = '✓ 车牌号码格式正确';
+            helpDiv.style.color = '#28a745';
+        }
+    }
+}
+
+function validateKeyPress(event) {
+    const provinceSelect = document.getElementById('province_prefix');
+    const licenseInput = document.getElementById('license_plate');
+    const isSpecial = provinceSelect.value === '特殊';
+
+    if (isSpecial) {
+        // 特殊车牌允许所有字符
+        return true;
+    } else {
+        // 普通车牌只允许数字和字母，且不超过6位
+        const currentValue = licenseInput.value;
+        if (currentValue.length >= 6) {
+            return false; // 防止超过6位
+        }
+        return event.charCode >= 48 && event.charCode <= 57 || 
+               event.charCode >= 65 && event.charCode <= 90 || 
+               event.charCode >= 97 && event.charCode <= 122;
+    }
+}
+
+// 页面加载完成后执行初始化
+document.addEventListener('DOMContentLoaded', function() {
+    // 初始化车牌号码输入验证
+    updateLicensePlateValidation();
+
+    // 绑定拖拽事件
+    bindDragEvents();
+
+    // 预先获取存储要求，拍照时直接按最大尺寸截取
+    loadStorageProfile();
+});
+
+// 绑定拖拽事件
+function bindDragEvents() {
+    const dropZone = document.getElementById('dropZone');
+    if (!dropZone) return;
+}
@@ -0,0 +1,711 @@
+// 服务端渲染页面时内嵌的初始数据（车牌、记录数、违停记录）
+const pageState = JSON.parse(document.getElementById('page-state').textContent);
+
+function formatTime(dateString) {
+    if (!dateString) return '未知时间';
+
+    // 尝试解析日期字符串
+    const date = new Date(dateString);
+    if (isNaN(date.getTime())) {
+        console.warn('无效的日期格式:', dateString);
+        return '未知时间';
+    }
+
+    const now = new Date();
+    const diffTime = Math.abs(now - date);
+    const diffDays = Math.floor(diffTime / (1000 * 60 * 60 * 24));
+
+    if (diffDays === 0) {
+        return `今天${date.getHours().toString().padStart(2, '0')}点${date.getMinutes().toString().padStart(2, '0')}分`;
+    } else if (diffDays === 1) {
+        return `昨天${date.getHours().toString().padStart(2, '0')}点${date.getMinutes().toString().padStart(2, '0')}分`;
+    } else {
+        const year = date.getFullYear();
+        const month = (date.getMonth() + 1).toString().padStart(2, '0');
+        const day = date.getDate().toString().padStart(2, '0');
+        const hour = date.getHours().toString().padStart(2, '0');
+        const minute = date.getMinutes().toString().padStart(2, '0');
+        return `${year}.${month}.${day}号${hour}点${minute}分`;
+    }
+}
+
+function formatLocationTime(location, violationTime) {
+    const formattedTime = formatTime(violationTime);
+    return `📍 ${location}${formattedTime}`;
+}
+
+function formatDate(dateString) {
+    if (!dateString) return '未知';
+
+    const date = new Date(dateString);
+    const now = new Date();
+    const diffTime = Math.abs(now - date);
+    const diffDays = Math.floor(diffTime / (1000 * 60 * 60 * 24));
+
+    if (diffDays === 0) {
+        return '今天';
+    } else if (diffDays === 1) {
+        return '昨天';
+    } else if (diffDays < 7) {
+        return `${diffDays}天前`;
+    } else if (diffDays < 30) {
+        return `${Math.floor(diffDays / 7)}周前`;
+    } else if (diffDays < 365) {
+        return `${Math.floor(diffDays / 30)}月前`;
+    } else {
+        return `${Math.floor(diffDays / 365)}年前`;
+    }
+}
+
+function openModal(imageSrc) {
+    const modal = document.getElementById('photoModal');
+    const modalImg = document.getElementById('modalImage');
+
+    modal.style.display = 'flex';
+    modalImg.src = imageSrc;
+}
+
+function closeModal() {
+    document.getElementById('photoModal').style.display = 'none';
+}
+
+// 页面加载完成后格式化时间和加载照片
+document.addEventListener('DOMContentLoaded', function() {
+    // 格式化时间戳
+    const timestampElements = document.querySelectorAll('.timestamp');
+    timestampElements.forEach(element => {
+        if (element.textContent && element.textContent.includes('-')) {
+            // 检查是否是记录时间元素（包含"记录时间:"前缀）
+            if (element.textContent.startsWith('记录时间:')) {
+                const timeStr = element.textContent.replace('记录时间:', '').trim();
+                element.textContent = '记录时间: ' + formatTime(timeStr);
+            } else {
+                element.textContent = formatTime(element.textContent);
+            }
+        }
+    });
+
+    // 格式化日期
+    const dateElements = document.querySelectorAll('.stat-number[data-date]');
+    dateElements.forEach(element => {
+        const dateString = element.getAttribute('data-date');
+        if (dateString) {
+            element.textContent = formatDate(dateString);
+        }
+    });
+
+    // 加载照片
+    loadPhotos();
+});
+
+function createPhotoElement(path, alt, multiple, url) {
+    const img = document.createElement('img');
+    // 服务端给出的地址带内容版本，可长期缓存；没有时使用普通地址
+    img.src = url || '/' + path;
+    img.alt = alt;
+    img.className = 'photo';
+    if (multiple) {
+        img.style.marginBottom = '10px';
+    }
+    img.onerror = function() { 
+        this.style.display = 'none';
+        const errorMsg = document.createElement('div');
+        errorMsg.className = 'no-photo';
+        errorMsg.textContent = '📷 图片加载失败';
+        if (multiple) {
+            errorMsg.style.marginBottom = '10px';
+        }
+        this.parentNode.insertBefore(errorMsg, this);
+    };
+    img.onclick = function() { openModal(this.src); };
+    return img;
+}
+
+function renderViolationPhotos(violation) {
+    const container = document.getElementById(`photo-container-${violation.id}`);
+    if (!container) return;
+
+    // 先清空容器，避免重复显示
+    container.innerHTML = '';
+
+    if (!violation.photo_path) {
+        // 没有图片
+        container.innerHTML = '<div class="no-photo">📷 无照片</div>';
+        return;
+    }
+
+    const photoUrls = violation.photo_urls || {};
+    try {
+        // 尝试解析JSON
+        const photoPaths = JSON.parse(violation.photo_path);
+        if (Array.isArray(photoPaths)) {
+            // 多张照片
+            photoPaths.forEach((path, pathIndex) => {
+                container.appendChild(createPhotoElement(path, `违停照片${pathIndex + 1}`, true, photoUrls[path]));
+            });
+        } else {
+            // 单张照片
+            container.appendChild(createPhotoElement(violation.photo_path, '违停照片', false, photoUrls[violation.photo_path]));
+        }
+    } catch (e) {
+        // 不是JSON格式，直接显示单张照片
+        container.appendChild(createPhotoElement(violation.photo_path, '违停照片', false, photoUrls[violation.photo_path]));
+    }
+}
+
+function loadSingleViolationPhotos(recordId) {
+    // 记录被修改后，重新获取最新数据并只刷新指定记录的照片
+    const licensePlate = encodeURIComponent(pageState.license_plate);
+    fetch(`/api/violations?license_plate=${licensePlate}`)
+        .then(response => response.json())
+        .then(data => {
+            pageState.violations = data;
+            const violation = data.find(v => v.id == recordId);
+            if (violation) {
+                renderViolationPhotos(violation);
+            }
+        })
+        .catch(error => {
+            console.error('重新加载照片失败:', error);
+        });
+}
+
+function loadPhotos() {
+    // 使用页面内嵌的初始数据渲染照片，不再重复请求API
+    pageState.violations.forEach(renderViolationPhotos);
+}
+
+// 删除单条记录
+function deleteViolation(recordId) {
+    if (!confirm('确定要删除这条违停记录吗？此操作不可撤销。')) {
+        return;
+    }
+
+    fetch(`/api/violation/${recordId}`, {
+        method: 'DELETE'
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            // 显示成功消息
+            showMessage('删除成功', 'success');
+            // 动态移除被删除的元素而不是刷新整个页面
+            const violationElement = document.getElementById(`violation-${recordId}`);
+            if (violationElement) {
+                violationElement.style.transition = 'opacity 0.3s';
+                violationElement.style.opacity = '0';
+                setTimeout(() => {
+                    violationElement.remove();
+                    // 更新统计信息
+                    updateStatistics();
+                }, 300);
+            }
+        } else {
+            showMessage(data.message || '删除失败', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('删除失败:', error);
+        showMessage('删除失败，请稍后重试', 'error');
+    });
+}
+
+// 更新统计信息
+function updateStatistics() {
+    // 获取剩余违规条目数
+    const violationItems = document.querySelectorAll('.violation-item');
+    const count = violationItems.length;
+
+    // 更新总数显示
+    const totalCountElement = document.querySelector('.stat-number');
+    if (totalCountElement) {
+        totalCountElement.textContent = count;
+    }
+
+    // 更新车辆风险等级显示
+    const riskIndicator = document.querySelector('div[style*="border-radius: 20px"]');
+    if (riskIndicator) {
+        if (count >= 5) {
+            riskIndicator.innerHTML = '⚠️ 高频违规车辆';
+            riskIndicator.style.background = '#ffebee';
+            riskIndicator.style.color = '#c62828';
+        } else if (count >= 3) {
+            riskIndicator.innerHTML = '⚡ 中频违规车辆';
+            riskIndicator.style.background = '#fff3e0';
+            riskIndicator.style.color = '#ef6c00';
+        } else {
+            riskIndicator.innerHTML = '✅ 低频违规车辆';
+            riskIndicator.style.background = '#e8f5e8';
+            riskIndicator.style.color = '#2e7d32';
+        }
+    }
+}
+
+// 删除车牌的所有记录
+function deleteAllViolations(licensePlate) {
+    const count = pageState.total_count;
+    if (!confirm(`确定要删除车牌 ${licensePlate} 的所有 ${count} 条违停记录吗？\n此操作不可撤销！`)) {
+        return;
+    }
+
+    if (!confirm('【重要提醒】删除后该车牌的所有记录将永久消失！\n\n请点击"确定"确认删除，或点击"取消"中止操作。')) {
+        return;
+    }
+
+    const encodedPlate = encodeURIComponent(licensePlate);
+
+    fetch(`/api/vehicle/${encodedPlate}`, {
+        method: 'DELETE'
+        })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showMessage(data.message || `成功删除车牌 ${licensePlate} 的所有记录`, 'success');
+            // 2秒后跳转到主页
+            setTimeout(() => {
+                window.location.href = '/';
+            }, 2000);
+        } else {
+            showMessage(data.message || '删除失败', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('删除失败:', error);
+        showMessage('删除失败，请稍后重试', 'error');
+    });
+}
+
+// 显示消息提示
+function showMessage(message, type) {
+    // 创建消息元素
+    const messageDiv = document.createElement('div');
+    messageDiv.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        padding: 15px 20px;
+        border-radius: 8px;
+        color: white;
+        font-weight: 600;
+        z-index: 10000;
+        max-width: 300px;
+        box-shadow: 0 4px 15px rgba(0,0,0,0.2);
+        animation: slideIn 0.3s ease;
+    `;
+
+    if (type === 'success') {
+        messageDiv.style.background = 'linear-gradient(135deg, #4facfe 0%, #00f2fe 100%)';
+    } else if (type === 'info') {
+        messageDiv.style.background = 'linear-gradient(135deg, #667eea 0%, #764ba2 100%)';
+    } else {
+        messageDiv.style.background = 'linear-gradient(135deg, #ff6b6b 0%, #ee5a24 100%)';
+    }
+
+    messageDiv.textContent = message;
+    document.body.appendChild(messageDiv);
+
+    // 3秒后自动移除
+    setTimeout(() => {
+        messageDiv.style.animation = 'slideOut 0.3s ease';
+        setTimeout(() => {
+            if (messageDiv.parentNode) {
+                messageDiv.parentNode.removeChild(messageDiv);
+            }
+        }, 300);
+    }, 3000);
+}
+
+// 图片操作相关函数
+function previewNewImage(recordId) {
+    const fileInput = document.getElementById(`new-image-${recordId}`);
+    const previewDiv = document.getElementById(`new-image-preview-${recordId}`);
+
+    if (fileInput.files && fileInput.files[0]) {
+        const reader = new FileReader();
+        reader.onload = function(e) {
+            previewDiv.innerHTML = `
+                <img src="${e.target.result}" style="max-width: 100px; max-height: 100px; border-radius: 4px; margin-bottom: 5px;">
+                <div style="font-size: 12px; color: #666;">新图片预览</div>
+            `;
+        };
+        reader.readAsDataURL(fileInput.files[0]);
+    }
+}
+
+function loadExistingImages(recordId) {
+    const container = document.getElementById(`existing-images-${recordId}`);
+
+    // 先从页面中获取现有的图片信息
+    const violationElement = document.getElementById(`violation-${recordId}`);
+    const photoContainer = violationElement.querySelector('.photo-container');
+    const images = photoContainer.querySelectorAll('img');
+
+    if (images.length > 0) {
+        let html = '';
+        images.forEach((img, index) => {
+            const imgSrc = img.src;
+            // 更好地提取文件名，处理URL编码的情况
+            let imgName = imgSrc.split('/').pop() || `图片${index + 1}`;
+            // 如果是完整的URL，去掉查询参数
+            imgName = imgName.split('?')[0];
+            // 如果文件名太长，截取前30个字符
+            if (imgName.length > 30) {
+                imgName = imgName.substring(0, 27) + '...';
+            }
+            html += `
+                <div class="image-item">
+                    <div class="image-info">
+                        <img src="${imgSrc}" class="image-preview" alt="图片${index + 1}" onerror="this.style.display='none'; this.nextElementSibling.style.display='block';">
+                        <div style="display:none;" class="no-photo">📷 图片加载失败</div>
+                        <span class="image-name" title="${imgName}">${imgName}</span>
+                    </div>
+                    <div class="image-actions">
+                        <button class="rename-btn" onclick="renameImage(${recordId}, '${imgSrc}', ${index})">重命名</button>
+                        <button class="delete-image-btn" onclick="deleteImage(${recordId}, '${imgSrc}')">删除</button>
+                    </div>
+                </div>
+            `;
+        });
+        container.innerHTML = html;
+    } else {
+        container.innerHTML = '<div style="font-size: 12px; color: #999; text-align: center; padding: 10px;">暂无图片</div>';
+    }
+}
+
+function renameImage(recordId, imagePath, imageIndex) {
+    const newName = prompt('请输入新的图片名称（不含扩展名）：');
+    if (newName && newName.trim()) {
+        // 安全检查：确保新名称不包含危险字符
+        if (newName.includes('/') || newName.includes('\\') || newName.includes('..')) {
+            showMessage('文件名不能包含 / \\ .. 等字符', 'error');
+            return;
+        }
+
+        // 将完整URL转换为相对路径
+        let relativePath = imagePath;
+        let baseUrl = '';
+        if (imagePath.startsWith('http://') || imagePath.startsWith('https://')) {
+            try {
+                const url = new URL(imagePath);
+                relativePath = url.pathname;
+                baseUrl = url.origin;
+            } catch (e) {
+                console.error('URL解析失败:', e);
+                showMessage('图片路径解析失败', 'error');
+                return;
+            }
+        }
+
+        // 移除开头的斜杠
+        if (relativePath.startsWith('/')) {
+            relativePath = relativePath.substring(1);
+        }
+
+        // 获取文件扩展名
+        const originalName = relativePath.split('/').pop();
+        const fileExt = originalName.split('.').pop();
+
+        // 构建新的文件名
+        const newFileName = newName.trim() + '.' + fileExt;
+        const newPath = relativePath.replace(originalName, newFileName);
+
+        showMessage('正在重命名图片...', 'info');
+
+        // 发送重命名请求到后端
+        const formData = new FormData();
+        formData.append('record_id', recordId);
+        formData.append('old_path', relativePath);
+        formData.append('new_path', newPath);
+
+        fetch('/api/rename_image', {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                // 更新显示
+                const imageItems = document.querySelectorAll(`#existing-images-${recordId} .image-item`);
+                if (imageItems[imageIndex]) {
+                    const nameElement = imageItems[imageIndex].querySelector('.image-name');
+                    const imgElement = imageItems[imageIndex].querySelector('.image-preview');
+
+                    if (nameElement) {
+                        nameElement.textContent = newFileName;
+                        nameElement.title = newFileName;
+                    }
+
+                    // 更新图片src
+                    if (imgElement) {
+                        const newUrl = baseUrl ? `${baseUrl}/${newPath}` : `/${newPath}`;
+                        imgElement.src = newUrl;
+                    }
+
+                    // 更新删除按钮的onclick属性
+                    const deleteBtn = imageItems[imageIndex].querySelector('.delete-image-btn');
+                    if (deleteBtn) {
+                        deleteBtn.setAttribute('onclick', `deleteImage(${recordId}, '${newUrl}')`);
+                    }
+
+                    // 更新重命名按钮的onclick属性
+                    const renameBtn = imageItems[imageIndex].querySelector('.rename-btn');
+                    if (renameBtn) {
+                        renameBtn.setAttribute('onclick', `renameImage(${recordId}, '${newUrl}', ${imageIndex})`);
+                    }
+                }
+
+                showMessage('图片重命名成功', 'success');
+
+                // 重新加载该记录的照片显示以确保同步
+                setTimeout(() => {
+                    loadSingleViolationPhotos(recordId);
+                }, 500);
+
+                // 如果有警告信息，则显示
+                if (data.warning) {
+                    showMessage(data.message, 'info');
+                }
+            } else {
+                showMessage('重命名失败: ' + data.message, 'error');
+            }
+        })
+        .catch(error => {
+            console.error('重命名图片失败:', error);
+            showMessage('重命名图片失败，请稍后重试', 'error');
+        });
+    }
+}
+
+function deleteImage(recordId, imagePath) {
+    if (confirm('确定要删除这张图片吗？此操作不可撤销。')) {
+        showMessage('正在删除图片...', 'info');
+
+        // 将完整URL转换为相对路径
+        let relativePath = imagePath;
+        if (imagePath.startsWith('http://') || imagePath.startsWith('https://')) {
+            try {
+                // 使用URL对象更安全地提取路径部分
+                const url = new URL(imagePath);
+                relativePath = url.pathname;
+            } catch (e) {
+                console.error('URL解析失败:', e);
+                showMessage('图片路径解析失败', 'error');
+                return;
+            }
+        }
+
+        // 去掉开头的斜杠
+        if (relativePath.startsWith('/')) {
+            relativePath = relativePath.substring(1);
+        }
+
+        // 构建FormData发送删除请求
+        const formData = new FormData();
+        formData.append('record_id', recordId);
+        formData.append('image_path', relativePath);
+
+        fetch('/api/delete_image', {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                // 从显示中移除图片
+                const imageItems = document.querySelectorAll(`#existing-images-${recordId} .image-item`);
+                imageItems.forEach(item => {
+                    const img = item.querySelector('.image-preview');
+                    if (img && (img.src === imagePath || img.src.endsWith(relativePath))) {
+                        item.remove();
+                        showMessage('图片删除成功', 'success');
+                        // 重新加载该记录的照片显示
+                        setTimeout(() => {
+                            loadSingleViolationPhotos(recordId);
+                        }, 500);
+                        return;
+                    }
+                });
+
+                // 检查是否还有图片
+                const remainingImages = document.querySelectorAll(`#existing-images-${recordId} .image-item`);
+                if (remainingImages.length === 0) {
+                    document.getElementById(`existing-images-${recordId}`).innerHTML = '<div style="font-size: 12px; color: #999; text-align: center; padding: 10px;">暂无图片</div>';
+                }
+
+                // 如果有警告信息，则显示
+                if (data.warning) {
+                    showMessage(data.message, 'info');
+                }
+            } else {
+                showMessage('删除失败: ' + data.message, 'error');
+            }
+        })
+        .catch(error => {
+            console.error('删除图片失败:', error);
+            showMessage('删除图片失败，请稍后重试', 'error');
+        });
+    }
+}
+
+// 编辑模式相关函数
+function enterEditMode(recordId) {
+    // 隐藏显示元素，显示编辑表单
+    document.getElementById(`type-display-${recordId}`).style.display = 'none';
+    document.getElementById(`time-display-${recordId}`).style.display = 'none';
+
+    const descDisplay = document.getElementById(`description-display-${recordId}`);
+    if (descDisplay) {
+        descDisplay.style.display = 'none';
+    }
+
+    // 加载现有图片
+    loadExistingImages(recordId);
+
+    document.getElementById(`edit-form-${recordId}`).style.display = 'block';
+    document.getElementById(`action-buttons-${recordId}`).style.display = 'none';
+    document.getElementById(`edit-buttons-${recordId}`).style.display = 'flex';
+
+    // 滚动到编辑区域
+    document.getElementById(`violation-${recordId}`).scrollIntoView({ behavior: 'smooth', block: 'center' });
+}
+
+function cancelEdit(recordId) {
+    // 恢复显示元素，隐藏编辑表单
+    document.getElementById(`type-display-${recordId}`).style.display = 'inline-block';
+    document.getElementById(`time-display-${recordId}`).style.display = 'block';
+
+    const descDisplay = document.getElementById(`description-display-${recordId}`);
+    if (descDisplay) {
+        descDisplay.style.display = 'block';
+    }
+
+    document.getElementById(`edit-form-${recordId}`).style.display = 'none';
+    document.getElementById(`action-buttons-${recordId}`).style.display = 'flex';
+    document.getElementById(`edit-buttons-${recordId}`).style.display = 'none';
+}
+
+function saveViolation(recordId) {
+    // 获取编辑后的值
+    const violationType = document.getElementById(`type-input-${recordId}`).value;
+    const location = document.getElementById(`location-input-${recordId}`).value.trim();
+    const description = document.getElementById(`description-input-${recordId}`).value.trim();
+
+    // 验证必填字段
+    if (!location) {
+        showMessage('请输入违规地点', 'error');
+        document.getElementById(`location-input-${recordId}`).focus();
+        return;
+    }
+
+    // 检查是否有新图片要上传
+    const newImageInput = document.getElementById(`new-image-${recordId}`);
+    const hasNewImage = newImageInput && newImageInput.files && newImageInput.files.length > 0;
+
+    if (hasNewImage) {
+        // 如果有新图片，先上传图片
+        const formData = new FormData();
+        formData.append('image', newImageInput.files[0]);
+        formData.append('record_id', recordId);
+
+        showMessage('正在上传图片...', 'info');
+
+        fetch('/api/upload_image', {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => response.json())
+        .then(uploadData => {
+            if (uploadData.success) {
+                console.log('图片上传成功:', uploadData);
+                // 图片上传成功后，更新文本信息
+                updateViolationData(recordId, violationType, location, description);
+            } else {
+                showMessage('图片上传失败: ' + uploadData.message, 'error');
+            }
+        })
+        .catch(error => {
+            console.error('图片上传失败:', error);
+            showMessage('图片上传失败', 'error');
+        });
+    } else {
+        // 没有新图片，直接更新文本信息
+        updateViolationData(recordId, violationType, location, description);
+    }
+}
+
+function updateViolationData(recordId, violationType, location, description) {
+    // 构建更新数据
+    const updateData = {
+        violation_type: violationType,
+        location: location
+    };
+
+    if (description) {
+        updateData.description = description;
+    }
+
+    // 发送更新请求
+    console.log('正在发送更新请求:', updateData);
+    fetch(`/api/violation/${recordId}`, {
+        method: 'PUT',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(updateData)
+    })
+    .then(response => {
+        console.log('收到响应:', response.status);
+        return response.json();
+    })
+    .then(data => {
+        console.log('响应数据:', data);
+        if (data.success) {
+            // 更新显示内容
+            document.getElementById(`type-display-${recordId}`).textContent = `🚫 ${violationType}`;
+            document.getElementById(`location-time-display-${recordId}`).textContent = `📍 ${location}`;
+
+            const descDisplay = document.getElementById(`description-display-${recordId}`);
+            if (descDisplay) {
+                if (description) {
+                    descDisplay.textContent = description;
+                    descDisplay.style.display = 'block';
+                } else {
+                    descDisplay.style.display = 'none';
+                }
+            }
+
+            // 重新加载当前记录的照片以显示新上传的图片
+            setTimeout(() => {
+                loadSingleViolationPhotos(recordId);
+            }, 500);
+
+            // 退出编辑模式
+            cancelEdit(recordId);
+
+            // 显示成功消息
+            showMessage('记录更新成功', 'success');
+        } else {
+            showMessage(data.message || '更新失败', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('更新失败:', error);
+        showMessage('更新失败，请稍后重试', 'error');
+    });
+}
+
+// ESC键关闭模态框和退出编辑模式
+document.addEventListener('keydown', function(event) {
+    if (event.key === 'Escape') {
+        closeModal();
+
+        // 检查是否有编辑模式激活，如果有则退出
+        const editForms = document.querySelectorAll('[id^="edit-form-"]');
+        editForms.forEach(form => {
+            if (form.style.display === 'block') {
+                const recordId = form.id.replace('edit-form-', '');
+                cancelEdit(recordId);
+            }
+        });
+    }
+});
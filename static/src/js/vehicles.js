@@ -0,0 +1,186 @@
+// 服务端渲染页面时内嵌的车辆列表，首屏直接使用
+const pageState = JSON.parse(document.getElementById('page-state').textContent);
+let vehicles = pageState.vehicles;
+
+function loadVehicles() {
+    fetch('/api/vehicles')
+        .then(response => response.json())
+        .then(data => {
+            vehicles = data;
+            displayVehicles(vehicles);
+            updateStats();
+        })
+        .catch(error => {
+            console.error('Error:', error);
+        });
+}
+
+function displayVehicles(vehiclesToShow) {
+    const listContainer = document.getElementById('vehicleList');
+
+    if (vehiclesToShow.length === 0) {
+        listContainer.innerHTML = `
+            <div class="empty-state">
+                <div class="empty-state-icon">🚗</div>
+                <p>暂无违规车辆</p>
+            </div>
+        `;
+        return;
+    }
+
+    listContainer.innerHTML = vehiclesToShow.map(vehicle => {
+        const frequencyClass = getFrequencyClass(vehicle.violation_count);
+        const trendText = getTrendText(vehicle.violation_count);
+
+        return `
+            <div class="vehicle-item ${frequencyClass}">
+                <div class="vehicle-header">
+                    <div class="license-plate" onclick="window.location.href='/license_plate/${vehicle.license_plate}'" style="cursor: pointer; flex: 1;">${vehicle.license_plate}</div>
+                    <div class="vehicle-actions">
+                        <div class="violation-count">${vehicle.violation_count}次</div>
+                        <button class="delete-vehicle-btn" onclick="deleteVehicle('${vehicle.license_plate}')" title="删除此车牌的所有记录">
+                            🗑️
+                        </button>
+                    </div>
+                </div>
+                <div class="last-violation">📍 最近违规: ${formatDate(vehicle.last_violation)}</div>
+                <div class="violation-trend">${trendText}</div>
+            </div>
+        `;
+    }).join('');
+}
+
+function getFrequencyClass(count) {
+    if (count >= 5) return 'high-frequency';
+    if (count >= 3) return 'medium-frequency';
+    return 'low-frequency';
+}
+
+function getTrendText(count) {
+    if (count >= 5) return '⚠️ 高频违规车辆';
+    if (count >= 3) return '⚡ 中频违规车辆';
+    return '✅ 低频违规车辆';
+}
+
+function formatDate(dateString) {
+    if (!dateString) return '未知时间';
+
+    const date = new Date(dateString);
+    const now = new Date();
+    const diffTime = Math.abs(now - date);
+    const diffDays = Math.floor(diffTime / (1000 * 60 * 60 * 24));
+
+    if (diffDays === 0) {
+        return `今天 ${date.toLocaleTimeString('zh-CN', {hour: '2-digit', minute: '2-digit'})}`;
+    } else if (diffDays === 1) {
+        return `昨天 ${date.toLocaleTimeString('zh-CN', {hour: '2-digit', minute: '2-digit'})}`;
+    } else if (diffDays < 7) {
+        return `${diffDays}天前`;
+    } else {
+        return date.toLocaleDateString('zh-CN');
+    }
+}
+
+function updateStats() {
+    document.getElementById('totalVehicles').textContent = vehicles.length;
+
+    const totalViolations = vehicles.reduce((sum, vehicle) => sum + vehicle.violation_count, 0);
+    document.getElementById('totalViolations').textContent = totalViolations;
+
+    const today = new Date().toDateString();
+    const todayVehicles = vehicles.filter(v => 
+        v.last_violation && new Date(v.last_violation).toDateString() === today
+    );
+    document.getElementById('todayVehicles').textContent = todayVehicles.length;
+}
+
+document.getElementById('searchInput').addEventListener('input', function(e) {
+    const searchTerm = e.target.value.toLowerCase();
+
+    if (searchTerm === '') {
+        displayVehicles(vehicles);
+        return;
+    }
+
+    const filteredVehicles = vehicles.filter(vehicle => 
+        vehicle.license_plate.toLowerCase().includes(searchTerm)
+    );
+
+    displayVehicles(filteredVehicles);
+});
+
+// 首屏使用内嵌数据渲染，之后定时从API刷新
+displayVehicles(vehicles);
+updateStats();
+setInterval(loadVehicles, 30000);
+
+// 删除车牌的所有记录
+function deleteVehicle(licensePlate) {
+    if (!confirm(`确定要删除车牌 ${licensePlate} 的所有违停记录吗？\n此操作不可撤销！`)) {
+        return;
+    }
+
+    if (!confirm('再次确认：删除后该车牌的所有记录将永久消失！')) {
+        return;
+    }
+
+    const encodedPlate = encodeURIComponent(licensePlate);
+
+    fetch(`/api/vehicle/${encodedPlate}`, {
+        method: 'DELETE'
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            showMessage(`成功删除车牌 ${licensePlate} 的所有记录`, 'success');
+            // 2秒后刷新列表
+            setTimeout(() => {
+                loadVehicles();
+            }, 2000);
+        } else {
+            showMessage(data.message || '删除失败', 'error');
+        }
+    })
+    .catch(error => {
+        console.error('删除失败:', error);
+        showMessage('删除失败，请稍后重试', 'error');
+    });
+}
+
+// 显示消息提示
+function showMessage(message, type) {
+    // 创建消息元素
+    const messageDiv = document.createElement('div');
+    messageDiv.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        padding: 15px 20px;
+        border-radius: 8px;
+        color: white;
+        font-weight: 600;
+        z-index: 10000;
+        max-width: 300px;
+        box-shadow: 0 4px 15px rgba(0,0,0,0.2);
+        animation: slideIn 0.3s ease;
+    `;
+
+    if (type === 'success') {
+        messageDiv.style.background = 'linear-gradient(135deg, #4facfe 0%, #00f2fe 100%)';
+    } else {
+        messageDiv.style.background = 'linear-gradient(135deg, #ff6b6b 0%, #ee5a24 100%)';
+    }
+
+    messageDiv.textContent = message;
+    document.body.appendChild(messageDiv);
+
+    // 3秒后自动移除
+    setTimeout(() => {
+        messageDiv.style.animation = 'slideOut 0.3s ease';
+        setTimeout(() => {
+            if (messageDiv.parentNode) {
+                messageDiv.parentNode.removeChild(messageDiv);
+            }
+        }, 300);
+    }, 3000);
+}